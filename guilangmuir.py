@@ -56,6 +56,44 @@ argparser.add_argument('--elm-shotfile-user', default=None, dest='elmuser', acti
 argparser.add_argument('-c', '--celma', default=False, dest='celma', action='store_true',
                        help=('Produce coherent ELM average right after loading' +
                              'the shot. Relies on --range.'))
+argparser.add_argument('--crawl', default=None, dest='crawl', action='store',
+                       metavar='SHOTS',
+                       help=('Crawl the given shots without showing the GUI, ' +
+                             'e.g. 33000-33100,33120. Fills the cache ' +
+                             'exactly like the GUI crawler.'))
+argparser.add_argument('--processes', default=4, dest='processes', type=int,
+                       action='store',
+                       help='Number of worker processes used by --crawl')
+argparser.add_argument('--checkpoint', default='crawl.ckpt', dest='checkpoint',
+                       action='store',
+                       help=('File recording the status of every crawled ' +
+                             'shot. Crawls using the same file resume ' +
+                             'where they stopped.'))
+argparser.add_argument('--queue', default=None, dest='queue', action='store',
+                       metavar='DIR',
+                       help=('Share the crawl of --crawl among hosts through ' +
+                             'a job queue in directory DIR on a shared ' +
+                             'filesystem. Without --crawl, join the crawl ' +
+                             'of an existing queue.'))
+argparser.add_argument('--chunk-size', default=10, dest='chunksize', type=int,
+                       action='store',
+                       help='Number of shots per job of --queue')
+argparser.add_argument('--mine', default=None, dest='mine', action='store',
+                       metavar='TABLE',
+                       help=('Perform the CELMAs of all phases (Shot, CELMA ' +
+                             'start, CELMA end) of a feature table CSV file ' +
+                             'without showing the GUI and save their raw ' +
+                             'data'))
+argparser.add_argument('--probes', default=None, dest='probes', action='store',
+                       help=('Comma-separated probes to include in the ' +
+                             'CELMAs of --mine. Default: all'))
+argparser.add_argument('--remove-table', default=False, dest='removetable',
+                       action='store_true',
+                       help=('Delete the table of --mine once its phases ' +
+                             'are read'))
+argparser.add_argument('--retry', default='error', dest='retry', action='store',
+                       help=('Comma-separated statuses (error, missing) of ' +
+                             'shots in the checkpoint to crawl again'))
 args = argparser.parse_args()
 loadTable = args.table
 lib = not args.nolib
@@ -75,27 +113,17 @@ import pickle
 import functools
 import subprocess
 import threading
+import multiprocessing
+import tempfile
+import csv
+from multiprocessing.pool import ThreadPool
 import gc
 import datetime
 import logging
 import copy
 
-import matplotlib as mpl
-mpl.use('Qt4Agg')
-from matplotlib import cm
-from matplotlib import pyplot as plt
-from matplotlib import patches
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.backends.backend_qt4agg import NavigationToolbar2QT as NavigationToolbar
-from PyQt4 import QtGui, QtCore, Qt
-from PyQt4.QtGui import (QWidget, QMessageBox, QPainter, QColor)
-from PyQt4.QtCore import pyqtSlot, pyqtSignal
-from PyQt4.QtCore import QObject, QLocale
-from PyQt4.uic import loadUiType
 from configobj import ConfigObj
 from validate import Validator
-from scipy import interpolate
 import numpy as np
 try:
     import coloredlogs
@@ -103,12 +131,10 @@ try:
 except:
     collogs = False
 
-from fitting import FitFunctions
-from slider import SchizoSlider
-from FeaturePicking import FeaturePicker, Plotter
-from windows import FigureWindow
-from conversion import Conversion
-import mpl_interactive
+import crawling
+import mining
+from jobqueue import JobQueue
+from shotdata import ShotLoader, ShotDataError
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -133,6 +159,285 @@ file_hdlr.setFormatter(file_formatter)
 logger.addHandler(stdout_hdlr)
 logger.addHandler(file_hdlr)
 
+
+# Headless crawling and mining. They are run before matplotlib and Qt are
+# imported, so neither they nor their worker processes load them.
+def readConfig(configFile='config/config.ini',
+               validFile='config/validation.ini'):
+    """
+    Configuration of the application validated against validFile, so
+    missing settings take their defaults. Returns None if it is invalid.
+    """
+    if not os.path.isfile(validFile):
+        logger.critical("Configuration specification {} not found"
+                        .format(validFile))
+        return
+    config = ConfigObj(configFile, configspec=validFile)
+    if config.validate(Validator()) is not True:
+        logger.critical("Validation of configuration file {} failed"
+                        .format(configFile))
+        return
+    return config
+
+
+def loaderSettings(config):
+    """
+    Keyword arguments of the ShotLoaders of headless processes, the
+    settings the GUI starts with
+    """
+    experiments = {}
+    if elmuser:
+        experiments['ELM'] = elmuser
+    return {'cacheDir': config['Application']['cacheDir'],
+            'segment': config['Plots']['segment'],
+            'region': config['Plots']['region'],
+            'experiments': experiments,
+            'mapFile': config['Application']['mapFile'],
+            'calibFile': config['Application']['calibFile']}
+
+
+def crawl(shots, processes, checkpointPath, retry, settings):
+    """
+    Crawls shots in a pool of processes, each reading shots with a
+    ShotLoader created from settings, so the cache is filled exactly as by
+    the GUI. Every result is written to the checkpoint right away; shots
+    already recorded there are skipped unless their status is in retry.
+    """
+    checkpoint = crawling.Checkpoint(checkpointPath)
+    pending = checkpoint.pending(shots, retry)
+    logger.info("Crawling {} of {} shots, {} already done according to {}"
+                .format(len(pending), len(shots), len(shots) - len(pending),
+                        checkpointPath))
+    if not pending:
+        return checkpoint
+    progress = crawling.Throughput(len(pending))
+    pool = multiprocessing.Pool(max(processes, 1), crawling.initCrawler,
+                                (settings,))
+    try:
+        for shotnr, status, duration, message in \
+                pool.imap_unordered(crawling.crawlShot, pending):
+            checkpoint.record(shotnr, status, duration, message)
+            progress.update()
+            logger.info("Shot {}: {} {}".format(shotnr, status, message))
+            logger.info(progress.summary())
+    except KeyboardInterrupt:
+        logger.info("Crawling interrupted, resume with the same checkpoint")
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+    counts = checkpoint.counts(shots)
+    logger.info("Crawling result: " +
+                ", ".join("{} {}".format(n, status)
+                          for status, n in sorted(counts.iteritems())))
+    return checkpoint
+
+
+def crawlQueue(shots, processes, queuePath, checkpointPath, chunkSize,
+               settings):
+    """
+    Crawls the shots of a job queue shared by several hosts. The first host
+    fills the queue with shots, the others join it with shots set to None.
+    When the queue is done, the merged results of all hosts are added to
+    the checkpoint.
+    """
+    queue = JobQueue(queuePath)
+    if shots and queue.submit(shots, chunkSize):
+        logger.info("Queued {} shots in {}".format(len(shots), queuePath))
+    while not queue.submitted():
+        logger.info("Waiting for the queue to be filled")
+        time.sleep(5)
+
+    status = queue.status()
+    finished = status['done'] + status['failed']
+    progress = crawling.Throughput(sum(status.values()) - finished)
+    pool = multiprocessing.Pool(max(processes, 1), crawling.initCrawler,
+                                (settings,))
+    try:
+        result = pool.map_async(crawling.crawlQueueWorker,
+                                [queuePath] * max(processes, 1))
+        while not result.ready():
+            result.wait(60)
+            status = queue.status()
+            progress.set(status['done'] + status['failed'] - finished)
+            logger.info("Jobs: {todo} waiting, {leased} leased, {done} done, "
+                        "{failed} failed".format(**status))
+            logger.info(progress.summary().replace('shots', 'jobs'))
+        result.get()
+    except KeyboardInterrupt:
+        logger.info("Crawling interrupted, the leases of this host expire "
+                    "after {} s".format(queue.leaseTime))
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+    checkpoint = crawling.Checkpoint(checkpointPath)
+    results = queue.results()
+    checkpoint.add(results)
+    counts = checkpoint.counts(set(entry['shot'] for entry in results))
+    logger.info("Crawling result: " +
+                ", ".join("{} {}".format(n, status)
+                          for status, n in sorted(counts.iteritems())))
+    failed = queue.failedItems()
+    if failed:
+        logger.error("Shots given up after {} attempts: {}"
+                     .format(queue.maxAttempts, failed))
+    return checkpoint
+
+
+def minerSettings(config, probes=None):
+    """
+    Keyword arguments of the Miners of miner processes, the CELMA settings
+    the GUI starts with
+    """
+    application = config['Application']
+    temporal = config['Plots']['Temporal']
+    probeColors = {}
+    try:
+        for probe, color in eval(application['probeColors']).iteritems():
+            probeColors[probe] = np.array([el/255. for el in color])
+    except SyntaxError:
+        logger.info("No or invalid probe colors specified in config file: {}"
+                    .format(application['probeColors']))
+    return {'saveDir': application['saveDir_raw'],
+            'probes': probes,
+            # POI slider positions in 0.1 ms
+            'POIs': [POI/100./100. for POI in application['defaultPOIs']],
+            'unit': '0.1 ms',
+            'Dt': application['Dt'],
+            'temporalAvgNum': temporal['avgNum'],
+            'spatialAvgNum': config['Plots']['Spatial']['avgNum'],
+            'pad': temporal['CELMA']['padding']/1000.,
+            'binNumber': temporal['CELMA']['binNumber'],
+            'avgMethod': temporal['CELMA']['avgMethod'],
+            'ignoreNans': config['Plots']['ignoreNans'],
+            'ELMcache': os.path.join(application['cacheDir'], 'elms.p'),
+            'probeColors': probeColors,
+            'colorScheme': application['colorScheme'],
+            'spatialAlpha': config['Plots']['Spatial']['CELMA']['alpha']}
+
+
+def mine(tablePath, processes, loaderSettings, settings, removeTable=False):
+    """
+    Performs the CELMAs of all phases of a feature table in a pool of
+    processes and saves their raw data like the GUI's 'Save raw'. The phases
+    of a shot are handled by the same process. With removeTable, the table
+    is deleted once it is read.
+    """
+    try:
+        phases = crawling.readPhases(tablePath)
+    except (IOError, ValueError), e:
+        logger.critical("Cannot read phases from {}: {}".format(tablePath, e))
+        return
+    finally:
+        if removeTable and os.path.isfile(tablePath):
+            os.remove(tablePath)
+    shots = []
+    byShot = {}
+    for phase in phases:
+        if phase[0] not in byShot:
+            shots.append(phase[0])
+            byShot[phase[0]] = []
+        byShot[phase[0]].append(phase)
+    logger.info("Mining {} phases of {} shots".format(len(phases),
+                                                      len(shots)))
+
+    progress = crawling.Throughput(len(phases))
+    failed = []
+    pool = multiprocessing.Pool(max(processes, 1), mining.initMiner,
+                                (loaderSettings, settings))
+    try:
+        for results in pool.imap_unordered(mining.minePhases,
+                                           [byShot[shot] for shot in shots]):
+            for shot, start, end, status, duration, message, files in results:
+                if status != crawling.OK:
+                    failed.append((shot, start, end))
+                logger.info("Phase {} {}-{}s: {} {} {}"
+                            .format(shot, start, end, status, message,
+                                    ', '.join(files)))
+            progress.update(len(results))
+            logger.info(progress.summary().replace('shots', 'phases'))
+    except KeyboardInterrupt:
+        logger.info("Mining interrupted")
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+    if failed:
+        logger.error("Mining failed for {} phases: {}".format(len(failed),
+                                                              failed))
+    return failed
+
+
+if __name__ == '__main__' and args.mine:
+    config = readConfig()
+    if config is None:
+        sys.exit(1)
+    probes = None
+    if args.probes:
+        probes = [probe.strip() for probe in args.probes.split(',')]
+    failed = mine(args.mine, args.processes, loaderSettings(config),
+                  minerSettings(config, probes), args.removetable)
+    sys.exit(1 if failed is None or failed else 0)
+
+
+if __name__ == '__main__' and (args.crawl or args.queue):
+    config = readConfig()
+    if config is None:
+        sys.exit(1)
+    settings = loaderSettings(config)
+    shots = None
+    if args.crawl:
+        try:
+            shots = crawling.parseShots(args.crawl)
+        except ValueError, e:
+            logger.critical("Invalid shot specification: {}".format(e))
+            sys.exit(1)
+    if args.queue:
+        crawlQueue(shots, args.processes, args.queue, args.checkpoint,
+                   args.chunksize, settings)
+    else:
+        retry = [status.strip() for status in args.retry.split(',')]
+        crawl(shots, args.processes, args.checkpoint, retry, settings)
+    sys.exit(0)
+
+
+import matplotlib as mpl
+mpl.use('Qt4Agg')
+from matplotlib import cm
+from matplotlib import pyplot as plt
+from matplotlib import patches
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.backends.backend_qt4agg import NavigationToolbar2QT as NavigationToolbar
+from PyQt4 import QtGui, QtCore, Qt
+from PyQt4.QtGui import (QWidget, QMessageBox, QPainter, QColor)
+from PyQt4.QtCore import pyqtSlot, pyqtSignal
+from PyQt4.QtCore import QObject, QLocale
+from PyQt4.uic import loadUiType
+from scipy import interpolate
+
+from fitting import FitFunctions, BatchFitter
+from slider import SchizoSlider
+from FeaturePicking import FeaturePicker, Plotter
+from windows import FigureWindow
+from conversion import Conversion
+from binning import Binning
+from caching import LRUCache, arrayHash
+from recording import Recorder
+from rendering import panelScene, renderFrames, snapshotFigure, \
+                      saveFigures
+from celma import CELMACube, nearestIndices, windowAverages, \
+                  probeProfiles, profileMaxima, sampleMeans, synchronizeELMs
+import mpl_interactive
+
 class Warnings():
     @staticmethod
     def generic(parent, text):
@@ -530,8 +835,8 @@ class FillDataDialog(QtGui.QDialog):
 
         text = ('Add shotfile data to be filled into the feature table.\n' +
                 'Mandatory fields are marked with an asterisk.\n\n' +
-                'Caution: Data filling may take a while and will freeze GUI ' +
-                'until finished.\nCheck logs for progress.')
+                'Data is filled in the background. Fill data again to ' +
+                'cancel.')
         lbl_help = QtGui.QLabel(text)
         self.edit_diag = QtGui.QLineEdit()
         self.edit_signal = QtGui.QLineEdit()
@@ -722,64 +1027,290 @@ class AFSchecker(threading.Thread, QtCore.QObject):
             running = threading.enumerate()
             main_exists = "MainThread" in [thread.name for thread in running]
 
-class DataMiner(threading.Thread, QtCore.QObject):
-    newphase = QtCore.pyqtSignal('PyQt_PyObject', 'PyQt_PyObject', 'PyQt_PyObject')
-    saverawdata = QtCore.pyqtSignal()
+def fetchShotSignals(job):
+    """
+    Returns the (data, time) arrays of the signals of a shot, taken from its
+    cache file if they are cached there and read from the shotfiles, each
+    opened once, otherwise. Newly read signals are multiplied by their factor
+    and added to the cache file if cachePath is given. Runs in a worker
+    process, so it does not touch the GUI.
+
+    job: (shot, [(diagnostic, signal, factor)], cachePath or None, cached)
+         where cached holds signals already known to the caller by
+         (diagnostic, signal)
+
+    Returns the shot, a dict (diagnostic, signal) -> (data, time), the keys
+    read from shotfiles and error messages.
+    """
+    shot, signals, cachePath, cached = job
+    cache = {}
+    if cachePath is not None and os.path.isfile(cachePath):
+        try:
+            cache = np.load(cachePath).item()
+        except IOError:
+            cache = {}
+
+    results = {}
+    fetched = []
+    errors = []
+    missing = {}
+    for diagnostic, signal, factor in signals:
+        key = (diagnostic, signal)
+        if key in cached:
+            results[key] = cached[key]
+            continue
+        try:
+            entry = cache[diagnostic][signal]
+            results[key] = (entry['data'], entry['time'])
+        except KeyError:
+            missing.setdefault(diagnostic, []).append((signal, factor))
 
-    def __init__(self, parent):
-        super(DataMiner, self).__init__()
+    for diagnostic, pending in missing.iteritems():
+        try:
+            shotfile = dd.shotfile(diagnostic, shot)
+        except Exception, e:
+            errors.append('No {} shotfile for {}: {}'.format(diagnostic, shot,
+                                                             e))
+            continue
+        try:
+            for signal, factor in pending:
+                try:
+                    sig = shotfile(signal)
+                except Exception:
+                    errors.append('No shotfile data for {} {} {}'
+                                  .format(shot, diagnostic, signal))
+                    continue
+                results[(diagnostic, signal)] = (sig.data * factor, sig.time)
+                fetched.append((diagnostic, signal))
+        finally:
+            shotfile.close()
+
+    if fetched and cachePath is not None:
+        for diagnostic, signal in fetched:
+            data, time = results[(diagnostic, signal)]
+            cache.setdefault(diagnostic, {})[signal] = {'data': data,
+                                                       'time': time}
+        # Same atomic replacement as ApplicationWindow.saveCache
+        tmp = os.path.join(os.path.dirname(cachePath),
+                           '.{}.{}'.format(os.path.basename(cachePath),
+                                           os.getpid()))
+        with open(tmp, 'wb') as f:
+            np.save(f, cache)
+        os.rename(tmp, cachePath)
+    return shot, results, fetched, errors
+
+
+class FillWorker(threading.Thread, QtCore.QObject):
+    """
+    Fills feature table columns with the means of shotfile signals over the
+    phases of the table. Phases are grouped by shot: the signals of a shot
+    are fetched once, the shots concurrently in a process pool, and the means
+    of all phases of a shot are computed in one pass. Results are handed to
+    the GUI thread via `filled` with the phases they belong to, since rows
+    may have moved in the meantime. Every signal carries `generation`, so
+    the GUI can tell results of cancelled workers apart.
+
+    jobs: dict shot -> list of (start, end)
+    signals: list of (diagnostic, signal, factor, label)
+    cached: dict shot -> {(diagnostic, signal): (data, time)} of signals the
+            GUI holds in memory
+    """
+    progressed = QtCore.pyqtSignal(int)
+    fetched = QtCore.pyqtSignal(int, 'PyQt_PyObject', 'PyQt_PyObject')
+    filled = QtCore.pyqtSignal(int, 'PyQt_PyObject', 'PyQt_PyObject',
+                               'PyQt_PyObject', 'PyQt_PyObject')
+    finished = QtCore.pyqtSignal(int, bool)
+
+    def __init__(self, jobs, signals, cachePaths, cached, generation,
+                 processes=4):
+        super(FillWorker, self).__init__()
         QtCore.QObject.__init__(self)
         self._stop_event = threading.Event()
-        self.parent = parent
-        self.table = None
-        self.mine = None
-        self._proceed = False
+        self.daemon = True
+        self.generation = generation
+        self.jobs = jobs
+        self.signals = signals
+        self.cachePaths = cachePaths
+        self.cached = cached
+        self.processes = processes
 
-    def setTable(self, table):
-        self.table = table
+    def stop(self):
+        self._stop_event.set()
 
-    def setMine(self, mine):
-        self.mine = mine.lower()
+    def stopped(self):
+        return self._stop_event.is_set()
 
-    def proceed(self):
-        self._proceed = True
+    def run(self):
+        specs = [(diagnostic, signal, factor)
+                 for diagnostic, signal, factor, _ in self.signals]
+        tasks = [(shot, specs, self.cachePaths.get(shot),
+                  self.cached.get(shot, {}))
+                 for shot in sorted(self.jobs)]
+        pool = multiprocessing.Pool(max(min(self.processes, len(tasks)), 1))
+        try:
+            results = pool.imap_unordered(fetchShotSignals, tasks)
+            for done, (shot, data, fetched, errors) in enumerate(results):
+                if self.stopped():
+                    pool.terminate()
+                    logger.info("Filling data cancelled")
+                    self.finished.emit(self.generation, False)
+                    return
+                for error in errors:
+                    logger.error(error)
+                if fetched:
+                    self.fetched.emit(self.generation, shot,
+                                      dict((key, data[key])
+                                           for key in fetched))
+                phases = self.jobs[shot]
+                starts, ends = zip(*phases)
+                for diagnostic, signal, _, label in self.signals:
+                    try:
+                        values, times = data[(diagnostic, signal)]
+                    except KeyError:
+                        continue
+                    means = Binning.windowMeans(times, values, starts, ends)
+                    self.filled.emit(self.generation, label, shot, phases,
+                                     means)
+                self.progressed.emit(int(100. * (done + 1) / len(tasks)))
+        finally:
+            pool.close()
+        self.finished.emit(self.generation, True)
 
-    def wait(self):
-        while not self._proceed:
-            time.sleep(2)
-            continue
 
-    def _mineRawCELMA(self):
-        table = self.table
-        rows = table.rowCount()
-        if self._stop_event.is_set():
+class CELMAworker(threading.Thread, QtCore.QObject):
+    """
+    Computes CELMAs in a thread pool and stores them in the CELMA cache. Jobs
+    are (key, compute) tuples, where key may be None for jobs that are only
+    run for their side effects. Jobs are given in stages; a stage starts when
+    the previous one has finished. Only the rendering is left to the GUI
+    thread, which is notified via `finished` unless the worker was stopped.
+    """
+    progressed = QtCore.pyqtSignal(int)
+    finished = QtCore.pyqtSignal(int)
+
+    def __init__(self, cache, stages, generation, threads=4):
+        super(CELMAworker, self).__init__()
+        QtCore.QObject.__init__(self)
+        self._stop_event = threading.Event()
+        self.daemon = True
+        self.cache = cache
+        self.stages = stages
+        self.generation = generation
+        self.threads = threads
+
+    def stop(self):
+        self._stop_event.set()
+
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def _run(self, job):
+        if self.stopped():
             return
-        if not table or not rows:
-            logger.info("Nothing to mine")
+        key, compute = job
+        if key is not None and key in self.cache:
             return
-        for row in range(rows):
-            shot = str(table.item(row, 1).text())
-            start = str(table.item(row, 2).text())
-            end = str(table.item(row, 3).text())
-            logger.debug("Mining {} phase {}-{}s".format(shot, start, end))
-            self.newphase.emit(shot, start, end)
-            logger.debug("Waiting for shot to load")
-            self.wait()
-            logger.debug("Proceeding to save raw data")
-            self._proceed = False
-            logger.debug("Waiting for data to be saved")
-            self.saverawdata.emit()
-            logger.debug("Proceeding to next phase")
-            self.wait()
-            self.stop()
-        self.table = None
+        try:
+            result = compute()
+        except Exception, e:
+            logger.error("CELMA computation failed: {}".format(e))
+            return
+        if key is not None and result is not None:
+            self.cache.put(key, result)
+
+    def run(self):
+        total = sum(len(stage) for stage in self.stages)
+        done = 0
+        pool = ThreadPool(max(self.threads, 1))
+        try:
+            for stage in self.stages:
+                for _ in pool.imap_unordered(self._run, stage):
+                    done += 1
+                    self.progressed.emit(int(100. * done / total))
+                if self.stopped():
+                    logger.debug("CELMA computation cancelled")
+                    return
+        finally:
+            pool.close()
+        self.finished.emit(self.generation)
+
+
+class SweepExporter(threading.Thread, QtCore.QObject):
+    """
+    Exports a CELMA sweep off-screen. `compute` returns the frames to render
+    in the format of rendering.renderFrames; it is called in this thread, so
+    it must not touch any widget. The frames are then rendered in a process
+    pool. `finished` carries the number of frames written and the number of
+    frames of the sweep, which differ if the export was stopped or failed.
+    """
+    progressed = QtCore.pyqtSignal(int)
+    finished = QtCore.pyqtSignal(int, int)
+
+    def __init__(self, compute, scenes, path, processes=None):
+        super(SweepExporter, self).__init__()
+        QtCore.QObject.__init__(self)
+        self._stop_event = threading.Event()
+        self.daemon = True
+        self.compute = compute
+        self.scenes = scenes
+        self.path = path
+        self.processes = processes
+        self.total = 0
 
     def stop(self):
         self._stop_event.set()
-    
+
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def _progress(self, done):
+        self.progressed.emit(int(100. * done / self.total))
+        return self.stopped()
+
+    def run(self):
+        done = 0
+        try:
+            frames = self.compute()
+            self.total = len(frames)
+            if frames and not self.stopped():
+                done = renderFrames(self.scenes, frames, self.path,
+                                    self.processes, self._progress)
+        except Exception, e:
+            logger.error("Exporting the CELMA sweep failed: {}".format(e))
+        self.finished.emit(done, self.total)
+
+
+class FigureExporter(threading.Thread, QtCore.QObject):
+    """
+    Saves figure snapshots, a list of (snapshot, path) jobs as taken by
+    rendering.saveFigures, in a process pool. `saved` is emitted for every
+    file as soon as it is written, with its path and an error message that
+    is empty on success; `finished` with the number of files saved and the
+    number of jobs.
+    """
+    progressed = QtCore.pyqtSignal(int)
+    saved = QtCore.pyqtSignal(str, str)
+    finished = QtCore.pyqtSignal(int, int)
+
+    def __init__(self, jobs, processes=None):
+        super(FigureExporter, self).__init__()
+        QtCore.QObject.__init__(self)
+        self.daemon = True
+        self.jobs = jobs
+        self.processes = processes
+
     def run(self):
-        if self.mine == 'celma':
-            self._mineRawCELMA()
+        saved = 0
+        try:
+            results = saveFigures(self.jobs, self.processes)
+            for done, (path, error) in enumerate(results, 1):
+                if error is None:
+                    saved += 1
+                self.saved.emit(path, error or '')
+                self.progressed.emit(int(100. * done / len(self.jobs)))
+        except Exception, e:
+            logger.error("Saving figures failed: {}".format(e))
+        self.finished.emit(saved, len(self.jobs))
 
 
 class ValidatorEdit(QtGui.QPlainTextEdit):
@@ -923,6 +1454,9 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
         self.avgNum = config['avgNum']
         self.Dt = config['Dt']
         self.recDir = config['recDir']
+        self.recordFormat = config['recordFormat']
+        self.recordFPS = config['recordFPS']
+        self.recordQueueSize = config['recordQueueSize']
         self.langdiag = config['langmuirDiag']
         self.sldiag = config['strikelineDiag']
         self.ELMdiag = config['ELMDiag']
@@ -937,6 +1471,20 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
         self.mapDir = config['mapDir']
         self.mapFilePath = config['mapFile']
         self.calibFile = config['calibFile']
+        # Results of ELM-synchronizations, keyed by their parameters
+        self.CELMAcache = LRUCache(config['CELMAcacheSize'] * 1024**2)
+        self.CELMAthreads = config['CELMAthreads']
+        # Fit results, keyed by a hash of the fitted profile
+        self.fitCache = LRUCache(config['fitCacheSize'] * 1024**2)
+        self.fitProcesses = config['fitProcesses']
+        self.fillProcesses = config['fillProcesses']
+        self.exportProcesses = config['exportProcesses']
+        self.minerProcesses = config['minerProcesses']
+        self.distancesDecimation = config['distancesDecimation']
+        self.CELMAworker = None
+        self._CELMAgeneration = 0
+        self._CELMAcallback = None
+        self._CELMAcubes = []
         self.defaultFilter = '{} (*.{})'.format(self.defaultExtension[1:].upper(),
                                                 self.defaultExtension[1:].lower())
         self.fitNum = 1000
@@ -945,6 +1493,9 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
         self._stop = False
         self._playing = False
         self._record = False
+        self.recorder = None
+        self.sweepExporter = None
+        self.figureExporters = []
         self.voltageNames = {
                 'Vfl-Vrf': '8',
                 'Vpos-Vfl': '1',
@@ -952,18 +1503,24 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
         self.plotter = None
         self.interactive = False
         self.shotnr = None
+        self.latestLSCshotnr = None
         self.CELMAupdateDisabled = False
         self.recentsFilename = 'recentShots.npy'
         self.ELMCache = os.path.join(self.cacheDir, 'elms.p')
         self.shotCache = 'shotcache.npy'
         self.featurePicker = None
         self.miner = None
+        # Phases table of the miner, deleted by the miner once it is read
+        self.minerTable = None
+        self.fillWorker = None
+        self._fillGeneration = 0
         self._afs_warning_active = False
         self.afschecker = None
         self.probePositions = {}
         self._pan_active = False
         self._zoom_active = False
-        self.crawling = False
+        # Reads the data of the current shot, see load
+        self.loader = None
 
         self.currentLimPlot = {}
         self.limits = {}
@@ -1039,11 +1596,11 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
 
         shortcut = QtGui.QShortcut(self)
         shortcut.setKey('Ctrl+Y')
-        shortcut.activated.connect(self.toggleCELMAs)
+        shortcut.activated.connect(self.requestCELMAtoggle)
 
         shortcut = QtGui.QShortcut(self)
         shortcut.setKey('Ctrl+U')
-        shortcut.activated.connect(self.updateCELMAs)
+        shortcut.activated.connect(self.requestCELMAupdate)
 
         self.actionToLabel('Temporal plot')
         self.actionToLabel('Spatial plot')
@@ -1212,10 +1769,10 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
         shotnumbers, ok = CrawlerDialog.getShotNumbers(self)
         result = {}
         if ok and shotnumbers:
+            loader = self.createShotLoader()
             lbl = QtGui.QLabel()
             lbl.setFixedWidth(200)
             self.statusbar.addPermanentWidget(lbl)
-            self.crawling = True
             size = len(shotnumbers)
             min_crawls = min(5, max(1, size / 10))
             durations = []
@@ -1238,15 +1795,14 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
                                                                 duration))
                 logger.info(status)
                 lbl.setText(status)
-                self.shotNumberEdit.setText(str(shotnr))
-                ok = self.load(dryrun=True)
+                status, _ = self.crawlShot(loader, shotnr)
+                ok = status == crawling.OK
                 if ok:
                     logger.info("Successfully crawled shot {}".format(shotnr))
                 else:
                     logger.info("Error while crawling shot {}".format(shotnr))
                 result[shotnr] = ok
                 durations.append(time.time() - start_time)
-            self.crawling = False
             success_rate = len([ok for ok in result.values() if ok]) / float(len(result))
             logger.info("Crawling result: {:.1f}% successful"
                         .format(success_rate * 100))
@@ -1256,64 +1812,80 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
             self.statusbar.removeWidget(lbl)
         return result
 
-    def loadCache(self, shotnr):
-        path = os.path.join(self.cacheDir, 'shotdata')
-        logger.debug("Loading cache from '{}'".format(path))
-        logger.debug("Files in cache: {}".format(os.listdir(path)))
-        filename = "{}-{}-{}".format(shotnr, self.segment, self.region)
-        for fname in os.listdir(path):
-            if fname.startswith(filename):
-                if os.path.isfile(os.path.join(path, fname)):
-                    logger.debug("Found file '{}'".format(fname))
-                    fpath = os.path.join(path, fname)
-                    try:
-                        cache = np.load(fpath)
-                    except IOError:
-                        logger.debug("File cannot be read")
-                        continue
-                    else:
-                        logger.debug("Read cache for shot {}".format(shotnr))
-                        self.cache[shotnr] = cache.item()
-        if not len(self.cache):
-            logger.info("Shot {} has not been cached yet".format(shotnr))
-
-    @pyqtSlot()
-    def saveRawData(self):
+    def crawlShot(self, loader, shotnr):
         """
-        Callback for saving rawdata of multiple plots while using DataMiner
+        Reads all data of shot shotnr with loader so that it ends up in the
+        cache, like the headless crawler (see crawling.crawlData).
+
+        Returns the status of the shot (crawling.OK, crawling.MISSING if some
+        diagnostic could not be loaded or crawling.ERROR) and a message.
         """
-        for plot in self.getTemporalPlots():
-            if plot.quantity in ('jsat', 'te'):
-                self.savePlot(plot, raw=True, dialog=False)
-        self.miner.proceed()
+        try:
+            return crawling.crawlData(loader, shotnr)
+        except Exception, e:
+            return crawling.ERROR, "{}: {}".format(type(e).__name__, e)
 
     def mineCELMAs(self):
         """
-        Iterate through feature list, perform a CELMA on each phase, and
-        save the raw data.
+        Performs the CELMA of every phase in the feature table and saves the
+        raw data. The phases are mined by a headless miner process (see
+        --mine) so the GUI stays usable.
         """
-        if not self.miner:
-            self.miner = DataMiner(self)
-            self.miner.newphase.connect(
-                functools.partial(self.goTo, celma=True))
-            self.miner.saverawdata.connect(self.saveRawData)
-        if self.miner.isAlive():
-            logging.info("Miner already running")
+        if self.miner and self.miner.poll() is None:
+            logger.info("Miner already running")
+            return
+        model = self.featurePicker.model
+        if not model.rowCount():
+            logger.info("Nothing to mine")
             return
-        table = self.tblFeatures
-        self.miner.setMine('celma')
-        self.miner.setTable(self.tblFeatures)
-        self.miner.start()
+        labels = ['Shot', 'CELMA start', 'CELMA end']
+        fd, path = tempfile.mkstemp(suffix='.csv', prefix='phases')
+        with os.fdopen(fd, 'w') as f:
+            writer = csv.writer(f)
+            writer.writerow(labels)
+            writer.writerows([[text.encode('utf8') for text in row]
+                              for row in model.texts(labels)])
+        cmd = [sys.executable, os.path.abspath(sys.argv[0]),
+               '--mine', path, '--processes', str(self.minerProcesses),
+               '--remove-table']
+        logger.info("Mining {} phases in the background".format(
+            model.rowCount()))
+        self.minerTable = path
+        try:
+            self.miner = subprocess.Popen(cmd)
+        except OSError, e:
+            logger.error("Could not start the miner: {}".format(e))
+            self.removeMinerTable()
 
     def stopMining(self):
-        if self.miner:
-            self.miner.stop()
+        if self.miner and self.miner.poll() is None:
+            self.miner.terminate()
+            logger.info("Mining stopped")
+        self.removeMinerTable()
+
+    def removeMinerTable(self):
+        """ Deletes the phases table unless the miner already did """
+        if self.minerTable and os.path.isfile(self.minerTable):
+            os.remove(self.minerTable)
+        self.minerTable = None
 
     @pyqtSlot()
     def fillData(self):
+        """
+        Fills the feature table with the means of shotfile signals over the
+        phases of the table in a FillWorker. Calling it while data is being
+        filled cancels the filling.
+        """
+        if self.fillWorker is not None and self.fillWorker.is_alive():
+            self.fillWorker.stop()
+            self.fillWorker = None
+            self.hideProgress()
+            self.statusbar.showMessage('Filling data cancelled')
+            return
         ok, reply = FillDataDialog.getShotfileDetails(self)
         if not ok:
             return
+        signals = []
         for details in reply:
             diagnostic = details['diagnostic']
             signal = details['signal']
@@ -1325,44 +1897,107 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
                 factor = 1
             if not label:
                 label = signal
-            
             logger.info("Filling {} {} data".format(diagnostic, signal))
+            signals.append((diagnostic, signal, factor, label))
 
-            table = self.tblFeatures
-            for row in range(table.rowCount()):
-                shot = int(table.item(row, 1).text())
-                start = float(table.item(row, 2).text())
-                end = float(table.item(row, 3).text())
+        jobs = {}
+        for shot, start, end in sorted(self.tablePhases()):
+            jobs.setdefault(shot, []).append((start, end))
+        if not jobs or not signals:
+            return
 
-                value = self.getMissingData(diagnostic, signal, shot,
-                                            start, end, factor)
-                if value is not None:
-                    self.featurePicker.insertData(row, label, value, overwrite=False)
+        # Signals in memory are passed on. The cache files of the other
+        # shots are read and updated by the worker processes; that of the
+        # current shot is saved from memory here so it is not overwritten.
+        cached = {}
+        cachePaths = {}
+        for shot in jobs:
+            entries = {}
+            for diagnostic, signal, _, _ in signals:
+                try:
+                    entry = self.cache[shot][diagnostic][signal]
+                except KeyError:
+                    continue
+                entries[(diagnostic, signal)] = (entry['data'], entry['time'])
+            cached[shot] = entries
+            if self.use_cache and shot not in (self.shotnr,
+                                               self.latestLSCshotnr):
+                cachePaths[shot] = os.path.join(
+                    self.cacheDir, 'shotdata', "{}-{}-{}.npy".format(
+                        shot, self.comboSegment.currentText(),
+                        self.comboRegion.currentText()))
+
+        self._fillGeneration += 1
+        self.fillWorker = FillWorker(jobs, signals, cachePaths, cached,
+                                     self._fillGeneration,
+                                     self.fillProcesses)
+        self.fillWorker.progressed.connect(self.onProgress)
+        self.fillWorker.fetched.connect(self.onDataFetched)
+        self.fillWorker.filled.connect(self.onDataFilled)
+        self.fillWorker.finished.connect(self.onFillFinished)
+        self.progBar.setValue(0)
+        self.progBar.setVisible(True)
+        self.statusbar.showMessage('Filling data of {} shots'
+                                   .format(len(jobs)))
+        self.fillWorker.start()
 
-    def getMissingData(self, diagnostic, signal, shot,
-                       start, end, factor=1):
-        try:
-            data = copy.deepcopy(self.cache[shot][diagnostic][signal]['data'])
-            time = copy.deepcopy(self.cache[shot][diagnostic][signal]['time'])
-        except KeyError:
-            global dd
-            shotfile = dd.shotfile(diagnostic, shot)
+    def tablePhases(self):
+        """
+        Rows of the feature table by phase, dict (shot, CELMA start, CELMA
+        end) -> rows. Rows with empty or text cells are left out.
+        """
+        phases = {}
+        values = self.featurePicker.model.dataFrame()[
+            ['Shot', 'CELMA start', 'CELMA end']].values
+        for row, (shot, start, end) in enumerate(values):
             try:
-                data = shotfile(signal).data * factor
-                time = shotfile(signal).time
-            except:
-                logger.error('No shotfile data for {} {} {}'
-                             .format(shot, diagnostic, signal))
-                shotfile.close()
-                return
-            shotfile.close()
+                shot, start, end = int(shot), float(start), float(end)
+            except (TypeError, ValueError):
+                # Empty or text cells
+                continue
+            if np.isnan(start) or np.isnan(end):
+                continue
+            phases.setdefault((shot, start, end), []).append(row)
+        return phases
+
+    def isCurrentFill(self, generation):
+        """ Whether signals of generation come from the running FillWorker """
+        return (self.fillWorker is not None and
+                generation == self._fillGeneration)
+
+    def onDataFetched(self, generation, shot, signals):
+        """ Keeps signals newly read for the current shot in its cache """
+        if not self.isCurrentFill(generation):
+            return
+        if not self.use_cache or shot not in (self.shotnr,
+                                              self.latestLSCshotnr):
+            return
+        for (diagnostic, signal), (data, time) in signals.iteritems():
             self.initCacheEntry(shot, diagnostic, signal)
             self.cache[shot][diagnostic][signal]['data'] = data
             self.cache[shot][diagnostic][signal]['time'] = time
-            self.saveCache()
+        self.saveCache()
+
+    def onDataFilled(self, generation, label, shot, phases, values):
+        # Rows are looked up now, the table may have changed since the
+        # worker was started
+        if not self.isCurrentFill(generation):
+            return
+        rows = self.tablePhases()
+        for (start, end), value in zip(phases, values):
+            if np.isnan(value):
+                continue
+            for row in rows.get((shot, start, end), []):
+                self.featurePicker.insertData(row, label, value,
+                                              overwrite=False)
 
-        value = np.nanmean(data[(start < time) & (time < end)])
-        return value
+    def onFillFinished(self, generation, completed):
+        if not self.isCurrentFill(generation):
+            return
+        self.fillWorker = None
+        self.hideProgress()
+        if completed:
+            self.statusbar.showMessage('Filling data finished')
 
     def initCacheEntry(self, shot=None, diagnostic=None, signal=None):
         """
@@ -1398,13 +2033,8 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
                              "Key not initialized").with_traceback(tb)
 
     def saveCache(self):
-        for shotnr in (self.shotnr, self.latestLSCshotnr):
-            fname = "{}-{}-{}".format(shotnr, self.segment, self.region)
-            path = os.path.join(self.cacheDir, 'shotdata', fname)
-            try:
-                np.save(path, self.cache[shotnr])
-            except KeyError:
-                pass
+        if self.loader is not None:
+            self.loader.saveCache()
 
     def closeEvent(self, event):
         if not self.saved:
@@ -1417,8 +2047,13 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
         logger.info("Terminating threads...")
         if self.afschecker:
             self.afschecker.stop()
-        if self.miner:
-            self.miner.stop()
+        self.stopMining()
+        if self.fillWorker:
+            self.fillWorker.stop()
+        # The writer of the recorder is a daemon thread, its queued frames
+        # would be lost on exit
+        if self.recorder is not None:
+            self.stopRecording()
         event.accept()
 
     def setSaved(self, saved):
@@ -1998,11 +2633,13 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
             plot.update(time)
 
 
-    def savePlot(self, plot, raw=False, dialog=True):
+    def plotFileName(self, plot):
+        """
+        Default file name of plot without extension, made of the shot, the
+        plot type and quantity, the time range, the probes and CELMA mode.
+        """
         type = plot.type
         quantity = plot.quantity
-        logger.info("Saving {} {} plot".format(type, quantity))
-
         if plot.CELMAexists:
             start = '{:.4f}'.format(float(self.editCELMAstartTime.text()))
             end = '{:.4f}'.format(float(self.editCELMAendTime.text()))
@@ -2032,12 +2669,20 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
 
         shot = str(self.shotnr)
         if plot.CELMAexists:
-            fileName = '_'.join([shot, type, quantity, 'CELMA',
-                                 start, end, probeName, mode, syncedBy])
-        else:
-            fileName = '_'.join([shot, type, quantity,
-                                 start, end, probeName, mode, syncedBy])
+            return '_'.join([shot, type, quantity, 'CELMA',
+                             start, end, probeName, mode, syncedBy])
+        return '_'.join([shot, type, quantity,
+                         start, end, probeName, mode, syncedBy])
 
+
+    def savePlot(self, plot, raw=False, dialog=True):
+        """
+        Saves the figure of plot, or with raw the data of its artists. The
+        file is chosen in a dialog unless raw data is saved without dialog.
+        Figures are written in the background. Returns the path.
+        """
+        logger.info("Saving {} {} plot".format(plot.type, plot.quantity))
+        fileName = self.plotFileName(plot)
         logger.info("Saving to file {}".format(fileName))
 
         if not raw:
@@ -2054,11 +2699,8 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
                                         selectedFilter='Scalable Vector Graphics (SVG) (*.svg)')
             if filePath:
                 filePath = str(filePath)
-                _, fmt = os.path.splitext(filePath)
-                plot.fig.savefig(filePath, format=fmt[1:])
                 self.saveDir = os.path.dirname(filePath)
-                logger.info("{} {} plot saved to {}".format(
-                                    plot.type, plot.quantity, filePath))
+                self.exportFigures([(plot.fig, filePath)])
         else:
             fileName += '_RAW.npz'
             filePath = os.path.join(self.saveDir_raw, fileName)
@@ -2091,6 +2733,7 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
                     pickle.dump(plotTypes, f, protocol=pickle.HIGHEST_PROTOCOL)
                 logger.info("{} {} plot info data saved to {}".format(
                                     plot.type, plot.quantity, infoPath + '.info'))
+                return filePath
 
 
     def setTimeText(self):
@@ -2192,16 +2835,20 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
         logger.info('Loading shot')
         QtGui.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
         self.btnShotUpdate.setVisible(False)
+        self.cancelCELMAs()
         self.clearCELMAs()
         self.CELMAexists = False
+        self.CELMAcache.clear()
 
         self.stats = {}
-        self.cache = {}
         self.map = {}
         self.calib = {}
 
         self.segment = str(self.comboSegment.currentText())
         self.region = str(self.comboRegion.currentText())
+        self.loader = self.createShotLoader()
+        # Shared with the loader, which saves it to the cache files
+        self.cache = self.loader.cache
         self.patches = {}
         self.probeColors = self.config['Application']['probeColors']
         try:
@@ -2325,12 +2972,12 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
                 #self.POISlider.sliderPressed.connect(self.disableCELMAupdate)
                 #self.POISlider.sliderReleased.connect(self.enableCELMAupdate)
                 self.POISlider.valueChangedByKey.connect(
-                    lambda x: self.updateCELMAs('spatial'))
+                    lambda x: self.requestCELMAupdate('spatial'))
                 self.POISlider.valueChanged.connect(self.showCELMAupdateButton)
 
                 self.spinTWidth.editingFinished.connect(self.updateTWindow)
                 self.btnReset.clicked.connect(self.resetPlots)
-                self.btnCELMA.clicked.connect(self.toggleCELMAs)
+                self.btnCELMA.clicked.connect(self.requestCELMAtoggle)
                 self.btnCELMAgotoInterval.clicked.connect(self.showInterval)
 
                 self.comboSwitchxPlot.currentIndexChanged.connect(self.switchxPlot)
@@ -2343,7 +2990,8 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
                 self.editCELMAELMnum.textChanged.connect(self.showCELMAupdateButton)
                 self.editCELMAstartTime.textChanged.connect(self.showCELMAupdateButton)
                 self.editCELMAendTime.textChanged.connect(self.showCELMAupdateButton)
-                self.btnCELMAupdate.clicked.connect(self.updateCELMAs)
+                self.btnCELMAupdate.clicked.connect(
+                    lambda: self.requestCELMAupdate())
 
 
                 self.shotNumberEdit.textChanged.connect(self.showShotUpdateButton)
@@ -2409,6 +3057,7 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
                 self.menuPlayStart.triggered.connect(self.play)
                 self.menuStop.triggered.connect(self.stop)
                 self.menuSetIncrement.triggered.connect(self.changePlayIncrement)
+                self.menuExportSweep.triggered.connect(self.exportCELMAsweep)
                 
                 self.menuShowAverages.triggered.connect(
                         functools.partial(self.changeCELMAsetting, 'spatial',
@@ -2714,15 +3363,8 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
         if settings is None:
             return
         start, end, _ = settings
-        btnGoto = QtGui.QPushButton('View')
-        btnGoto.setMaximumWidth(30)
-        btnGoto.clicked.connect(functools.partial(self.goTo,
-                                                   self.shotnr,
-                                                   start,
-                                                   end))
         picker = self.featurePicker
         picker.addRow()
-        picker.setFeatureWidget('Go to', btnGoto)
         picker.setFeatureValue('Shot', self.shotnr)
         picker.setFeatureValue('CELMA start', start)
         picker.setFeatureValue('CELMA end', end)
@@ -2895,8 +3537,6 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
                 self.hideCELMAs(reinstate=False)
             self.showCELMAs()
 
-        if self.miner:
-            self.miner.proceed()
 
 
     def activateXtimeSlider(self):
@@ -2961,6 +3601,23 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
         self.populateProbeTable()
 
 
+    def getCELMAPOIs(self):
+        """
+        Returns the POI unit, the POIs selected with the POI slider and all
+        POIs between its low and high handle, relative to the ELM onsets.
+        The latter are precomputed in the CELMA cube so that moving the
+        middle handle, playing and recording only look them up.
+        """
+        unit = str(self.comboPOIunit.currentText())
+        POIsRel = self.readPOIs(self.multiplePOIs)
+        slider = self.POISlider
+        sweep = [POI/100. for POI in range(slider.low(), slider.high() + 1)]
+        if unit == '0.1 ms':
+            POIsRel = [POI/100 for POI in POIsRel]
+            sweep = [POI/100 for POI in sweep]
+        return unit, POIsRel, sweep
+
+
     def createSpatialCELMA(self):
         logger.info("Creating spatial CELMA...")
         settings = self.getCELMAsettings()
@@ -2984,14 +3641,16 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
             markers = ['None'] * 3
         colors = ['r','b','g']
 
-        POIsRel = self.readPOIs(multiplePOIs)
-        if unit == '0.1 ms':
-            POIsRel = [POI/100 for POI in POIsRel]
+        _, POIsRel, sweep = self.getCELMAPOIs()
 
         handles = []
         labels = []
         for plot in self.getSpatialPlots():
             plot.hideArtists()
+            plot.buildCELMAcube(*settings[:2],
+                                POIsRelative = sweep,
+                                range = self.Dt,
+                                unit = unit)
             i=0
             for POIrelative, marker, color in zip(POIsRel, markers, colors):
                 result = plot.coherentELMaveraging(
@@ -3154,90 +3813,7 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
 
 
     def loadStatData(self):
-        statData = {}
-        if self.use_cache:
-            try:
-                statData = copy.deepcopy(self.cache[self.shotnr]['statData'])
-            except KeyError:
-                pass
-            else:
-                logger.debug("Loaded stat data from cache")
-
-        if not len(statData):
-            # Heating
-            heating = {}
-            try:
-                shot = dd.shotfile('TOT', self.shotnr)
-            except:
-                logger.debug("Heating power shotfile not available")
-                heating = None
-            else:
-                heating['time'] = shot('P_TOT').time
-                heating['data'] = shot('P_TOT').data
-                shot.close()
-
-            # Line-averaged density
-            lineDens = {}
-            try:
-                shot = dd.shotfile('DCN', self.shotnr)
-            except:
-                logger.debug("Line density shotfile not available")
-                lineDens = None
-            else:
-                lineDens['time'] = shot('H-1').time
-                lineDens['data'] = shot('H-1').data
-                shot.close()
-
-            # Tdiv
-            Tdiv = {}
-            try:
-                shot = dd.shotfile('DDS', self.shotnr)
-            except:
-                logger.debug("Tdiv shotfile not available")
-                Tdiv = None
-            else:
-                Tdiv['time'] = shot('Tdiv').time
-                Tdiv['data'] = shot('Tdiv').data
-                shot.close()
-            
-            D = None
-            impN = None
-            impNe = None
-            try:
-                shot = dd.shotfile('UVS', self.shotnr)
-            except:
-                logger.debug("No seeding shotfile available")
-            else:
-                D = {}
-                impN = {}
-                impNe = {}
-                try:
-                    D['time'] = shot('D_tot').time
-                    D['data'] = shot('D_tot').data
-                except:
-                    logger.debug("No D fuelling data")
-                try:
-                    impN['time'] = shot('N_tot').time
-                    impN['data'] = shot('N_tot').data
-                except:
-                    logger.debug("No N seeding data")
-                try:
-                    impNe['time'] = shot('Ne_tot').time
-                    impNe['data'] = shot('Ne_tot').data
-                except:
-                    logger.debug("No Ne seeding data")
-                shot.close()
-
-            statData['Ptot'] = heating
-            statData['n_H-1'] = lineDens
-            statData['Tdiv'] = Tdiv
-            statData['D_rate'] = D
-            statData['N_rate'] = impN
-            statData['Ne_rate'] = impNe
-            
-            if self.use_cache:
-                self.cache[self.shotnr]['statData'] = statData
-                self.saveCache()
+        statData = copy.deepcopy(self.loader.statData())
 
         self.statData = {self.lblStatN: [statData['N_rate'], 10**21, 'impN'],
                          self.lblStatNe: [statData['Ne_rate'], 10**21, 'impNe'],
@@ -3398,44 +3974,22 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
             self.xTimeSlider.valueChanged.connect(self.updateIndicators)
 
     def getShotData(self, quantity):
-        diags = {'te': 'LSD',
-                 'ne': 'LSD',
-                 'jsat': 'LSF',
-                 'elms': 'ELM',
-                 'strikeline': 'FPG'}
+        self.statusbar.showMessage('Fetching {} data...'.format(quantity))
         try:
-            diag = diags[quantity]
-        except KeyError:
-            logger.error("Trying to get shot data of unknown quantity {}. "
-                         .format(quantity) + "Aborting...")
-            return
-
-        data = None
-        if self.use_cache:
-            try:
-                data = self.cache[self.shotnr][quantity]
-            except (KeyError, TypeError):
-                pass
-            else:
-                logger.debug("{} data retrieved from cache".format(quantity))
-        if not data:
-            logger.debug("Data is invalid. " +
-                         "Trying to get {} data from {} shotfile"
-                         .format(quantity, diag))
-            data = self.getShotfileData(diag, quantity)
-            if data:
-                logger.debug("{} data retrieved from {} shotfile"
-                             .format(quantity, diag))
-                if self.use_cache:
-                    self.cache[self.shotnr][quantity] = data
-                    self.saveCache()
-        if data:
-            if quantity == "elms":
-                self.publicizeELMdata(data)
-            elif quantity == "strikeline":
-                self.publicizeSLdata(data)
-        else:
+            data = self.loader.shotData(quantity)
+        except ShotDataError, e:
             logger.error("Failed to get {} data".format(quantity))
+            self.showShotWarning("Shot data not available",
+                                 "{} data could not be loaded".format(quantity),
+                                 "Neither the cache nor the shotfiles of shot "
+                                 "{} hold valid {} data."
+                                 .format(self.shotnr, quantity),
+                                 details=str(e))
+            return
+        if quantity == "elms":
+            self.publicizeELMdata(data)
+        elif quantity == "strikeline":
+            self.publicizeSLdata(data)
         # deepcopy is necessary because otherwise the cache will be altered if
         # data is operated on (e.g. calibration of jsat).
         # This is even a cumulative effect when it's reloaded.
@@ -3448,163 +4002,59 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
         experiment = self.experiment_combos[diag]
         return str(experiment.currentText())
 
-    def getShotfile(self, diag, shotnr=None):
-        self.statusbar.showMessage('Fetching {} data...'.format(diag))
-        exp = self.getExperiment(diag)
-
-        if diag == "LSC":
-            shotnr = shotnr or self.latestLSCshotnr
-        else:
-            shotnr = shotnr or self.shotnr
-
-        try:
-            shot = dd.shotfile(diag, shotnr, exp)
-        except Exception, e:
-            logger.critical("Could not load {} shotfile for user {}: {}"
-                            .format(diag, exp, str(e)))
-            if exp == 'AUGD':
-                return
-            logger.critical("Trying AUGD...")
-            try:
-                shot = dd.shotfile(diag, self.shotnr)
-            except Exception, e:
-                if not self.crawling:
-                    self.showShotWarning("Shotfile not found",
-                                         "{} shotfile could not be loaded"
-                                         .format(diag),
-                                         "No shotfile could be found at {}:{} "
-                                         .format(diag, exp) +
-                                         "nor at {}:AUGD ".format(diag) +
-                                         "for shot {}".format(shotnr),
-                                         details=str(e))
-                else:
-                    logger.error("{} shotfile could not be loaded: {}"
-                                 .format(diag, str(e)))
+    def createShotLoader(self):
+        """ ShotLoader reading shots with the current settings of the GUI """
+        useLSC = self.menuUseLSC.isChecked()
+        if not useLSC:
+            self.getMapFile()
+        experiments = dict((diag, self.getExperiment(diag))
+                           for diag in self.experiment_combos)
+        return ShotLoader(self.cacheDir,
+                          segment=str(self.comboSegment.currentText()),
+                          region=str(self.comboRegion.currentText()),
+                          experiments=experiments,
+                          useCache=self.use_cache,
+                          useLSC=useLSC,
+                          mapFile=self.mapFilePath or '',
+                          calibFile=self.calibFile)
+
+    def getMapFile(self):
+        """ Asks for the mapping file if the configured one does not exist """
+        if self.mapFilePath and os.path.isfile(self.mapFilePath):
+            return self.mapFilePath
+        while True:
+            self.mapFilePath = \
+                str(QtGui.QFileDialog.getOpenFileName(
+                    self,
+                    directory=self.mapDir,
+                    caption='Load mapping file'
+                ))
+            # If cancelled, abort
+            if self.mapFilePath == '':
                 return
-        return shot
+            # If filename valid, leave loop
+            elif not os.path.isfile(self.mapFilePath):
+                self.statusbar.showMessage('Could not find mapping file', 3000)
+            else:
+                return self.mapFilePath
 
-    def getShotfileData(self, diag, quantity=None, shot=None):
-        shot = self.getShotfile(diag, shot)
-        if not shot:
-            logger.error("Could not get {} shotfile".format(diag))
+    def getProbePositions(self, data):
+        try:
+            positions = self.loader.positions(data)
+        except ShotDataError, e:
+            logger.error("Could not get probe positions: {}".format(e))
             return
+        self.probePositions = copy.deepcopy(positions)
+        for probeName, pos in self.probePositions.items():
+            logger.debug("{} position: {}".format(probeName, pos))
 
-        if diag == 'LSD':
-            data = self.getLSDdata(shot, quantity)
-        elif diag == 'LSF':
-            data = self.getLSFdata(shot)
-        elif diag == 'LSC':
-            data = self.getMapping(shot)
-        elif diag == 'ELM':
-            data = self.getELMdata(shot)
-        elif diag == 'FPG':
-            data = self.getFPGdata(shot)
-        else:
-            data = None
-
-        logger.debug("{} data: {}".format(diag, data))
-        shot.close()
-        return data
-
-    def getProbePositions(self, data):
-        # Try to load form cache
-        if self.use_cache:
-            try:
-                self.probePositions = copy.deepcopy(self.cache[self.latestLSCshotnr]['probePositions'])
-            except KeyError:
-                pass
-            else:
-                logger.debug("Retrieved probe positions from cache")
-                for probeName, pos in self.probePositions.items():
-                    logger.debug("{} position: {}".format(probeName, pos))
-
-        # If any probe's position is not known yet, get it from shotfile
-        if all([probeName in self.probePositions for probeName in data]):
-            logger.debug("All probe positions already known")
-            return
-        shotfile = self.getShotfile('LSC')
-        for probeName in data:
-            pos = shotfile(probeName)['Ort'].data/1000.
-            logger.debug("{} position: {}".format(probeName, pos))
-            self.probePositions[probeName] = pos
-
-        # Save to cache
-        if self.use_cache:
-            self.cache[self.latestLSCshotnr]['probePositions'] = self.probePositions
-            self.saveCache()
-
-    def getLSFdata(self, shotfile):
-        """ Loads jsat data from shotfile. """
-        if len(self.map) < 1:
-            hasMapping = self.getMapping()
-            if not hasMapping:
-                logger.critical("No mapping found")
-                return
-
-        shot = shotfile
-        rawdata = {}
-        for key, objName in shot.getObjectNames().iteritems():
-            if objName.startswith('CH'):
-                for probe, (channel, ind) in self.map.iteritems():
-                    if channel == objName:
-                        try:
-                            if probe not in rawdata:
-                                rawdata[probe] = {}
-                            rawdata[probe]['data'] = shot(channel).data[ind]
-                            rawdata[probe]['time'] = shot(channel).time
-                        except TypeError, e:
-                            logger.warn("Could not retrieve LSF data for probe {}".format(probe)+\
-                                    " @channel {} ({}), {} ({}): {}".format(channel,
-                                            type(channel), ind, type(ind),
-                                            str(e)))
-        return rawdata
-
-    def getCalibrationsFromShotfile(self):
-        logger.info( "Getting calibrations from shotfile...")
-        shot = self.getShotfile("LSC")
-        for obj in shot.getObjectNames().values():
-            #probeInLSF = obj in [p.name for p in self.probes]
-            if obj.startswith(self.region):# and probeInLSF:
-                probe = obj
-                data = shot(probe)['Geom'].data 
-                try:
-                    l, w = data[:2]
-                except:
-                    logger.critical("Could not retrieve geometry of probe {}"
-                                    .format(probe))
-                    continue
-                self.calib[probe] = (float(l), float(w))
-        return self.calib
-    
-    def getCalibrations(self, path=None):
-        """ Loads probe dimensions from file so current can be converted to current density. """
-        if self.use_cache:
-            # Try to get from cache
-            try:
-                self.calib = copy.deepcopy(self.cache[self.latestLSCshotnr]["probeDimensions"])
-            except KeyError:
-                pass
-            else:
-                logger.debug("Retrieved probe dimensions from cache")
-                return self.calib
-
-        # Get from shotfile
-        if self.menuUseLSC.isChecked():
-            self.getCalibrationsFromShotfile()
-        # Get from file
-        else:
-            if path is None:
-                path = self.calibFile
-            with open(path) as f:
-                lines = f.readlines()[1:]
-                for line in lines:
-                    probe, l, w = line.split()
-                    self.calib[probe] = (float(l), float(w))
-        
-        # Save to cache
-        if self.use_cache:
-            self.cache[self.latestLSCshotnr]["probeDimensions"] = self.calib
-            self.saveCache()
+    def getCalibrations(self):
+        """ Loads probe dimensions so current can be converted to current density. """
+        try:
+            self.calib = copy.deepcopy(self.loader.calibrations())
+        except ShotDataError, e:
+            logger.critical("Could not get probe dimensions: {}".format(e))
+            return self.calib
 
         logger.debug("\n\nProbe dimensions:")
         for probe in self.calib:
@@ -3625,201 +4075,6 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
     def publicizeSLdata(self, data):
         self.ssl = data
 
-    def getELMdata(self, shotfile):
-        try:
-            self.ELMonsets = shotfile('t_begELM')
-            self.ELMends = shotfile('t_endELM').data
-            self.ELMmaxima = shotfile('t_maxELM').data
-            self.ELMfreqs = shotfile('freq_ELM').data
-            self.ELMtoELM = np.append(np.diff(self.ELMonsets),0)
-            self.ELMENER = shotfile('ELMENER').data
-            self.preELMWmhd = shotfile('Wmhd').data
-            self.ELMelec = shotfile('ELMPART').data
-            self.preELMelec = shotfile('ELECTRNS').data
-        except:
-            ELMdata = None
-        else:
-            ELMdata = {"onsets": self.ELMonsets,
-                       "ends": self.ELMends,
-                       "maxima": self.ELMmaxima,
-                       "frequencies": self.ELMfreqs,
-                       "ELMtoELM": self.ELMtoELM,
-                       "ELMenergy": self.ELMENER,
-                       "preELMWmhd": self.preELMWmhd,
-                       "electrons": self.ELMelec,
-                       "preELMelectrons": self.preELMelec}
-        return ELMdata
-
-    def getSLdata(self, shotfile):
-        self.ssl = {}
-        #self.Rsl = {}
-        #self.zsl = {}
-        try:
-            self.ssl['data'] = shotfile('Suna2b').data
-            self.ssl['time'] = shotfile('Suna2b').time
-            #self.Rsl['data'] = shotfile('Runa2b').data
-            #self.Rsl['time'] = shotfile('Runa2b').time
-            #self.zsl['data'] = shotfile('Zuna2b').data
-            #self.zsl['time'] = shotfile('Zuna2b').time
-        except Exception, e:
-            self.showShotWarning(
-            "Strikeline positions not readable",
-            "Unable to read strikeline positions",
-            "Invalid shotfile found for this shot.",
-            details=str(e))
-            self.hideProgress()
-            return
-        logger.debug("Strikeline data: {}".format(self.ssl))
-        logger.debug("Strikeline times direct: {}"
-                     .format(shotfile('Suna2b').time))
-        return self.ssl
-
-    def getFPGdata(self, shotfile):
-        data = self.getSLdata(shotfile)
-        return data
-
-    def getLSDdata(self, shotfile, quantity):
-        signalNames = shotfile.getSignalNames()
-        region = 'ua'
-
-        # Count number of signals to be loaded to accurately show progress in widget
-        probes = [s.split('-')[-1] for s in signalNames 
-                                    if s.startswith(quantity) 
-                                    and s.split('-')[-1][:2] == region]
-
-        logger.debug("{} probes: {}".format(quantity, probes))
-
-        # Load signals into array
-        rawdata = {}
-        for probe in probes:
-            signal = quantity + '-' + probe
-            try:
-                data = shotfile(signal).data
-                time = shotfile(signal).time
-            except Exception, e:
-                logger.info("Signal {} cannot be read and is skipped: "
-                            .format(signal) + str(e))
-                continue
-            if probe not in rawdata:
-                rawdata[probe] = {}
-            rawdata[probe]['data'] = data
-            rawdata[probe]['time'] = time
-            logger.debug("Successfully read signal {}".format(signal))
-        return rawdata
-
-    def getMappingFromShotfile(self, shot):
-        self.statusbar.showMessage("Trying to get probe-channel " +
-                                   "mapping from LSC")
-        map = {}
-        signalName = 'ZSI' + self.segment
-        for obj in shot.getObjectNames().values():
-            if obj.startswith(self.region):
-                probe = obj
-                data = shot(obj)[signalName].data 
-                info = ''.join([el for el in data if el.split() != []])
-                try:
-                    channel, ind = info.split('_')
-                except:
-                    logger.warn("Could not retrieve LSC data for probe {}"
-                                .format(probe))
-                else:
-                    # Actual LSC data starts with 'ch' while shotfile object
-                    # names start with 'CH'.
-                    channel = 'CH' + channel[2:]
-                    # Indices are saved as numbers 1-6 but must serve as
-                    # indexes 0-5
-                    ind = int(ind) - 1
-                    map[probe] = (channel, ind)
-                    logger.debug("{} channel: {}-{}"
-                                 .format(probe, channel, ind))
-        return map
-
-    def getMappingFromFile(self):
-        logger.info("Getting mapping from text file {}"\
-                    .format(self.mapFilePath))
-        # File load dialog if mapFilePath was set to None during runtime
-        specified = self.mapFilePath != ''
-        exists = os.path.isfile(self.mapFilePath)
-        if self.mapFilePath is None or not specified or not exists:
-            while True:
-                self.mapFilePath = \
-                    QtGui.QFileDialog.getOpenFileName(
-                        self,
-                        directory=self.mapDir,
-                        caption='Load mapping file'
-                    )
-                # If cancelled, abort
-                if self.mapFilePath == '':
-                    return False
-                # If filename valid, leave loop
-                elif not os.path.isfile(self.mapFilePath):
-                    self.gui.statusbar.showMessage('Could not find mapping file', 3000)
-                    continue
-                else:
-                    break
-        
-        with open(self.mapFilePath) as f:
-            lines = f.readlines()
-            for i, line in enumerate(lines):
-                try:
-                    probe, quantity, channel, ind = line.split()
-                except:
-                    logger.error("Failed to read probe-channel mapping file" +\
-                            " {} at line {}: {}".format(self.mapFilePath, i, line))
-                    break
-        
-                # If channel doesn't start with "CH", add the prefix so LSF
-                # shotfile can be read with it
-                if not channel.startswith('CH'): channel = 'CH' + channel
-        
-                # ind is saved as str from 1-6 but must serve as an index
-                # from 0-5
-                ind = int(ind) - 1
-        
-                # Only care about probes in this segment and region and the
-                # saturation current
-                if probe.startswith(self.segment + self.region) and quantity == 'Isat':
-                    # Cut off probe segment
-                    probe = probe[1:].lower()
-                    logger.info("Found Isat for probe {} on channel {}-{}"\
-                        .format(probe,channel, ind))
-                    self.map[probe] = (channel, ind)
-
-    def getMapping(self):
-        """ 
-        Loads probe-channel mapping.
-        """
-        logger.info("Getting mappings")
-        self.map = {}
-
-        if self.use_cache:
-            try:
-                self.map = copy.deepcopy(self.cache[self.latestLSCshotnr]['mapping'])
-            except KeyError:
-                pass
-            else:
-                logger.debug("Retrieved mapping from cache")
-                return self.map
-
-        if self.menuUseLSC.isChecked():
-            shotfile = self.getShotfile("LSC")
-            self.map = self.getMappingFromShotfile(shotfile)
-        else:
-            self.getMappingFromFile()
-
-        if len(self.map) > 0:
-            logger.debug( "\n\nProbe mappings:")
-            for probe in self.map:
-                logger.debug("Probe: {:5s}Channel: {}".format(probe,self.map[probe]))
-
-            if self.use_cache:
-                self.cache[self.latestLSCshotnr]['mapping'] = self.map
-                self.saveCache()
-            return True
-        else:
-            logger.critical( "Failed to get probe-channel mapping. jsat will not be plotted")
-            return False
-
     def saveSpatialData(self):
         for p in self.plots:
             if p.type == 'spatial':
@@ -4489,57 +4744,85 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
 
     def saveAllFigures(self):
         """
-        Creates popup window with one figure showing all plots so they
-        can be saved together using the toolbar functionality.
+        Saves all spatial and temporal plots and the figures of all open
+        popup windows into a directory, one file per figure.
         """
-        fig = Figure()
-        canvas = FigureCanvas(fig)
-        spatialPlots = self.getSpatialPlots()
-        temporalPlots = self.getTemporalPlots()
-        
-        if len(temporalPlots) > 0:
-            colNum = 2
-        else:
-            colNum = 1
+        figures = [(plot.fig, self.plotFileName(plot))
+                   for plot in self.getSpatialPlots() +
+                               self.getTemporalPlots()]
+        windows = [w for w in self.findChildren(FigureWindow)
+                   if w.isVisible()]
+        for i, window in enumerate(windows):
+            # Plots broken out into a popup share their figure
+            if all(window.fig is not fig for fig, _ in figures):
+                figures.append((window.fig,
+                                '{}_popup{}'.format(self.shotnr, i + 1)))
+        self.saveFiguresTo(figures)
 
-        i = 1
-        rowNum = len(spatialPlots)
-        for plot in self.getSpatialPlots():
-            ax = plot.axes
-            ax.change_geometry(rowNum,colNum,i)
-            fig.axes.append(ax)
-            i += colNum
+    
+    def saveTemporalFigures(self):
+        """
+        Saves all temporal plots into a directory, one file per plot.
+        """
+        self.saveFiguresTo([(plot.fig, self.plotFileName(plot))
+                            for plot in self.getTemporalPlots()])
 
-        i = 2
-        rowNum = len(temporalPlots)
-        for plot in self.getTemporalPlots():
-            ax = plot.axes
-            ax.change_geometry(rowNum,colNum,i)
-            fig.axes.append(ax)
-            i += colNum
 
-        window = FigureWindow(self, fig)
-        window.show()
+    def saveFiguresTo(self, figures):
+        """
+        Saves figures, a list of (figure, file name without extension)
+        tuples, in the default format into a directory chosen in a dialog.
+        """
+        if not figures:
+            logger.warning("No figures to save")
+            return
+        directory = QtGui.QFileDialog.getExistingDirectory(
+                            self, "Save {} figures to".format(len(figures)),
+                            self.saveDir)
+        if not directory:
+            return
+        self.saveDir = str(directory)
+        self.exportFigures([(fig, os.path.join(self.saveDir,
+                                               name + self.defaultExtension))
+                            for fig, name in figures])
 
-    
-    def saveTemporalFigures(self):
+
+    def exportFigures(self, figures):
         """
-        Creates popup window with one figure showing all temporal plots so they
-        can be saved together using the toolbar functionality.
+        Saves figures, a list of (figure, path) tuples, in a pool of
+        processes so the GUI stays usable. The figures are snapshotted right
+        away and may be changed while they are saved.
         """
-        fig = Figure()
-        canvas = FigureCanvas(fig)
-        temporalPlots = self.getTemporalPlots()
-        
-        i = 1
-        rowNum = len(temporalPlots)
-        for plot in self.getTemporalPlots():
-            ax = fig.add_subplot(rowNum,1,i)
-            plot.update(fig,ax)
-            i += 1
+        QtGui.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+        try:
+            jobs = [(snapshotFigure(fig), path) for fig, path in figures]
+        finally:
+            QtGui.QApplication.restoreOverrideCursor()
+        exporter = FigureExporter(jobs, self.exportProcesses)
+        exporter.progressed.connect(self.onProgress)
+        exporter.saved.connect(self.onFigureSaved)
+        exporter.finished.connect(functools.partial(self.onFiguresExported,
+                                                    exporter))
+        self.figureExporters.append(exporter)
+        self.progBar.setValue(0)
+        self.progBar.setVisible(True)
+        self.statusbar.showMessage('Saving {} figures'.format(len(jobs)))
+        exporter.start()
+
+
+    def onFigureSaved(self, path, error):
+        if error:
+            logger.error("Saving {} failed: {}".format(path, error))
+        else:
+            logger.info("Figure saved to {}".format(path))
+
 
-        window = FigureWindow(self, fig)
-        window.show()
+    def onFiguresExported(self, exporter, saved, total):
+        self.figureExporters.remove(exporter)
+        if not self.figureExporters:
+            self.hideProgress()
+        self.statusbar.showMessage('Saved {} of {} figures'
+                                   .format(saved, total))
 
 
     def changeCELMApad(self):
@@ -4610,47 +4893,25 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
             self.statusbar.showMessage(msg)
 
 
-    def getLatestLSC(self, shotNumber):
+    def getLatestLSC(self):
         logger.info("Getting latest LSC shot number")
-        if self.use_cache:
-            try:
-                self.latestLSCshotnr = copy.deepcopy(self.cache[shotNumber]['latestLSC'])
-            except KeyError:
-                pass
-            else:
-                return self.latestLSCshotnr
-        
         self.statusbar.showMessage("Getting LSC shotfile...")
-
-        exp = str(self.comboExpLSC.currentText())
         try:
-            shotNumberLSC = dd.getLastShotNumber('LSC', shotNumber, exp)
-        except Exception, e:
+            shotNumberLSC = self.loader.openLSC()
+        except ShotDataError, e:
             self.showShotWarning(
                 "Shot could not be loaded",
                 "Latest LSC shot file could not be found",
                 "Please make sure you are connected to the internet" +
-                " and have a valid Kerberos token",
+                " and have a valid Kerberos token. You may have to " +
+                "restart the applictaion after obtaining a token",
                 details=str(e))
             return False
-        
+
         self.statusbar.showMessage("Most recent shot with LSC data before " +
                                    "this shot: {}"
                                    .format(shotNumberLSC), 3000)
-        if shotNumberLSC == 0:
-            self.showShotWarning(
-                "Shot could not be loaded",
-                "libddww method getLastShotNumber() returned 0 for the" +
-                " LSC shot file belonging to this shot.",
-                "Please make sure you are connected to the internet" +
-                " and have a valid Kerberos token. You may have to " +
-                "restart the applictaion after obtaining a token")
-            return 0
-
         self.latestLSCshotnr = shotNumberLSC
-        if self.use_cache:
-            self.cache[shotNumber]['latestLSC'] = shotNumberLSC
-            self.saveCache()
         return shotNumberLSC
         
 
@@ -4737,35 +4998,22 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
             logger.critical( "Could not read shotnumber")
             return False
 
-        if self.use_cache:
-            self.loadCache(self.shotnr)
+        cached = self.loader.open(self.shotnr)
 
         # If the shot hasn't been cached, shotfiles must be loadable
         logger.debug("use_cache: {}".format(self.use_cache))
-        logger.debug("shot cached: {}".format(self.shotnr in self.cache))
-        logger.debug("cached shots: {}".format(self.cache.keys()))
-        if self.use_cache and not self.shotnr in self.cache:
+        logger.debug("shot cached: {}".format(cached))
+        if self.use_cache and not cached:
             token = AFSutils.checkAFSToken(parent=self)
             if not token:
                 return
-        
-        # Initialize this shotnumber as a cache key so that no KeyError is
-        # raised when saving to it
-        if self.use_cache:
-            self.initCacheEntry(self.shotnr)
 
-        ok = self.getLatestLSC(self.shotnr)
+        ok = self.getLatestLSC()
         if not ok:
             logger.critical( "Failed to get latest LSC. " +
                              "Returned {}".format(ok))
             return False
 
-        # LSC data is saved to the latest LSC shot number so it has to be
-        # initialized too
-        if self.use_cache:
-            self.initCacheEntry(self.latestLSCshotnr)
-            self.loadCache(self.latestLSCshotnr)
-
         self.progBar.setValue(5)
         return True
 
@@ -4828,14 +5076,12 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
                                     filter="PNG (*.png);;EPS (*.eps);;SVG (*.svg)",
                                     selectedFilter=self.defaultFilter)
             fileName = str(fileName)
-            ok = True
-            if ok:
-                if len(fileName.split('.')) < 2:
-                    logger.error("Extension missing. Figure not saved")
-                    return
-                fmt = fileName.split('.')[-1]
-                p.fig.savefig(fileName, format=fmt)
-                self.statusbar.showMessage("Figure saves as {}".format(fileName))
+            if not fileName:
+                continue
+            if len(fileName.split('.')) < 2:
+                logger.error("Extension missing. Figure not saved")
+                return
+            self.exportFigures([(p.fig, fileName)])
     
     def saveSettings(self):
         """
@@ -4942,40 +5188,29 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
         spatQuantity = self.getSpatialPlotQuantity()
 
         size = (maximum - minimum) / incr
-        for k, i in enumerate(range(minimum, maximum, incr)):
-            k += 1
-            logger.info("Step {} of {}".format(k, size))
-            slider.setMiddle(i)
-            self.updateCELMAs()
+        try:
+            for k, i in enumerate(range(minimum, maximum, incr)):
+                k += 1
+                logger.info("Step {} of {}".format(k, size))
+                slider.setMiddle(i)
+                self.updateCELMAs()
+                if self._record:
+                    self.recordFrame(['te_T_CELMA' + str(k),
+                                      'jsat_T_CELMA' + str(k),
+                                      'ne_T_CELMA' + str(k),
+                                      spatQuantity + '_S_CELMA' + str(k)])
+                if self._stop:
+                    break
+        finally:
+            # However the sweep ends, the recording is finalized
+            self.btnPlayCELMA.setText('Play')
+            self.btnPlayCELMA.clicked.disconnect(self.stop)
+            self.btnPlayCELMA.clicked.connect(self.playCELMA)
+            self.btnRecordCELMA.setVisible(False)
+            self._playing = False
+            self._stop = False
             if self._record:
-                jFileName = os.path.join(self.recDir,
-                                         self._recDir,
-                                         'jsat_T_CELMA' + str(k) + '.svg')
-                sFileName = os.path.join(self.recDir,
-                                         self._recDir,
-                                         spatQuantity + '_S_CELMA' + str(k) + '.svg')
-                tFileName = os.path.join(self.recDir,
-                                         self._recDir,
-                                         'te_T_CELMA' + str(k) + '.svg')
-                nFileName = os.path.join(self.recDir,
-                                         self._recDir,
-                                         'ne_T_CELMA' + str(k) + '.svg')
-                self._tSavePlot.fig.savefig(tFileName, format='svg')
-                logger.debug('Saved file "{}"'.format(tFileName))
-                self._jSavePlot.fig.savefig(jFileName, format='svg')
-                logger.debug('Saved file "{}"'.format(jFileName))
-                self._nSavePlot.fig.savefig(nFileName, format='svg')
-                logger.debug('Saved file "{}"'.format(nFileName))
-                self._sSavePlot.fig.savefig(sFileName, format='svg') 
-                logger.debug('Saved file "{}"'.format(sFileName))
-            if self._stop:
-                self.btnPlayCELMA.setText('Play')
-                self.btnPlayCELMA.clicked.disconnect(self.stop)
-                self.btnPlayCELMA.clicked.connect(self.playCELMA)
-                self.btnRecordCELMA.setVisible(False)
-                self._playing = False
-                self._stop = False
-                break
+                self.stopRecording()
 
 
     def stop(self):
@@ -4991,23 +5226,16 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
             _start = self.dtime[self.xTimeSlider.value()]
             _stop = self.dtime[self.xTimeSlider.maximum()]
             
-        now = (str(datetime.datetime.now())
-               .split('.')[0]
-               .replace(' ', '_')
-               .replace(':', '-'))
-        self._recDir = ('{}_{:.0f}-{:.0f}_{}'
-                        .format(self.shotnr, _start*100, _stop*100,
-                                now))
         quantity = self.getSpatialPlotQuantity()
         self._jSavePlot = self.getPlotsByType('temporal', 'jsat')
         self._tSavePlot = self.getPlotsByType('temporal', 'te')
         self._nSavePlot = self.getPlotsByType('temporal', 'ne')
         self._sSavePlot = self.getPlotsByType('spatial', quantity)
-        path = os.path.join(self.recDir, self._recDir)
-        if not os.path.isdir(path):
-            os.makedirs(path)
+        path = self.recordingPath(_start, _stop)
         # Make sure directory exists before starting to record
         if os.path.isdir(path):
+            self.recorder = Recorder(path, self.recordFormat, self.recordFPS,
+                                     self.recordQueueSize)
             self._record = True
             self.btnRecord.setText('Stop recording')
             try:
@@ -5020,8 +5248,247 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
             self.btnRecordCELMA.clicked.connect(self.stopRecording)
 
 
+    def recordingPath(self, start, end):
+        """
+        Creates and returns a new directory in the recordings directory,
+        named after the shot, the time range and the current time.
+        """
+        now = (str(datetime.datetime.now())
+               .split('.')[0]
+               .replace(' ', '_')
+               .replace(':', '-'))
+        self._recDir = ('{}_{:.0f}-{:.0f}_{}'
+                        .format(self.shotnr, start*100, end*100,
+                                now))
+        path = os.path.join(self.recDir, self._recDir)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        return path
+
+
+    def exportCELMAsweep(self):
+        """
+        Renders the frames playCELMA would record, one per POI between the
+        low and high handle of the POI slider, off-screen into a new
+        directory in the recordings directory. The frames are computed from
+        the current CELMA settings in a background thread and rendered in a
+        pool of processes, so the GUI stays usable meanwhile. Called again
+        during an export, the export is stopped.
+        """
+        if self.sweepExporter is not None:
+            self.sweepExporter.stop()
+            logger.info("Stopping the CELMA sweep export")
+            return
+        if not self.CELMAexists or self.multiplePOIs:
+            logger.error("Exporting a sweep requires a spatial CELMA at a "
+                         "single POI")
+            return
+        settings = self.getCELMAsettings()
+        if settings is None:
+            logger.error("Error getting CELMA settings")
+            return
+        unit, _, sweep = self.getCELMAPOIs()
+        phases = sweep[1:-1]
+        quantity = self.getSpatialPlotQuantity()
+        plot = self.getSpatialPlots(quantity)
+        if plot is None or not phases:
+            logger.error("Nothing to export: no {} spatial plot or no POIs "
+                         "between the slider handles".format(quantity))
+            return
+
+        # Everything but the CELMAs and the POI markers is the same in all
+        # frames and drawn once per worker process
+        scenes = []
+        temporal = []
+        for q in ('te', 'jsat', 'ne'):
+            _plot = self.getTemporalPlots(q)
+            if _plot is not None:
+                name = q + '_T_CELMA'
+                scenes.append(panelScene(_plot.fig, name, _plot.POImarkers))
+                temporal.append(name)
+        exclude = list(plot.fits) + [plot.fit]
+        for artist in plot.CELMAs:
+            if isinstance(artist, mpl.container.Container):
+                exclude.extend(artist.get_children())
+            else:
+                exclude.append(artist)
+        spatial = quantity + '_S_CELMA'
+        scenes.append(panelScene(plot.fig, spatial, exclude))
+
+        options = {
+            'spatial': spatial,
+            'temporal': temporal,
+            'probes': [(p.name, p.color) for p in plot.probes if p.CELMA],
+            'marker': 'd' if self.menuShowData.isChecked() else 'None',
+            'color': 'r',
+            'alpha': plot.CELMAalpha,
+            'average': plot.showCELMAAvg,
+            'showErrors': self.menuShowErrors.isChecked(),
+            'fitMethod': plot.fitMethod if self.menuFit.isChecked() else
+                         'none',
+            'markPOIs': self.menuMarkPOIsInTemporal.isChecked(),
+            'temporalCELMAs': self.cbTemporalCELMAs.isChecked(),
+            'normalize': self.cbCELMAnormalize.isChecked(),
+            'ignore': list(self.ignoreELMs),
+            'range': self.Dt}
+        start, end, ELMnum = settings
+        path = self.recordingPath(start, end)
+        compute = functools.partial(self.CELMAsweepFrames, plot, start, end,
+                                    ELMnum, unit, phases, options)
+        self.sweepExporter = SweepExporter(compute, scenes, path,
+                                           self.exportProcesses)
+        self.sweepExporter.progressed.connect(self.onProgress)
+        self.sweepExporter.finished.connect(self.onSweepExported)
+        self.progBar.setValue(0)
+        self.progBar.setVisible(True)
+        self.statusbar.showMessage('Exporting CELMA sweep of {} POIs to {}'
+                                   .format(len(phases), path))
+        self.sweepExporter.start()
+
+
+    def CELMAsweepFrames(self, plot, start, end, ELMnumber, unit, phases,
+                         options):
+        """
+        Artists of the frames of a CELMA sweep over `phases` for
+        renderFrames: the CELMA of spatial plot `plot` at every phase as
+        createSpatialCELMA draws it for a single POI and, if enabled, the
+        POI markers of the temporal plots. options holds the display
+        settings read by exportCELMAsweep. Touches neither widgets nor axes.
+        """
+        cube = plot.createCELMAcube(start, end, phases, options['range'],
+                                    unit)
+        if cube is None:
+            return []
+        selected = plot.CELMAselection(cube.ELMonsets, ELMnumber,
+                                       options['ignore'])
+        if not selected.any():
+            logger.critical("No ELMs in specified range {}s-{}s"
+                            .format(start, end))
+            return []
+        color = options['color']
+        marker = options['marker']
+        frames = []
+        profiles = []
+        for phase in phases:
+            result = cube.frame(phase, selected)
+            specs = []
+            xfit = []
+            yfit = []
+            for probe, probeColor in options['probes']:
+                locs = np.concatenate([result['positions'][POI][probe]
+                                       for POI in result['POIs']])
+                vals = np.concatenate([result['data'][POI][probe]
+                                       for POI in result['POIs']])
+                specs.append(('scatter', (locs, vals),
+                              {'color': probeColor, 'marker': marker,
+                               'alpha': options['alpha']}))
+                if not options['average']:
+                    xfit.extend(locs)
+                    yfit.extend(vals)
+                    continue
+                x = np.nanmean(locs)
+                y = np.nanmedian(vals)
+                errors = {}
+                if options['showErrors']:
+                    # Median absolute deviation as in coherentELMaveraging
+                    errors = {
+                        'xerr': np.nanmedian(np.abs(locs - np.nanmean(locs))),
+                        'yerr': np.nanmedian(np.abs(vals - np.nanmean(vals)))}
+                specs.append(('errorbar', (x, y),
+                              dict(errors, marker='o', color=color,
+                                   elinewidth=2, capsize=3, capthick=2)))
+                xfit.append(x)
+                yfit.append(y)
+
+            POI = phase * 1000 if unit == '0.1 ms' else phase
+            specs.append(('text', (0.8, 0.9, '@ {}{}'.format(
+                                        POI, unit.split()[-1])),
+                          {'axesCoords': True}))
+            frame = {options['spatial']: specs}
+
+            if options['markPOIs']:
+                if not options['temporalCELMAs']:
+                    POIs = result['POIs']
+                elif options['normalize']:
+                    POIs = [phase]
+                else:
+                    POIs = result['POIsShifted']
+                markers = [('axvline', (POI,), {'color': color, 'alpha': 0.5,
+                                                'lw': 3, 'ls': '-.'})
+                           for POI in POIs]
+                for name in options['temporal']:
+                    frame[name] = markers
+            frames.append(frame)
+            profiles.append(FitFunctions.canonicalProfile(
+                                np.array(xfit, dtype=float),
+                                np.array(yfit, dtype=float)))
+
+        method = options['fitMethod']
+        if method == 'none':
+            return frames
+        label = method.capitalize() + ' fit'
+        if method in ('eich', 'Eich'):
+            # Neighbouring phases are fitted warm-started in a process pool
+            params, status = self.cachedEichFits(plot, profiles)
+        for k, (frame, (x, y)) in enumerate(zip(frames, profiles)):
+            if y.size == 0:
+                continue
+            if method in ('eich', 'Eich'):
+                if status[k] != BatchFitter.OK:
+                    continue
+                xft = np.arange(np.min(x), np.max(x), 1/float(plot.fitNum))
+                yft = FitFunctions.evaluate(xft, params[k], plot.detachedFit)
+            else:
+                fit = plot.findFit(x, y, method=method)
+                if fit is None:
+                    continue
+                xft, yft = fit
+            frame[options['spatial']].append(('plot', (xft, yft, color),
+                                              {'label': label}))
+        return frames
+
+
+    def onSweepExported(self, done, total):
+        path = self.sweepExporter.path
+        self.sweepExporter = None
+        self.hideProgress()
+        if total and done == total:
+            self.statusbar.showMessage('CELMA sweep exported')
+            logger.info("Exported {} frames of the CELMA sweep to {}"
+                        .format(done, path))
+        else:
+            logger.warning("Exported {} of {} frames of the CELMA sweep to {}"
+                           .format(done, total, path))
+
+
+    def recordFrame(self, names):
+        """
+        Queues the current state of the te, jsat, ne and spatial plots as a
+        frame of the recording. names are the file names of the plots in
+        this order, used when recording single images.
+        """
+        plots = (self._tSavePlot, self._jSavePlot, self._nSavePlot,
+                 self._sSavePlot)
+        try:
+            self.recorder.grab([plot.canvas for plot in plots], names)
+        except IOError, e:
+            logger.error("Recording failed: {}".format(e))
+            self.stopRecording()
+
     def stopRecording(self):
         self._record = False
+        if self.recorder is not None:
+            QtGui.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+            try:
+                if self.recorder.close():
+                    logger.info("Recorded {} frames to {}".format(
+                        self.recorder.frames, self.recorder.path))
+                else:
+                    logger.error("Recording failed: {}"
+                                 .format(self.recorder.error))
+            finally:
+                QtGui.QApplication.restoreOverrideCursor()
+            self.recorder = None
         self.btnRecord.setText('Record')
         self.btnRecord.clicked.disconnect(self.stopRecording)
         self.btnRecord.clicked.connect(self.record)
@@ -5043,27 +5510,25 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
         minimum= slider.value()
         maximum= slider.maximum()
         incr = self.playIncrement
-        for i in range(minimum,maximum,incr):
-            slider.setValue(i)
+        try:
+            for i in range(minimum,maximum,incr):
+                slider.setValue(i)
+                if self._record:
+                    time = str(self.dtime[slider.value()])
+                    self.recordFrame(['te_T_' + time, 'jsat_T_' + time,
+                                      'ne_T_' + time, 'jsat_S_' + time])
+                if self._stop:
+                    break
+        finally:
+            # However playing ends, the recording is finalized
+            self.btnPlay.setText('Play')
+            self.btnPlay.clicked.disconnect(self.stop)
+            self.btnPlay.clicked.connect(self.play)
+            self.btnRecord.setVisible(False)
+            self._playing = False
+            self._stop = False
             if self._record:
-                time = self.dtime[slider.value()]
-                tFileName = os.path.join(self.recDir,self._recDir,'te_T_'+str(time)+'.png')
-                nFileName = os.path.join(self.recDir,self._recDir,'ne_T_'+str(time)+'.png')
-                jFileName = os.path.join(self.recDir,self._recDir,'jsat_T_'+str(time)+'.png')
-                sFileName = os.path.join(self.recDir,self._recDir,'jsat_S_'+str(time)+'.png')
-                self._tSavePlot.fig.savefig(tFileName, format='png')
-                self._jSavePlot.fig.savefig(jFileName, format='png')
-                self._nSavePlot.fig.savefig(nFileName, format='png')
-                self._sSavePlot.fig.savefig(sFileName, format='png') 
-            if self._stop or i == maximum - 1:
-                self.btnPlay.setText('Play')
-                self.btnPlay.clicked.disconnect(self.stop)
-                t(self.play)
-                self.btnRecord.setVisible(False)
-                self._playing = False
-                self._stop = False
-                self._record = False
-                break
+                self.stopRecording()
 
 
     def updateCELMAs(self, ptype=None):
@@ -5117,6 +5582,131 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
         QtGui.QApplication.restoreOverrideCursor()
 
 
+    def collectCELMAjobs(self, ptype=None):
+        """
+        Returns the CELMA computations that createSpatialCELMA and
+        createTemporalCELMA would perform with the current settings, split
+        into stages for CELMAworker, and the spatial plots with the cache
+        keys of the CELMA cubes built for them. Returns None if the settings
+        are invalid.
+        """
+        settings = self.getCELMAsettings()
+        if settings is None:
+            return
+        start, end, ELMnum = settings
+        cubes = []
+        jobs = []
+        plotCubes = []
+        if ptype is None or ptype == 'spatial':
+            unit, POIsRel, sweep = self.getCELMAPOIs()
+            for plot in self.getSpatialPlots():
+                cube = plot.CELMAcubeJob(start, end, sweep, self.Dt, unit)
+                cubes.append(cube)
+                plotCubes.append((plot, cube[0]))
+                for POIrelative in POIsRel:
+                    jobs.append(plot.CELMAjob(start, end, ELMnum, POIrelative,
+                                              self.Dt, unit, self.ignoreELMs,
+                                              cube[0]))
+
+        if ((ptype is None or ptype == 'temporal') and
+                self.cbTemporalCELMAs.isChecked()):
+            normalize = self.cbCELMAnormalize.isChecked()
+            compare = str(self.comboELMcompare.currentText())
+            binning = self.menuEnableBinning.isChecked()
+            for plot in self.getTemporalPlots():
+                for probe in plot.probes:
+                    if probe.CELMA:
+                        cubes.append(plot.CELMAjob(start, end, probe.name,
+                                                   normalize, compare,
+                                                   binning=binning))
+        return [cubes, jobs], plotCubes
+
+
+    def prefetchCELMAs(self, callback, ptype=None):
+        """
+        Computes the CELMAs for the current settings in a CELMAworker and
+        calls `callback` in the GUI thread once they are cached, so that it
+        only has to create the artists. A prefetch that is still running is
+        cancelled first, as its settings are outdated.
+        """
+        self.cancelCELMAs()
+        collected = self.collectCELMAjobs(ptype)
+        if collected is None or not any(collected[0]):
+            callback()
+            return
+        stages, self._CELMAcubes = collected
+        self._CELMAgeneration += 1
+        self._CELMAcallback = callback
+        self.CELMAworker = CELMAworker(self.CELMAcache, stages,
+                                       self._CELMAgeneration,
+                                       self.CELMAthreads)
+        self.CELMAworker.progressed.connect(self.onProgress)
+        self.CELMAworker.finished.connect(self.onCELMAsPrefetched)
+        self.progBar.setValue(0)
+        self.progBar.setVisible(True)
+        self.statusbar.showMessage('Performing coherent ELM averaging')
+        self.CELMAworker.start()
+
+
+    def cancelCELMAs(self):
+        """ Stops a running CELMA prefetch. Its results are discarded. """
+        if self.CELMAworker is None:
+            return False
+        running = self.CELMAworker.is_alive()
+        self.CELMAworker.stop()
+        self.CELMAworker = None
+        self._CELMAcallback = None
+        self._CELMAcubes = []
+        self.hideProgress()
+        if running:
+            self.statusbar.showMessage('Coherent ELM averaging cancelled')
+        return running
+
+
+    @QtCore.pyqtSlot(int)
+    def onCELMAsPrefetched(self, generation):
+        # Results of cancelled or superseded prefetches are not rendered
+        if (generation != self._CELMAgeneration or
+                self._CELMAcallback is None):
+            return
+        callback = self._CELMAcallback
+        self._CELMAcallback = None
+        self.CELMAworker = None
+        self.hideProgress()
+        # The cubes built off-thread become the plots' cubes only here, so
+        # worker threads never see a plot's cube change
+        for plot, key in self._CELMAcubes:
+            plot.useCELMAcube(key)
+        self._CELMAcubes = []
+        QtGui.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+        try:
+            callback()
+        finally:
+            QtGui.QApplication.restoreOverrideCursor()
+
+
+    def requestCELMAtoggle(self):
+        """
+        Interactive counterpart of toggleCELMAs. CELMAs are computed off the
+        GUI thread before they are shown. Toggling again while they are
+        computed cancels the computation.
+        """
+        if self.cancelCELMAs():
+            return
+        if self.CELMAexists:
+            self.toggleCELMAs()
+        else:
+            self.prefetchCELMAs(self.toggleCELMAs)
+
+
+    def requestCELMAupdate(self, ptype=None):
+        """ Interactive counterpart of updateCELMAs """
+        if not self.CELMAexists or self.CELMAupdateDisabled:
+            return
+        self.prefetchCELMAs(functools.partial(self.updateCELMAs, ptype),
+                            ptype)
+
+
     def getELMs(self, start, end):
         ind = ((start <= self.ELMonsets) & (self.ELMonsets <= end) &
                ~np.in1d(self.ELMonsets, self.ignoreELMs))
@@ -5303,6 +5893,41 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
         self.activateXtimeSlider()
 
 
+    def cachedEichFits(self, plot, profiles):
+        """
+        Eich fit parameters of the canonical profiles, a list of (x, y)
+        tuples, with the fit settings of spatial plot `plot`. Profiles in
+        the fit cache are looked up, the others are fitted in a process pool
+        in the given order and cached. Returns the parameters and the
+        BatchFitter status of every profile. May run in a worker thread.
+        """
+        keys = [('eich', arrayHash(x, y), plot.detachedFit,
+                 plot.fitLogSpace) for x, y in profiles]
+        params = [self.fitCache.get(key) for key in keys]
+        missing = [i for i, ft in enumerate(params) if ft is None]
+        status = np.full(len(profiles), BatchFitter.OK, dtype=int)
+        if not missing:
+            return params, status
+
+        fitter = BatchFitter(processes=self.fitProcesses,
+                             detachment=plot.detachedFit,
+                             logSpace=plot.fitLogSpace)
+        _, newParams, newStatus = fitter.fit(
+                np.arange(len(missing)), [profiles[i] for i in missing])
+        for i, ft, st in zip(missing, newParams, newStatus):
+            params[i] = ft
+            status[i] = st
+            if st == BatchFitter.OK:
+                self.fitCache.put(keys[i], ft)
+        failed = np.count_nonzero(status != BatchFitter.OK)
+        logger.info("Fitted {} of {} profiles in {:.2f}s ({:.0f} fits/s), "
+                    "{} failed".format(len(missing), len(profiles),
+                                       fitter.elapsed, fitter.rate, failed))
+        logger.info("Fit statistics: {}"
+                    .format(FitFunctions.summary(fitter.statistics)))
+        return params, status
+
+
     def plotMaximaDistances(self):
         QtGui.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
         try:
@@ -5320,12 +5945,13 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
 
         timeData = next((plot.rawdata[key]['time'] for key in plot.rawdata),
                         None)
-        if not timeData:
+        if timeData is None or len(timeData) == 0:
             logger.error("No time data found")
+            QtGui.QApplication.restoreOverrideCursor()
             return
         timeData = Conversion.removeNans(timeData)
         ind = np.where((start <= timeData) & (timeData <= end))
-        times = timeData[ind]#[::self.Dt]
+        times = timeData[ind][::max(self.distancesDecimation, 1)]
         
         ind = np.where((start <= self.ELMonsets) & (self.ELMonsets <= end) 
                                         & ~np.in1d(self.ELMonsets,self.ignoreELMs))
@@ -5333,7 +5959,6 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
         ELMends = self.ELMends[ind][:ELMnum]
         ELMtoELM = self.ELMtoELM[ind][:ELMnum]
 
-        size = float(len(times))
         #positionsRZ = plot.getProbePositions()
         means = self.radioDistancesMeans.isChecked()
         medians = self.radioDistancesMedians.isChecked()
@@ -5342,58 +5967,69 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
         normalize = self.cbCELMAnormalize.isChecked()
         fitMethod = plot.fitMethod
 
-        maximaTimes = []
-        maximaValues = []
-        profilesXdata = []
-        profilesYdata = []
-
-        for i, _time in enumerate(times):
-            data, timeRange = plot.getDataInTimeWindow(plot.rawdata, _time, self.Dt)
-            #positions = plot.rztods(positionsRZ, timeRange)
-            positions = plot.getDeltaS(timeRange)
-            data, positions = plot.averageData(data, positions)
-            
-            dataToFit = []
-            possToFit = []
-            for key in data:
-                d = data[key]
-                p = positions[key]
-                if medians:
-                    p = np.median(p[~np.isnan(d)])
-                    d = np.median(d[~np.isnan(d)])
-                    dataToFit.append(d)
-                    possToFit.append(p)
-                elif means:
-                    p = np.mean(p[~np.isnan(d)])
-                    d = np.mean(d[~np.isnan(d)])
-                    dataToFit.append(d)
-                    possToFit.append(p)
-                else:
-                    dataToFit.extend(d)
-                    possToFit.extend(p)
-
-            if fitting:
-                scale = max(dataToFit)
-                dataToFit = [el/scale for el in dataToFit]
-                time = self.dtime[self.xTimeSlider.value()]
-                fit = plot.findFit(time, dataToFit, possToFit, method=fitMethod)
+        # Profiles of all windows at once, shape (times, groups) per probe
+        data, probeTimes, positions = plot.regionData()
+        centers = nearestIndices(plot.timeArray, times)
+        averages, distances, exists = windowAverages(
+                centers, data, probeTimes, positions, self.ssl, self.Dt,
+                plot.avgNum, plot.ignoreNans)
+        reducer = 'median' if medians else 'mean' if means else None
+        profileData, profileDistances = probeProfiles(averages, distances,
+                                                      exists, reducer)
+
+        if not fitting:
+            # Maxima tracking needs no per-window work at all
+            maximaValues = profileMaxima(profileData, profileDistances)
+            ok = ~np.isnan(maximaValues)
+            maximaTimes = times[ok]
+            maximaValues = maximaValues[ok]
+            profilesXdata = profileDistances[ok]
+            profilesYdata = profileData[ok]
+        else:
+            maximaTimes = []
+            maximaValues = []
+            profilesXdata = []
+            profilesYdata = []
+            profiles = []
+            for i in range(len(times)):
+                ok = ~np.isnan(profileData[i])
+                profiles.append((profileDistances[i][ok], profileData[i][ok]))
+
+        if fitting and fitMethod in ('eich', 'Eich'):
+            # Profiles fitted before, interactively or in an earlier run,
+            # are taken from the fit cache
+            profiles = [FitFunctions.canonicalProfile(x, y)
+                        for x, y in profiles]
+            params, status = self.cachedEichFits(plot, profiles)
+            for _time, (x, _), ft, st in zip(times, profiles, params, status):
+                if st != BatchFitter.OK:
+                    continue
+                x = x[~np.isnan(x)]
+                fitx = np.arange(np.min(x), np.max(x), 1/float(plot.fitNum))
+                fity = FitFunctions.evaluate(fitx, ft, plot.detachedFit)
+                fitx = fitx[~np.isnan(fity)]
+                fity = fity[~np.isnan(fity)]
+                if fity.size == 0:
+                    continue
+                profilesXdata.append(fitx)
+                profilesYdata.append(fity)
+                maximaValues.append(fitx[np.argmax(fity)])
+                maximaTimes.append(_time)
+        elif fitting:
+            for _time, (possToFit, dataToFit) in zip(times, profiles):
+                if dataToFit.size == 0:
+                    continue
+                fit = plot.findFit(possToFit, dataToFit, method=fitMethod)
                 if fit is None:
                     logger.critical( "Fitting failed for unknown reason: did not return any data")
                     continue
-                
                 fitx, fity = fit
                 fitx = fitx[~np.isnan(fity)]
-                fity = fity[~np.isnan(fity)]*scale
-                maxx = fitx[np.argmax(fity)]
+                fity = fity[~np.isnan(fity)]
                 profilesXdata.append(fitx)
                 profilesYdata.append(fity)
-            else:
-                maxx = possToFit[np.argmax(dataToFit)]
-                profilesXdata.append(possToFit)
-                profilesYdata.append(dataToFit)
-
-            maximaValues.append(maxx)
-            maximaTimes.append(_time)
+                maximaValues.append(fitx[np.argmax(fity)])
+                maximaTimes.append(_time)
             
         if len(maximaValues) == 0:
             logger.critical("No maxima data to plot")
@@ -5447,8 +6083,10 @@ class ApplicationWindow(QMainWindow, Ui_MainWindow):
             for x, y in zip(profilesXdata, profilesYdata):
                 newAx.plot(x,y)
         else:
-            for x, y in zip(profilesXdata, profilesYdata):
-                newAx.scatter(x,y)
+            # One scatter for all profiles, coloured by time
+            newAx.scatter(profilesXdata.ravel(), profilesYdata.ravel(),
+                          c=np.repeat(maximaTimes, profilesXdata.shape[1]),
+                          marker='.')
 
         QtGui.QApplication.restoreOverrideCursor()
         self.popout.update()
@@ -5994,53 +6632,83 @@ class Plot(QObject):
             scatter.set_visible(True)
 
 
-    def averagesInBins(self, n, x, y, avgMethod=None, noZeros=False):
+    def averagesInBins(self, n, x, y, avgMethod=None, noZeros=False,
+                       spread=None, full=False, binner=None):
         """
-        Creates `n` bins in which the averages of `x`and `y` are respectively
-        calculated. If noZeros is true, averages evaluating to zero will be
-        filtered. Expects arrays to be ordered by x
+        Creates `n` bins in which the averages of `y` are calculated. The bin
+        positions are the bin centers along `x`. If noZeros is true, averages
+        evaluating to zero will be filtered. `avgMethod` can be any numpy
+        reducer name, 'percentile<q>' or a callable. `spread` ('std' or 'mad')
+        is computed in the same pass. If `full` is true, bin counts and
+        spreads are returned too. Arrays need not be ordered. If an
+        ELMAggregate is passed as `binner`, its selected data is reduced
+        instead of x and y.
         """
         if avgMethod is None:
             avgMethod = self.avgMethod
 
         try:
-            _avgfunc = getattr(np, avgMethod)
-        except AttributeError:
+            Binning.parseReducer(avgMethod)
+        except ValueError:
             logger.error("Invalid average method. Use a numpy method."+\
                             " Continuing with np.median")
-            _avgFunc = np.median
-            
-        x = Conversion.removeNans(x,y)
-        y = Conversion.removeNans(y)
-
-        bins = np.linspace(min(x),max(x),n+1)
-        avgs = np.zeros(len(bins)-1)
-        t = np.zeros(len(bins)-1)
-        
-        for i, (left, right) in enumerate(zip(bins[:-1],bins[1:])):
-            t[i] = (left + right)/2
-            ind = np.where((left <= x) & (x <=right))[0]
-            if len(y[ind]) == 0:
-                logger.warn("{} {} plot: No data points in bin {} [{},{}]"
-                             .format(self.type, self.quantity, i+1, left, right))
-                avgs[i] = 0
-            else:
-                avgs[i] = _avgfunc(y[ind])
-
-        avgs = avgs[t.argsort()]
-        t = t[t.argsort()]
+            avgMethod = 'median'
 
-        if len(avgs) == 0:
+        if binner is not None:
+            result = binner.reduce(avgMethod, spread=spread)
+        else:
+            result = Binning.reduce(n, x, y, avgMethod, spread=spread)
+        if result is None:
             logger.error("No averages found")
             return
+        t, avgs, counts, spreads = result
 
-        if noZeros:
-            t = t[avgs!=0]
-            avgs = avgs[avgs!=0]
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            logger.warn("{} {} plot: No data points in {} of {} bins"
+                        .format(self.type, self.quantity, len(empty), n))
 
+        if noZeros:
+            nonzero = avgs != 0
+            t = t[nonzero]
+            avgs = avgs[nonzero]
+            counts = counts[nonzero]
+            if spreads is not None:
+                spreads = spreads[nonzero]
+
+        if full:
+            return t, avgs, counts, spreads
         return t, avgs
 
 
+    def CELMAselection(self, ELMonsets, ELMnumber=None, ignore=[]):
+        """
+        Boolean mask of the ELMs in `ELMonsets` to synchronize: the first
+        `ELMnumber` ELMs that are not in `ignore`.
+        """
+        selected = ~np.in1d(ELMonsets, ignore)
+        if ELMnumber is not None:
+            selected[np.flatnonzero(selected)[ELMnumber:]] = False
+        return selected
+
+
+    def cachedCELMA(self, key, compute):
+        """
+        Returns the CELMA result stored under `key` in the GUI's CELMA cache.
+        If there is none, `compute` is called and its result cached.
+        """
+        cache = self.gui.CELMAcache
+        result = cache.get(key)
+        if result is not None:
+            logger.debug("CELMA retrieved from cache ({})"
+                         .format(cache.stats()))
+            return result
+        result = compute()
+        if result is not None:
+            cache.put(key, result)
+        return result
+
+
     def clear(self):
         """
             Removes all graphs and legends from the plot. Less intrusive than
@@ -6190,6 +6858,7 @@ class SpatialPlot(Plot):
         self.showCELMAAvg = config['CELMA']['showAverages']
         self.CELMAalpha = config['CELMA']['alpha']
         self.detachedFit = config['detachedFit']
+        self.fitLogSpace = config['fitLogSpace']
         self.rawdata = data
         self.getProbes(data)
         self.timeArray = self.getTimeArray(self.rawdata)
@@ -6215,6 +6884,8 @@ class SpatialPlot(Plot):
         self.type = 'spatial'
         self.timeRange = []
         self.fits = []
+        # (cache key, CELMACube) pair, only replaced as a whole
+        self.CELMAcube = None
 
         self.strikeline = self.axes.axvline(
                             0,0,1,ls='--',lw='4',color='grey', alpha=.7,
@@ -6299,17 +6970,201 @@ class SpatialPlot(Plot):
         plot.comparePlots[probe] = p
 
 
+    def CELMAjob(self, start, end, ELMnumber, POIrelative, range, unit,
+                 ignore=[], cubeKey=None):
+        """
+        Returns the cache key and the computation of the spatial CELMA at
+        POIrelative. The computation does not touch the axes and may run in
+        a worker thread. It looks the POI up in the CELMA cube cached under
+        `cubeKey` if there is one, see CELMAcubeJob.
+        """
+        # The ignored ELMs may change while the computation is pending
+        ignore = list(ignore)
+        key = self.CELMAcacheKey(start, end, ELMnumber, POIrelative, range,
+                                 unit, ignore)
+        return key, functools.partial(self.computeCELMA, start, end,
+                                      ELMnumber, POIrelative, range, unit,
+                                      ignore, cubeKey)
+
+
+    def CELMAcubeJob(self, start, end, POIsRelative, range, unit):
+        """
+        Returns the cache key and the computation of the CELMA cube at the
+        POIs in POIsRelative. The computation neither touches the axes nor
+        replaces the plot's cube, so it may run in a worker thread.
+        useCELMAcube adopts the cached cube in the GUI thread.
+        """
+        POIsRelative = list(POIsRelative)
+        key = ('cube', self.CELMAcacheKey(start, end, None, None, range, unit,
+                                          []), tuple(POIsRelative))
+        return key, functools.partial(self.computeCELMAcube, start, end,
+                                      POIsRelative, range, unit)
+
+
+    def CELMAcacheKey(self, start, end, ELMnumber, POIrelative, range, unit,
+                      ignore):
+        """
+        Cache key of a spatial CELMA. Contains every parameter the result of
+        computeCELMA depends on.
+        """
+        return ('spatial', self.gui.shotnr, self.quantity, self.region,
+                tuple(sorted(p.name for p in self.probes if p.CELMA)),
+                start, end, ELMnumber, tuple(sorted(ignore)), POIrelative,
+                unit, range, self.avgNum, self.ignoreNans)
+
+
+    def selectCELMAELMs(self, start, end):
+        """
+        Returns the onsets of all ELMs in [start, end] and their ELM-to-ELM
+        durations. The durations are preceded by the one of the ELM before
+        the first onset, needed for negative POIs. Returns None if there are
+        no ELMs in range.
+        """
+        ### Finding ELM times in range
+        # Pad the index array for ELMtoELM so that the (i-1)th element is
+        # included in case POIrelative is negative. np.where returns tuple.
+        ind = np.where((self.ELMonsets >= start) & (self.ELMonsets <= end))
+        if len(ind[0]) == 0:
+            logger.critical("No ELMs in specified range {}s-{}s".format(start,end))
+            return
+        durInd = np.pad(ind[0], (1,0), 'constant', constant_values = ind[0][0]-1)
+        ELMonsets = self.ELMonsets[ind]
+        ELMtoELM = self.ELMtoELM[durInd]
+        return ELMonsets, ELMtoELM
+
+
+    def regionData(self):
+        """
+        Returns the raw data and time arrays as well as the absolute
+        positions of the probes in the plot's region, keyed by probe name.
+        """
+        data = {}
+        times = {}
+        for probe, probeData in self.rawdata.iteritems():
+            if probe.startswith(self.region):
+                if len(probe.split('-')) == 2:
+                    probe = probe.split('-')[-1]
+                data[probe] = probeData['data']
+                times[probe] = probeData['time']
+        positions = dict((p.name, p.position) for p in self.probes
+                         if p.name in data)
+        return data, times, positions
+
+
+    def createCELMAcube(self, start, end, POIsRelative, range, unit):
+        """
+        Returns a CELMACube holding the CELMAs of all ELMs in [start, end] at
+        the POIs in POIsRelative or None if there are no ELMs in range.
+        """
+        ELMs = self.selectCELMAELMs(start, end)
+        if ELMs is None:
+            return
+        ELMonsets, ELMtoELM = ELMs
+        data, times, positions = self.regionData()
+        return CELMACube(POIsRelative, ELMonsets, ELMtoELM, unit,
+                         self.timeArray, data, times, positions,
+                         self.gui.ssl, range, self.avgNum, self.ignoreNans)
+
+
+    def buildCELMAcube(self, start, end, POIsRelative, range, unit):
+        """
+        Precomputes the spatial CELMAs at all POIs in POIsRelative at once.
+        computeCELMA then serves these POIs from the cube as long as the
+        time window and averaging settings stay the same, whichever ELMs are
+        selected. Nothing is done if the current cube already covers them.
+        Must be called in the GUI thread.
+        """
+        key = self.CELMAcacheKey(start, end, None, None, range, unit, [])
+        self.CELMAcube = (key, self.computeCELMAcube(start, end, POIsRelative,
+                                                     range, unit))
+
+
+    def computeCELMAcube(self, start, end, POIsRelative, range, unit):
+        """
+        Returns the current CELMA cube if it covers the POIs in POIsRelative
+        for these settings and a new one otherwise. Does not replace the
+        plot's cube.
+        """
+        cube = self.matchingCELMAcube(start, end, POIsRelative, range, unit)
+        if cube is not None:
+            return cube
+        tstart = time.time()
+        cube = self.createCELMAcube(start, end, POIsRelative, range, unit)
+        if cube is not None:
+            logger.debug("Built CELMA cube of {} POIs and {} ELMs in {:.3f}s"
+                         .format(len(POIsRelative), len(cube.ELMonsets),
+                                 time.time() - tstart))
+        return cube
+
+
+    def matchingCELMAcube(self, start, end, POIsRelative, range, unit,
+                          cubeKey=None):
+        """
+        Returns the plot's CELMA cube or, failing that, the one cached under
+        `cubeKey` if it was built with these settings and covers the POIs in
+        POIsRelative. Returns None otherwise.
+        """
+        key = self.CELMAcacheKey(start, end, None, None, range, unit, [])
+        # Read once, the GUI thread replaces key and cube together
+        current = self.CELMAcube
+        if current is not None and current[0] == key:
+            cube = current[1]
+            if cube is not None and cube.covers(POIsRelative):
+                return cube
+        if cubeKey is not None and cubeKey[1] == key:
+            cube = self.gui.CELMAcache.get(cubeKey)
+            if cube is not None and cube.covers(POIsRelative):
+                return cube
+
+
+    def useCELMAcube(self, cubeKey):
+        """
+        Makes the cube cached under `cubeKey` by a CELMAworker the plot's
+        CELMA cube. Must be called in the GUI thread.
+        """
+        cube = self.gui.CELMAcache.get(cubeKey)
+        if cube is not None:
+            self.CELMAcube = (cubeKey[1], cube)
+
+
+    def computeCELMA(self, start, end, ELMnumber, POIrelative, range, unit,
+                     ignore=[], cubeKey=None):
+        """
+        Extracts the averaged data and their strikeline distances at one POI
+        relative to each ELM in [start, end]. Does not touch the axes.
+
+        Returns a dictionary with the POIs in real time ('POIs'), the POIs
+        relative to the ELM onsets ('POIsShifted') as well as the data
+        ('data') and positions ('positions') of every probe at every POI,
+        both of the form dict[POI][probe]. Returns None if there are no ELMs
+        in range. POIs covered by the CELMA cube, or the one cached under
+        `cubeKey`, are looked up there.
+        """
+        cube = self.matchingCELMAcube(start, end, [POIrelative], range, unit,
+                                      cubeKey)
+        if cube is None:
+            cube = self.createCELMAcube(start, end, [POIrelative], range, unit)
+            if cube is None:
+                return
+
+        selected = self.CELMAselection(cube.ELMonsets, ELMnumber, ignore)
+        if not selected.any():
+            logger.critical("No ELMs in specified range {}s-{}s".format(start,end))
+            return
+        return cube.frame(POIrelative, selected)
+
+
     def coherentELMaveraging(self, start, end, ELMnumber, POIrelative, range,
             unit, marker=None, color=None, multiplePOIs=False, fitting=True,
             facecolor=None, showErrors=True, ignore=[]):
         """
         Performs an average over a specified amount of ELMs at a point of
-        interest relative to the ELM start time
+        interest relative to the ELM start time. Results of computeCELMA are
+        memoized in the GUI's CELMA cache, so revisited configurations are
+        only re-rendered.
         """
         oldyLimits = self.axes.get_ylim()
         oldxLimits = self.axes.get_xlim()
-        data_tot = {}
-        positions_tot = {}
         showLegend = self.gui.menuShowLegend.isChecked()
         average = self.showCELMAAvg
         alpha = self.CELMAalpha
@@ -6320,55 +7175,16 @@ class SpatialPlot(Plot):
             if facecolor == 'none':
                 facecolor = None
 
-        ### Finding ELM times in range
-        # Filter arrays according to passed values start, end, ELMnum
-        # Pad the index array for ELMtoELM so that the (i-1)th element is
-        # included in case POIrelative is negative. np.where returns tuple.
-        ind = np.where((self.ELMonsets >= start) & (self.ELMonsets <= end) &
-                       ~np.in1d(self.ELMonsets,ignore))
-        if len(ind[0]) == 0:
-            logger.critical("No ELMs in specified range {}s-{}s".format(start,end))
+        result = self.cachedCELMA(*self.CELMAjob(start, end, ELMnumber,
+                                                 POIrelative, range, unit,
+                                                 ignore))
+        if result is None:
             return
-        durInd = np.pad(ind[0], (1,0), 'constant', constant_values = ind[0][0]-1)
-        ELMonsets = self.ELMonsets[ind][:ELMnumber]
-        ELMtoELM = self.ELMtoELM[durInd][:ELMnumber+1] 
-        ELMends = self.ELMends[ind][:ELMnumber]
-
-        # POIs at one relative location for each ELM in range [start,end]
-        # If POIrelative is negative, the ELMtoELM element at index i-1
-        # must be subtracted from the ELMonset element at index i
-        # POIsShifted can be used in a CELMA temporal plot
-        if unit == '%':
-            if POIrelative > 0:
-                POIs = ELMonsets + ELMtoELM[1:]*POIrelative
-                POIsShifted = ELMtoELM[1:]*POIrelative
-            else:
-                POIs = ELMonsets + ELMtoELM[:-1]*POIrelative
-                POIsShifted = ELMtoELM[:-1]*POIrelative
-        elif unit == '0.1 ms':
-                POIs = ELMonsets + POIrelative
-                POIsShifted = np.array([POIrelative])
-        POIs.sort()
-        POIsShifted.sort()
-
-        ### Data retrieval
-        for POIreal in POIs:
-            if POIreal not in data_tot:
-                data_tot[POIreal] = {}
-            if POIreal not in positions_tot:
-                positions_tot[POIreal] = {}
-
-            data, timeRange = self.getDataInTimeWindow(self.rawdata, POIreal, range)
-            positions = self.getDeltaS(timeRange)
-            data, positions = self.averageData(data, positions)
-
-            for probe, vals in data.iteritems():
-                locs = positions[probe]
-                if len(vals) != len(locs):
-                    logger.critical("Number of values is not the same as number of locations.")
-                data_tot[POIreal][probe] = vals
-                positions_tot[POIreal][probe] = locs
-        
+        POIs = result['POIs']
+        POIsShifted = result['POIsShifted']
+        data_tot = result['data']
+        positions_tot = result['positions']
+
         #### Plotting
         xavg = {}
         yavg = {}
@@ -6508,6 +7324,43 @@ class SpatialPlot(Plot):
         return fit
 
 
+    def cachedEichFit(self, locs, data, detached=False, profileHash=None):
+        """
+        Returns the Eich fit parameters of the canonical profile (locs, data)
+        in the units of data. Parameters are cached in the GUI's fit cache
+        under the profile hash, which plotMaximaDistances shares. Returns
+        None if no fit was found.
+        """
+        if profileHash is None:
+            profileHash = arrayHash(locs, data)
+        key = ('eich', profileHash, detached, self.fitLogSpace)
+        cache = self.gui.fitCache
+        ft = cache.get(key)
+        if ft is not None:
+            return ft
+
+        # Normalize y values so curve_fit will not break because of too
+        # large/small values
+        scal = np.max(np.abs(data))
+        if scal == 0:
+            logger.debug("Could not find fit parameters")
+            return
+        try:
+            ft = FitFunctions.fit(locs, data/scal, detachment=detached,
+                                  logSpace=self.fitLogSpace)
+        except RuntimeError:
+            logger.debug("Could not find fit parameters")
+            return
+        finally:
+            logger.debug("Fit statistics: {}".format(FitFunctions.summary()))
+        ft = np.array(ft, dtype=float)
+        # Scaling and background scale with the data
+        ft[0] *= scal
+        ft[3] *= scal
+        cache.put(key, ft)
+        return ft
+
+
     def findFit(self, xdata=None, ydata=None, method=None, detached=False):
         """
         Finds fit x and y data based on passed data and method
@@ -6523,41 +7376,26 @@ class SpatialPlot(Plot):
             locs = np.array([el[0] for el in offsets])
             data = np.array([el[1] for el in offsets])
         else:
-            xdata, ydata = zip(*sorted(zip(xdata, ydata)))
-            locs = np.array(xdata)
-            data = np.array(ydata)
+            locs = np.array(xdata, dtype=float)
+            data = np.array(ydata, dtype=float)
 
+        # Sort data from "left to right". Removing NaNs is necessary for
+        # scipy curve_fit to work. Sorting also makes the profile hash
+        # independent of the order the data was collected in.
+        locs, data = FitFunctions.canonicalProfile(locs, data)
         if data.size == 0:
             logger.error( "No data to fit")
             return
         
-        # Sort data from "left to right"
-        data = data[locs.argsort()]
-        locs = locs[locs.argsort()]
-
-        # This is necessary for scipy curve_fit to work
-        locs = Conversion.removeNans(locs,data)
-        data = Conversion.removeNans(data)
-        
         xmin, xmax = (np.min(locs),np.max(locs))
         xft = np.arange(xmin, xmax, 1/float(self.fitNum))
+        profileHash = arrayHash(locs, data)
 
         if method in ('eich','Eich'):
-            # Normalize y values so curve_fit will not break because of too
-            # large/small values
-            scal = np.max(data)
-            y = data/scal
-            try:
-                ft = FitFunctions.fit(locs, y, detachment=detached)
-            except RuntimeError:
-                logger.debug("Could not find fit parameters")
+            ft = self.cachedEichFit(locs, data, detached, profileHash)
+            if ft is None:
                 return
-            else:
-                if detached:
-                    yft = FitFunctions.eich_model_detached(xft, *ft)
-                else:
-                    yft = FitFunctions.eich_model(xft, *ft)
-            yft *= scal
+            yft = FitFunctions.evaluate(xft, ft, detached)
            
         #elif method == 'Linear':
         #    n = 100
@@ -6568,8 +7406,12 @@ class SpatialPlot(Plot):
         #    xft, yft = self.averagesInBins(n, xdata, ydata, noZeros=True)
                 
         elif method in ('linear','nearest','zero','slinear','cubic','quadratic'):
-            fit = interpolate.interp1d(locs, data, kind=method)
-            yft = fit(xft)
+            key = ('interpolation', profileHash, method, self.fitNum)
+            yft = self.gui.fitCache.get(key)
+            if yft is None:
+                fit = interpolate.interp1d(locs, data, kind=method)
+                yft = fit(xft)
+                self.gui.fitCache.put(key, yft)
 
         else:
             logger.error("Unrecognized fit method", method)
@@ -7168,10 +8010,8 @@ class TemporalPlot(Plot):
         for probeName in data:
             #########################################
             # Add ignoreNans check
-            data[probeName] = Tools.padToFit(data[probeName], n, np.NAN)
-            time[probeName] = Tools.padToFit(time[probeName], n, np.NAN)
-            data[probeName] = data[probeName].reshape(-1,n).mean(axis=1)
-            time[probeName] = time[probeName].reshape(-1,n).mean(axis=1)
+            data[probeName] = sampleMeans(data[probeName], n)
+            time[probeName] = sampleMeans(time[probeName], n)
 
         return data, time
 
@@ -7290,9 +8130,6 @@ class TemporalPlot(Plot):
             if len(self.defaultLims):
                 ylim = self.defaultLims
 
-        if pad is None:
-            pad = self.CELMApad
-        pad /= 1000 #pad is given in ms
         if alpha is None:
             alpha = self.CELMAalpha
         if binNumber is None:
@@ -7306,60 +8143,37 @@ class TemporalPlot(Plot):
         if normalize is None:
             normalize = self.CELMAnormalize
 
-        time = np.array(self.times[probe])
-        data = np.array(self.data[probe])
+        if avgMethod is None:
+            avgMethod = self.avgMethod
 
-        # Not doing this will result in problems during numpy comparisons
-        time = Conversion.removeNans(time, data)
-        data = Conversion.removeNans(data)
+        key, compute = self.CELMAjob(start, end, probe, normalize, compare,
+                                     pad, binning, binNumber)
+        result = self.cachedCELMA(key, compute)
+        if result is None:
+            return
 
-        ### Finding ELM times in range
-        # Filter arrays according to passed values start, end, ELMnum
-        ind = np.where((self.ELMonsets >= start) & (self.ELMonsets <= end) &
-                       ~np.in1d(self.ELMonsets,ignore))[0][:ELMnum]
-        if len(ind) == 0:
+        selected = self.CELMAselection(result['onsets'], ELMnum, ignore)
+        if not selected.any():
             logger.info("No ELMs in specified range {}s-{}s".format(start,end))
             return
-        ELMonsets = self.ELMonsets[ind]
-        ELMtoELM = self.ELMtoELM[ind]
-        ELMends = self.ELMends[ind]
-        ELMmaxima = self.ELMmaxima[ind]
-        ELMdurations = ELMends - ELMonsets
-
-        if compare == 'Start':
-            shiftArray = ELMonsets
-            durationHandle = max(ELMdurations)
-        elif compare == 'End':
-            shiftArray = ELMends
-            durationHandle = -max(ELMdurations)
-        elif compare == 'Maximum':
-            shiftArray = ELMmaxima
-            durationHandle = None
-        else:
-            logger.warning("Unknown compare mode {}. Synchronizing by ELM start".format(compare))
-            shiftArray = ELMonsets
+        elms = np.flatnonzero(selected)
+        if not any(len(result['times'][i]) for i in elms):
+            logger.critical("ERROR: Retreived ELM data or time arrays contain no data")
+            return
+        logger.debug("Found ELM starts: {}".format(result['onsets'][elms]))
 
-        dataTotal = []
-        timeTotal = []
-        i = 0
-        logger.debug("Found ELM starts: {}".format(ELMonsets))
-        for i, (ton, dt, shift) in enumerate(zip(ELMonsets, ELMtoELM, shiftArray)):
-            ind = np.where((ton - 0.001 - pad <= time) & (time <= ton+dt + pad))[0]
-            if normalize:
-                timeELM = (time[ind] - shift)/dt
-            else:
-                timeELM = time[ind] - shift
-            dataELM = data[ind]
-            scatter = self.axes.scatter(timeELM,dataELM, marker=marker, 
+        for i, e in enumerate(elms):
+            scatter = self.axes.scatter(result['times'][e], result['data'][e],
+                                        marker=marker, 
                                         color=color, alpha=alpha, linewidth=0,
                                         label='{} ELM {} @{:.4f}s'
-                                        .format(probe, i, ton))
+                                        .format(probe, i, result['onsets'][e]))
             self.CELMAs.append(scatter)
 
-            dataTotal.extend(list(dataELM))
-            timeTotal.extend(list(timeELM))
-            i += 1
-
+        durationHandle = None
+        if result['durationSign'] is not None:
+            durationHandle = (result['durationSign'] *
+                              max(result['durations'][elms]))
         if durationHandle is not None and not normalize:
             durationSpan = self.axes.axvspan(durationHandle, 0,
                                              color='grey', alpha=.3,
@@ -7371,19 +8185,17 @@ class TemporalPlot(Plot):
                                 label = 'ELM sync point')
             self.CELMAs.append(syncMarker)
 
-
-        if len(timeTotal) == 0 and len(dataTotal) == 0:
-            logger.critical("ERROR: Retreived ELM data or time arrays contain no data")
-            return
-        
-        timeTotal, dataTotal = zip(*sorted(zip(timeTotal,dataTotal)))
-
         if binning:
-            result = self.averagesInBins(binNumber, timeTotal, dataTotal,
-                                         avgMethod)
-            if result is not None:
-                t, avgs = result
-
+            # Only the ELMs toggled since the last call are added to or
+            # removed from the binned aggregate
+            aggregate = result['aggregate']
+            aggregate.select(selected)
+            # Stored again, as the selection changes the aggregate's size
+            self.gui.CELMAcache.put(key, result)
+            binned = self.averagesInBins(binNumber, None, None, avgMethod,
+                                         binner=aggregate)
+            if binned is not None:
+                t, avgs = binned
                 self.CELMAs.append(
                         self.axes.plot(t,avgs,
                                         color=avgColor,
@@ -7391,8 +8203,9 @@ class TemporalPlot(Plot):
                                         label='Linear regression {}'
                                         .format(probe))[0])
 
-        self.axes.set_xlim(min(timeTotal), max(timeTotal))
-        self.axes.set_ylim(min(dataTotal), max(dataTotal))
+        ranges = result['ranges'][elms]
+        self.axes.set_xlim(np.nanmin(ranges[:,0]), np.nanmax(ranges[:,1]))
+        self.axes.set_ylim(np.nanmin(ranges[:,2]), np.nanmax(ranges[:,3]))
         if xlim:
             newxlim = list(self.axes.get_xlim())
             for i, lim in enumerate(xlim):
@@ -7408,6 +8221,61 @@ class TemporalPlot(Plot):
         self.CELMAexists = True
 
 
+    def CELMAjob(self, start, end, probe, normalize=None, compare=None,
+                 pad=None, binning=False, binNumber=None):
+        """
+        Returns the cache key and the computation of the temporal CELMA of
+        `probe` with the same defaults as coherentELMaveraging. `pad` is
+        given in ms. The computation does not touch the axes and may run in
+        a worker thread.
+        """
+        if pad is None:
+            pad = self.CELMApad
+        pad /= 1000 #pad is given in ms
+        if binNumber is None:
+            binNumber = self.CELMAbinNumber
+        if normalize is None:
+            normalize = self.CELMAnormalize
+        key = self.CELMAcacheKey(start, end, probe, normalize, compare, pad,
+                                 binning, binNumber)
+        return key, functools.partial(self.computeCELMA, start, end, probe,
+                                      normalize, compare, pad, binning,
+                                      binNumber)
+
+
+    def CELMAcacheKey(self, start, end, probe, normalize, compare, pad,
+                      binning, binNumber):
+        """
+        Cache key of a temporal CELMA. Contains every parameter the result of
+        computeCELMA depends on. The ELM selection is not part of it since
+        the result covers all ELMs in [start, end].
+        """
+        return ('temporal', self.gui.shotnr, self.quantity, probe, start, end,
+                compare, normalize, pad, self.avgNum, binning, binNumber)
+
+
+    def computeCELMA(self, start, end, probe, normalize, compare, pad,
+                     binning=False, binNumber=None):
+        """
+        ELM-synchronizes the averaged data of `probe` for every ELM in
+        [start, end]. Does not touch the axes. `pad` is given in seconds.
+
+        Returns the dictionary of celma.synchronizeELMs, holding the
+        synchronized time and data arrays of each ELM and the ELMAggregate
+        for binning. Returns None if there are no ELMs in range.
+        """
+        if compare not in ('Start', 'End', 'Maximum'):
+            logger.warning("Unknown compare mode {}. Synchronizing by ELM start".format(compare))
+            compare = 'Start'
+        result = synchronizeELMs(self.times[probe], self.data[probe],
+                                 self.ELMonsets, self.ELMends,
+                                 self.ELMmaxima, self.ELMtoELM, start, end,
+                                 normalize, compare, pad, binning, binNumber)
+        if result is None:
+            logger.info("No ELMs in specified range {}s-{}s".format(start,end))
+        return result
+
+
 class WmhdPlot(TemporalPlot):
     def __init__(self, gui):
         quantity = 'wmhd'
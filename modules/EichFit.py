@@ -1,31 +1,106 @@
+import time
+
+import numpy as np
 from scipy.optimize import fmin
 from scipy.special import erfc
 from scipy import exp
 from scipy.integrate import trapz
 
 def Eich_model(p, location):
+    """
+    p[0]: s0        Strikeline position
+    p[1]: q0        Integral of the profile above background
+    p[2]: lambdaq   Flux e-folding distance
+    p[3]: S         Flux broadening
+    p[4]: qBG       Background flux
+    """
     z = p[3]/2.0/p[2]
     return 0.5*p[1]/p[2]*exp(z*z-(location-p[0])/p[2])*erfc(z-(location-p[0])/p[3]) + p[4]
 
-def fit(location, data, uncertainty = None, use_uncertainty=False):
-    p0 = [trapz(data*location, location)/trapz(data, location), abs(trapz(data, location)), 10.0e-3, 5.0e-3, max(1.0, data.mean())]
-    pMin = [location.min(), p0[1]*0.5, 0.5e-3, 0.5e-3, 0.0]
-    pMax = [location.max(), p0[1]*2, location.ptp(), location.ptp(), data.max()]
+
+class _BudgetExceeded(Exception):
+    pass
+
+
+def fit(location, data, uncertainty = None, use_uncertainty=False,
+        maxiter=None, maxtime=None, restarts=10, xtol=1e-4, ftol=1e-4,
+        full_output=False):
+    """
+    Fits Eich_model to the profile `data` at `location` by minimizing the
+    (uncertainty-weighted) sum of squared residuals with the downhill simplex
+    method. Parameters are kept within bounds derived from the profile.
+
+    The simplex is restarted from the best parameters found so far until a
+    restart no longer improves the fit, at most `restarts` times. `maxiter`
+    limits the total number of simplex iterations and `maxtime` the total
+    time in seconds; when either is exhausted the best parameters found so
+    far are returned.
+
+    Returns the parameters, plus a dictionary with the number of model
+    evaluations ('nfev'), simplex iterations ('iterations'), runs ('runs'),
+    the final sum of squares ('chi2') and whether the fit converged before
+    the budget ran out ('converged') if full_output is true.
+    """
+    location = np.asarray(location, dtype=float)
+    data = np.asarray(data, dtype=float)
+    if use_uncertainty:
+        if uncertainty is None:
+            raise ValueError('Uncertainty-weighted fit needs uncertainties')
+        weights = 1. / np.asarray(uncertainty, dtype=float)
+    else:
+        weights = None
+
+    p0 = np.array([trapz(data*location, location)/trapz(data, location),
+                   abs(trapz(data, location)), 10.0e-3, 5.0e-3,
+                   max(1.0, data.mean())])
+    pMin = np.array([location.min(), p0[1]*0.5, 0.5e-3, 0.5e-3, 0.0])
+    pMax = np.array([location.max(), p0[1]*2, location.ptp(), location.ptp(),
+                     data.max()])
+    p0 = np.clip(p0, pMin, pMax)
+
+    state = {'nfev': 0, 'iterations': 0, 'best': p0, 'chi2': np.inf}
+    deadline = None if maxtime is None else time.time() + maxtime
+
     def likelihood(p):
-        if any(p<pMin) or any(p>pMax):
+        state['nfev'] += 1
+        if (p < pMin).any() or (p > pMax).any():
+            return 99e99
+        result = Eich_model(p, location) - data
+        if weights is not None:
+            result *= weights
+        result = np.dot(result, result)
+        if result != result:
             return 99e99
-        if use_uncertainty:
-            result = Eich_model(p)/uncertainty - data/uncertainty
-        else:
-            result = Eich_model(p) - data
-        result *= result
-        result = sum(result)
-        return result if result == result else 99e99
-    start = True
-    counter = 0
-    while start:
-        pNew = fmin(likelihood, p0, disp=False)
-        if all(pNew == p0) or counter > 10:
-            start = False
-    return pNew
-                                                     
+        if result < state['chi2']:
+            state['chi2'] = result
+            state['best'] = p.copy()
+        return result
+
+    def callback(p):
+        state['iterations'] += 1
+        if maxiter is not None and state['iterations'] >= maxiter:
+            raise _BudgetExceeded()
+        if deadline is not None and time.time() > deadline:
+            raise _BudgetExceeded()
+
+    converged = False
+    runs = 0
+    for runs in range(1, restarts + 1):
+        previous = state['chi2']
+        try:
+            fmin(likelihood, state['best'], xtol=xtol, ftol=ftol,
+                 callback=callback, disp=False)
+        except _BudgetExceeded:
+            break
+        # Restarting only pays off while it still improves the fit
+        if previous - state['chi2'] <= ftol * max(state['chi2'], 1e-300):
+            converged = True
+            break
+
+    if full_output:
+        return state['best'], {'nfev': state['nfev'],
+                               'iterations': state['iterations'],
+                               'runs': runs,
+                               'chi2': state['chi2'],
+                               'converged': converged}
+    return state['best']
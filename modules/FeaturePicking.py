@@ -1,5 +1,4 @@
 from __future__ import print_function
-import csv
 import functools
 import operator
 import re
@@ -13,9 +12,11 @@ from PyQt4 import QtGui, QtCore
 
 from windows import FigureWindow
 from conversion import Conversion
-from sorttable import MyTableWidgetItem
+from featuretable import FeatureTableModel, GotoDelegate, GOTO
+from featuredb import FeatureDatabase
 
 class FeaturePicker(QtCore.QObject):
+    fileFilter = 'CSV (*.csv);;Feature database (*.fdb)'
     goto = QtCore.pyqtSignal('PyQt_PyObject', 'PyQt_PyObject', 'PyQt_PyObject')
     tableChanged = QtCore.pyqtSignal()
     tableCleared = QtCore.pyqtSignal()
@@ -25,9 +26,14 @@ class FeaturePicker(QtCore.QObject):
     def __init__(self, table):
         super(FeaturePicker, self).__init__()
         self.table = table
-        table.cellDoubleClicked.connect(self.selectFeature)
+        self.model = FeatureTableModel(table)
+        self.delegate = GotoDelegate(table)
+        table.setModel(self.model)
+        table.setItemDelegate(self.delegate)
+        table.doubleClicked.connect(self.onDoubleClick)
         table.horizontalHeader().setMovable(True)
         table.verticalHeader().setMovable(True)
+        self.delegate.clicked.connect(self.gotoRow)
 
         self.currentFeatureCell = None
         self.currentCanvas = None
@@ -37,220 +43,152 @@ class FeaturePicker(QtCore.QObject):
         self.tableColumnOrder = None
         self.saved = False
 
-        self.table.cellChanged.connect(self.disable)
-        self.table.cellChanged.connect(self.onTableChange)
-        self.table.itemChanged.connect(self.onTableChange)
+        self.model.dataChanged.connect(self.onCellChange)
+        for signal in (self.model.dataChanged, self.model.rowsInserted,
+                       self.model.rowsRemoved, self.model.columnsInserted,
+                       self.model.columnsRemoved):
+            signal.connect(self.onTableChange)
         self.table.setSortingEnabled(True)
 
     def addCanvas(self, quantity, canvas):
         self.canvases[quantity] = canvas
 
     def addFeature(self, event=None, featName=None, meta=False):
-        table = self.table
-        self.table.setSortingEnabled(False)
         if event or featName is None:
-            featName, ok = QtGui.QInputDialog.getText(table,
+            featName, ok = QtGui.QInputDialog.getText(self.table,
                                                       'Add feature',
                                                       'Feature name:')
             if not ok:
                 return
             featName = str(featName)
 
-        colPos = table.columnCount()
-        table.insertColumn(colPos)
-
-        item = QtGui.QTableWidgetItem(featName)
-        table.setHorizontalHeaderItem(colPos, item)
-
-        feature = Feature(featName, colPos, not meta)
+        if not self.model.addColumn(featName):
+            print('Feature {} exists already'.format(featName))
+            return
+        feature = Feature(featName, self.model.columnCount() - 1, not meta)
         self.features.append(feature)
-        self.table.setSortingEnabled(True)
-
-    def setFeatureWidget(self, featName, widget):
-        row = self.table.rowCount() - 1
-        col = self.getFeatureColumn(featName)
-        self.table.setCellWidget(row, col, widget)
 
     def getHeaderLabels(self):
-        headerLabels = []
-        for col in range(self.table.columnCount()):
-            lbl = str(self.table.horizontalHeaderItem(col).text())
-            headerLabels.append(lbl)
-        return headerLabels
+        return self.model.labels()
 
     def insertData(self, row, label, value, overwrite=False):
-        headerLabels = self.getHeaderLabels()
-        try:
-            col = headerLabels.index(label)
-        except ValueError:
+        if self.model.columnIndex(label) is None:
             self.addFeature(featName=label)
-            col = self.table.columnCount()
-        try:
-            item = self.table.item(row, col)
-        except:
-            item = None
-        if not item or overwrite:
-            item = QtGui.QTableWidgetItem(str(value))
-            self.table.setItem(row, col, item)
-
-    def getFeatureColumn(self, featName):
+        old = self.model.value(row, label)
+        if overwrite or old is None or (isinstance(old, float) and
+                                        np.isnan(old)):
+            self.model.setValue(row, label, value)
+
+    def getFeature(self, featName):
         feature = next((feat for feat in self.features
                         if feat.name == featName), None)
         if feature is None:
             print('No feature {} found'.format(featName))
-            return
-        return feature.column
+        return feature
 
     def setFeatureValue(self, featName, value):
-        table = self.table
-        row = table.rowCount() - 1
-        col = self.getFeatureColumn(featName)
+        row = self.model.rowCount() - 1
+        if self.getFeature(featName) is None:
+            return
+        self.model.setValue(row, featName, value)
+
+    def gotoRow(self, row):
+        model = self.model
+        self.goto.emit(model.text(row, 'Shot'), model.text(row, 'CELMA start'),
+                       model.text(row, 'CELMA end'))
 
-        item = QtGui.QTableWidgetItem()
-        item.setText(str(value))
-        table.setItem(row, col, item)
+    def onDoubleClick(self, index):
+        self.selectFeature(index.row(), index.column())
 
     def selectFeature(self, row, col):
-        table = self.table
-        feature = next((feat for feat in self.features
-                        if feat.column == col), None)
+        feature = self.getFeature(self.model.label(col))
         if feature is None:
             print("Could not select unregistered feature in column {}"
                   .format(col))
             return
         if feature.isSelectable:
             self.currentFeatureCell = [row, col]
-            try:
-                table.removeCellWidget(row, col)
-            except:
-                pass
             self.enable()
 
     def addRow(self):
-        table = self.table
-        rowPos = table.rowCount()
-        table.insertRow(rowPos)
+        self.model.insertRows(self.model.rowCount(), 1)
 
     def removeRow(self):
         ok = ConfirmDialog.getConfirmation(self.table,
                                            'delete the current row')
-        if ok:
-            rowPos = self.table.currentRow()
-            self.table.removeRow(rowPos)
+        rowPos = self.table.currentIndex().row()
+        if ok and rowPos >= 0:
+            self.model.removeRows(rowPos, 1)
 
     def removeColumn(self):
         ok = ConfirmDialog.getConfirmation(self.table,
                                            'delete the current column')
-        if ok:
-            colPos = self.table.currentColumn()
-            self.table.removeColumn(colPos)
+        colPos = self.table.currentIndex().column()
+        if ok and colPos >= 0:
+            label = self.model.label(colPos)
+            self.model.removeColumns(colPos, 1)
+            self.features = [feat for feat in self.features
+                             if feat.name != label]
 
     def clearTable(self):
         ok = ConfirmDialog.getConfirmation(self.table)
         if ok:
-            self.table.blockSignals(True)
-            self.table.setRowCount(0)
-            self.table.blockSignals(False)
+            self.model.clearRows()
             self.tableCleared.emit()
             self.saved = True
 
     def saveTable(self):
-        table = self.table
+        """
+        Saves the table as CSV file or into a feature database (*.fdb). Rows
+        of a database are updated by the rows of the table, or inserted.
+        """
         path = QtGui.QFileDialog.getSaveFileName(self.table,
                                                  'Save File',
-                                                 '', 'CSV (*.csv)')
-        if not path.isEmpty():
-            with open(unicode(path), 'w') as stream:
-                writer = csv.writer(stream)
-                headerLabels = []
-                for col in range(1, table.columnCount()):
-                    label = table.horizontalHeaderItem(col).text()
-                    headerLabels.append(str(label))
-                writer.writerow(headerLabels)
-                for row in range(table.rowCount()):
-                    rowdata = []
-                    for column in range(1, table.columnCount()):
-                        item = table.item(row, column)
-                        if item is not None:
-                            rowdata.append(
-                                unicode(item.text()).encode('utf8'))
-                        else:
-                            rowdata.append('')
-                    writer.writerow(rowdata)
-            self.tableSaved.emit()
-
-    def onTableChange(self, event):
+                                                 '', self.fileFilter)
+        if path.isEmpty():
+            return
+        path = unicode(path)
+        if path.endswith('.fdb'):
+            db = FeatureDatabase(path)
+            rows = db.upsert(self.model.dataFrame().drop(GOTO, axis=1))
+            db.save()
+            print('{} rows of {} updated'.format(rows, path))
+        else:
+            self.model.save(path)
+        self.tableSaved.emit()
+
+    def onTableChange(self, *args):
         self.tableChanged.emit()
         self.saved = False
 
+    def onCellChange(self, topLeft, bottomRight):
+        self.disable()
+
     def loadTable(self, path=None, col_order=None):
-        self.table.blockSignals(True)
         if col_order is None:
             col_order = self.tableColumnOrder
-        self.tableWidgets = []
         if not path:
             path = QtGui.QFileDialog.getOpenFileName(self.table,
                                                      'Open File',
                                                      '',
-                                                     'CSV (*.csv)')
-        if os.path.isfile(path):
-            self.features = []
+                                                     self.fileFilter)
+        path = unicode(path)
+        isDatabase = path.endswith('.fdb')
+        if (FeatureDatabase.exists(path) if isDatabase
+                else os.path.isfile(path)):
             self.disable()
-            with open(unicode(path), 'r') as stream:
-                self.table.setRowCount(0)
-                self.table.setColumnCount(0)
-                for i, rowdata in enumerate(csv.reader(stream)):
-                    if i == 0:
-                        header = rowdata
-                        header.insert(0, 'Go to')
-
-                        permutate = lambda l: l
-                        if col_order:
-                            col_order = [el for el in col_order
-                                         if el in header]
-                            ordered_header = col_order + [el for el in header
-                                                          if el not in col_order]
-                            ordered_indices = map(lambda x: header.index(x),
-                                                            ordered_header)
-                            permutate = lambda l: list(np.array(l)[ordered_indices])
-                            header = ordered_header
-
-                        self.table.setColumnCount(len(header))
-                        self.table.setHorizontalHeaderLabels(header)
-                        for col, lbl in enumerate(header):
-                            feature = Feature(lbl, col, True)
-                            self.features.append(feature)
-                        continue
-                    rowdata.insert(0, '')
-                    row = self.table.rowCount()
-                    self.table.insertRow(row)
-                    rowdata = permutate(rowdata)
-                    for column, data in enumerate(rowdata):
-                        #item = QtGui.QTableWidgetItem(data.decode('utf8'))
-                        data = data.decode('utf8')
-                        try:
-                            data = float(data)
-                        except:
-                            pass
-                        item = QtGui.QTableWidgetItem()
-                        item.setData(QtCore.Qt.EditRole, QtCore.QVariant(data))
-                        self.table.setItem(row, column, item)
-
-                    # Add go to button
-                    shot = rowdata[header.index('Shot')]
-                    start = rowdata[header.index('CELMA start')]
-                    end = rowdata[header.index('CELMA end')]
-                    widget = QtGui.QPushButton('View')
-                    widget.clicked.connect(
-                        functools.partial(self.goto.emit, shot, start, end))
-                    self.table.setCellWidget(row, 0, widget)
-                    self.tableWidgets.append(widget)
+            if isDatabase:
+                self.model.setTable(FeatureDatabase(path).table(), col_order)
+            else:
+                self.model.load(path, col_order)
+            self.features = [Feature(lbl, col, True) for col, lbl
+                             in enumerate(self.model.labels())]
             self.table.resizeColumnsToContents()
             self.saved = True
+            self.tableLoaded.emit()
         else:
             pass
             #logger.error("File {} does not exist".format(path))
-        self.table.blockSignals(False)
 
     def enable(self):
         if len(self.canvases) == 0:
@@ -274,41 +212,32 @@ class FeaturePicker(QtCore.QObject):
         self.currentCanvas = None
 
     def pick(self, quantity, event):
-        table = self.table
+        model = self.model
         if event.inaxes:
             if self.currentFeatureCell is None:
                 return
             row, col = self.currentFeatureCell
+            label = model.label(col)
 
-            quantCol = None
-            for _col in range(table.columnCount()):
-                headerItem = table.horizontalHeaderItem(_col)
-                if str(headerItem.text()) == 'quantity':
-                    quantCol = _col
-                    break
-            if quantCol is None:
+            if model.columnIndex('quantity') is None:
                 print('Column specifying quantity could not be found. ' +
                       'Aborting')
+                return
 
-            quantItem = table.item(row, quantCol)
-            if quantItem is not None:
-                label = str(quantItem.text())
-                if label != '' and quantity != label:
-                    print('Quantity conflict! Please pick {} coordinates '
-                          .format(label) +
-                          '(picked {} instead)'.format(quantity))
-                    return
+            current = model.text(row, 'quantity')
+            if current != '' and quantity != current:
+                print('Quantity conflict! Please pick {} coordinates '
+                      .format(current) +
+                      '(picked {} instead)'.format(quantity))
+                return
 
             self.disable(exceptFor=event.canvas)
 
             x = event.xdata
             y = event.ydata
 
-            self.setFeatureValue('quantity', quantity)
-
-            table.removeCellWidget(row, col)
-            item = QtGui.QTableWidgetItem('{} | {}'.format(x, y))
-            table.setItem(row, col, item)
+            model.setValue(row, 'quantity', quantity)
+            model.setValue(row, label, (x, y))
 
             self.disable()
 
@@ -901,13 +830,6 @@ class Plotter(QtCore.QObject):
         ax = self.window.axes[axNum]
         self.window.setCurrentAxes(ax)
 
-    def getHeaderLabels(self, table):
-        headerLabels = []
-        for col in range(table.columnCount()):
-            lbl = str(table.horizontalHeaderItem(col).text())
-            headerLabels.append(lbl)
-        return headerLabels
-
     def getTableData(self, quants, ops, axes, labels,
                      #plot, probes, index, group, filters, colorbar,
                      plot, annots, index, group, filters, colorbar,
@@ -935,39 +857,6 @@ class Plotter(QtCore.QObject):
 
         df = self.table2DataFrame(self.table)
 
-        def calculateRowValue(row, cols, ops, axis):
-            def getAxis(val, ax):
-                try:
-                    val = float(val)
-                except (ValueError, TypeError):
-                    if len(val) == 2 and not isinstance(val, basestring):
-                        ax = (0 if ax == 'x' else 1)
-                        val = val[ax]
-                        try:
-                            val = float(val)
-                        except (ValueError, TypeError):
-                            val = np.nan
-                    else:
-                        val = val
-                return val
-
-            accVal = row[cols[0]]
-            accVal = getAxis(accVal, axis)
-
-            for col, op in zip(cols[1:], ops):
-                val = row[col]
-                val = getAxis(val, axis)
-                opstr = str(op.currentText())
-                func = self.operatorMappings[opstr]
-                accVal = func(accVal, val)
-            return accVal
-
-        def getTime(row):
-            try:
-                return float(row[feat][0])
-            except (KeyError, TypeError):
-                return np.nan
-
         #filters_ind = np.ones(df.shape[0], dtype=bool)
         # Filter by plot type and probeIndex
         if str(plot) != 'all':
@@ -1033,50 +922,89 @@ class Plotter(QtCore.QObject):
 
         # Grouping
         if twoD:
+            # Time differences of the feature between neighbouring probes
             feat = yquants[0]
-            grouped = df.groupby(['Shot', 'CELMA start', 'quantity'])
-            for key, grp in grouped:
-                grp = grp.set_index('probeIndex').transpose()
-                times = grp.apply(getTime)
-                diffs = times.as_matrix()[:-1] - times.as_matrix()[1:]
-                diffs = np.append(diffs, np.nan)
-                df.loc[((df["Shot"] == key[0]) &
-                        (df["CELMA start"] == key[1]) &
-                        (df["quantity"] == key[2])), feat] = diffs
+            keys = ['Shot', 'CELMA start', 'quantity']
+            times = pd.Series(self.axisValues(df[feat], 'x', numbers=False),
+                              index=df.index)
+            diffs = times - times.groupby([df[key] for key in keys]).shift(-1)
+            grouped = df[keys].notnull().all(axis=1)
+            df[feat] = df[feat].astype(object)
+            df.loc[grouped, feat] = diffs[grouped]
 
         xdata = {}
         ydata = {}
         zdata = {}
         annotations = {}
         highlights = {}
-        xargs = (xquants, xops, xaxisAx)
-        yargs = (yquants, yops, yaxisAx)
-        zargs = (zquants, zops, zaxisAx)
+        xs = self.compileExpression(xquants, xops, xaxisAx)(df)
+        ys = self.compileExpression(yquants, yops, yaxisAx)(df)
+        zs = self.compileExpression(zquants, zops, zaxisAx)(df)
 
         if group in list(df):
-            grouped = df.groupby(group)
+            grouped = df.groupby(group).indices.iteritems()
         else:
-            grouped = [['all', df]]
-        for group, groupdf in grouped:
-            xdata[group] = groupdf.apply(calculateRowValue, args=xargs, axis=1)
-            ydata[group] = groupdf.apply(calculateRowValue, args=yargs, axis=1)
-            zdata[group] = groupdf.apply(calculateRowValue, args=zargs, axis=1)
-            annotations[group] = self._assemble_annotations(groupdf, group)
-
-            if group != 'all':
-                xdata[group] = xdata[group].values
-                ydata[group] = ydata[group].values
-                zdata[group] = zdata[group].values
-            else:
-                xdata[group] = xdata[group].values
-                ydata[group] = ydata[group].values
-                zdata[group] = zdata[group].values
-            highlights[group] = groupdf['highlight'].as_matrix()
+            grouped = [['all', np.arange(df.shape[0])]]
+        for group, rows in grouped:
+            xdata[group] = xs[rows]
+            ydata[group] = ys[rows]
+            zdata[group] = zs[rows]
+            annotations[group] = self._assemble_annotations(df.iloc[rows],
+                                                            group)
+            highlights[group] = df['highlight'].values[rows]
             if not colorbar:
                 zdata[group] = np.zeros(len(xdata[group]))
                 zdata[group][:] = np.nan
         return xdata, ydata, zdata, annotations, highlights
 
+    @staticmethod
+    def axisValues(column, axis, numbers=True):
+        """
+        Floats of the Series column for plotting along axis ('x' or 'y').
+        Coordinate cells give their x or y value, numbers themselves unless
+        numbers is False, and text gives NaN.
+        """
+        if column.dtype.kind in 'biuf':
+            values = column.values.astype(float)
+            if not numbers:
+                values[:] = np.nan
+            return values
+        if numbers:
+            values = pd.to_numeric(column, errors='coerce').values
+            values = values.astype(float)
+        else:
+            values = np.full(column.shape[0], np.nan)
+        cells = column.values
+        isCoordinate = np.array([isinstance(cell, tuple) for cell in cells],
+                                dtype=bool)
+        if isCoordinate.any():
+            coordinate = 0 if axis == 'x' else 1
+            values[isCoordinate] = [cell[coordinate]
+                                    for cell in cells[isCoordinate]]
+        return values
+
+    def compileExpression(self, quants, ops, axis):
+        """
+        Function computing quants[0] ops[0] quants[1] ... for all rows of a
+        DataFrame at once, on the values of the columns along axis (see
+        axisValues). ops are the operator combo boxes of PlottingDialog,
+        they are read once here.
+        """
+        funcs = [self.operatorMappings[str(op.currentText())] for op in ops]
+
+        def evaluate(df):
+            columns = {}
+            for quant in quants:
+                if quant not in columns:
+                    columns[quant] = self.axisValues(df[quant], axis)
+            values = columns[quants[0]]
+            # Division by zero gives inf or NaN, as for numpy arrays
+            with np.errstate(divide='ignore', invalid='ignore'):
+                for quant, func in zip(quants[1:], funcs):
+                    values = func(values, columns[quant])
+            return values
+        return evaluate
+
     def _assemble_annotations(self, df, group):
         """
         Assemble annotations from data for the selected quantitees.
@@ -1101,77 +1029,39 @@ class Plotter(QtCore.QObject):
         return np.array(annotations)
 
     def table2DataFrame(self, table):
-        headerLabels = self.getHeaderLabels(table)
-        df = pd.DataFrame(columns=headerLabels,
-                          index=range(table.rowCount()))
+        """
+        Typed data of the feature table shown in table, with the index of
+        each probe relative to the strikeline probe in column 'probeIndex'.
+        """
+        df = table.model().dataFrame()
 
-        for j in range(table.columnCount()):
-            for i in range(table.rowCount()):
-                item = table.item(i, j)
-                try:
-                    cont = str(item.text())
-                except AttributeError:
-                    # Empty cell
-                    val = np.nan
-                else:
-                    if cont.isdigit():
-                        # Integers
-                        val = np.int(cont)
-                    else:
-                        try:
-                            # Floats
-                            val = np.float(cont)
-                        except ValueError:
-                            vals = cont.split('|')
-                            if len(vals) == 1:
-                                # String that can't be converted to number
-                                # (like probe)
-                                # OR like empty string, so check for that
-                                # Strip question marks first
-                                val, = vals
-                                val = val.replace('?','')
-                                if not len(val):
-                                    val = np.nan
-                            elif len(vals) == 2:
-                                # Coordinates
-                                try:
-                                    vals = [np.float(v) for v in vals]
-                                except ValueError:
-                                    vals = [np.nan, np.nan]
-                                # conversion needed because of error 'unhashable
-                                # type list' in chooseQuantities otherwise
-                                val = tuple(vals)
-                            else:
-                                val = np.nan
-                df.iloc[i, j] = val
-
-        # Unpack single values for easier filtering and plotting
-        #for i in range(table.rowCount()):
-        #    for j in range(table.columnCount()):
-        #        val = df.iloc[i, j]
-        #        try:
-        #            df.iloc[i, j], = val
-        #        except (TypeError, ValueError):
-        #            pass
+        # Integral numbers as ints, since filters compare cells as strings
+        for label in df.columns:
+            column = df[label]
+            if column.dtype.kind != 'f':
+                continue
+            valid = column.notnull()
+            if not valid.any() or (column[valid] % 1 != 0).any():
+                continue
+            if valid.all():
+                df[label] = column.astype(int)
+            else:
+                ints = column.astype(object)
+                ints[valid] = column[valid].astype(int)
+                df[label] = ints
 
         # Add probe indices based on where they are located relative to
         # strikeline
-        def getProbeIndex(probe, sepProbe):
-            try:
-                probeNumber = int(probe[-1])
-                sepProbeNumber = int(sepProbe[-1])
-                index = probeNumber - sepProbeNumber
-            except (ValueError, IndexError):
-                index = np.nan
-            return index
-
-        indices = []
-        for i in range(table.rowCount()):
-            probe = str(df.loc[i, 'probe'])
-            sepProbe = str(df.loc[i, 'sepProbe'])
-            index = getProbeIndex(probe, sepProbe)
-            indices.append(index)
-        df['probeIndex'] = pd.Series(indices)
+        def probeNumbers(label):
+            if label not in df.columns:
+                return pd.Series(np.nan, index=df.index)
+            return pd.to_numeric(df[label].astype(unicode).str[-1],
+                                 errors='coerce')
+
+        indices = probeNumbers('probe') - probeNumbers('sepProbe')
+        valid = indices.notnull()
+        df['probeIndex'] = indices.astype(object)
+        df.loc[valid, 'probeIndex'] = indices[valid].astype(int)
         return df
 
     def plot(self):
@@ -0,0 +1,223 @@
+import numpy as np
+
+class Binning():
+    """
+    Segmented reductions over equally spaced bins. The data is sorted once by
+    x and the bin boundaries are found with a single searchsorted call, so
+    every reduction is O(n log n) regardless of the number of bins.
+
+    Bins are half-open [left, right) except for the last one, which also
+    contains the maximum x value (same convention as np.histogram).
+    """
+    # Reducers that are evaluated directly on the sorted segments. Any other
+    # numpy function name or callable falls back to one call per segment.
+    fastReducers = ('mean', 'median', 'percentile', 'sum', 'min', 'max',
+                    'std', 'var', 'nanmean', 'nanmedian')
+    spreads = ('std', 'mad')
+
+    @staticmethod
+    def edges(x, n):
+        """ Returns the n+1 edges of n equally spaced bins spanning x. """
+        return np.linspace(np.min(x), np.max(x), n + 1)
+
+    @staticmethod
+    def parseReducer(reducer, q=None):
+        """
+        Splits reducer specifications like 'percentile90' into the reducer
+        name and the percentile. Callables are returned untouched.
+        """
+        if callable(reducer):
+            return reducer, q
+        reducer = str(reducer)
+        if reducer.startswith('percentile') and reducer != 'percentile':
+            try:
+                q = float(reducer[len('percentile'):])
+            except ValueError:
+                raise ValueError('Invalid percentile specification {}'
+                                 .format(reducer))
+            reducer = 'percentile'
+        if reducer == 'percentile' and q is None:
+            raise ValueError('Percentile reducer needs a percentile q')
+        if reducer not in Binning.fastReducers and not hasattr(np, reducer):
+            raise ValueError('Unknown reducer {}. Use a numpy method.'
+                             .format(reducer))
+        return reducer, q
+
+    @staticmethod
+    def segmentSums(values, starts, ends):
+        """ Sums of values[start:end] for every segment via a cumulative sum """
+        csum = np.concatenate(([0.], np.cumsum(values, dtype=float)))
+        return csum[ends] - csum[starts]
+
+    @staticmethod
+    def windowMeans(x, y, starts, ends):
+        """
+        Means of y over the open intervals (start, end) of x for every pair
+        of starts and ends, ignoring NaNs. Intervals without data evaluate
+        to NaN. x does not need to be sorted.
+        """
+        x = np.asarray(x)
+        y = np.asarray(y, dtype=float)
+        if np.any(np.diff(x) < 0):
+            order = np.argsort(x, kind='mergesort')
+            x, y = x[order], y[order]
+        valid = ~np.isnan(y)
+        left = np.searchsorted(x, starts, side='right')
+        right = np.maximum(np.searchsorted(x, ends, side='left'), left)
+        sums = Binning.segmentSums(np.where(valid, y, 0.), left, right)
+        counts = Binning.segmentSums(valid, left, right)
+        means = np.full(len(left), np.nan)
+        filled = counts > 0
+        means[filled] = sums[filled] / counts[filled]
+        return means
+
+    @staticmethod
+    def segmentQuantiles(values, binIndex, starts, counts, q, presorted=False):
+        """
+        Linearly interpolated q-th percentiles (np.percentile default) of each
+        segment. values must be grouped by binIndex; they are sorted within
+        their segment here with one lexsort unless presorted is true.
+        """
+        if not presorted:
+            values = values[np.lexsort((values, binIndex))]
+        result = np.zeros(len(starts))
+        filled = counts > 0
+        pos = starts[filled] + q / 100. * (counts[filled] - 1)
+        lo = np.floor(pos).astype(int)
+        hi = np.ceil(pos).astype(int)
+        frac = pos - lo
+        result[filled] = values[lo] + (values[hi] - values[lo]) * frac
+        return result
+
+    @classmethod
+    def reduce(cls, n, x, y, reducer='median', q=None, spread=None,
+               edges=None):
+        """
+        Reduces y in n equally spaced bins along x.
+
+        Parameters:
+            n:          number of bins
+            x, y:       data arrays of equal size. Pairs with NaN values are
+                        ignored. Need not be sorted.
+            reducer:    'mean', 'median', 'percentile' (needs q),
+                        'percentile<q>', any numpy reducer name or a callable
+                        taking a 1D array
+            q:          percentile in [0, 100] for reducer 'percentile'
+            spread:     None, 'std' or 'mad' (median absolute deviation from
+                        the bin median)
+            edges:      optional precomputed bin edges (n+1 values)
+
+        Returns:
+            centers, values, counts, spreads
+            Empty bins evaluate to 0. spreads is None if spread is None.
+        """
+        reducer, q = cls.parseReducer(reducer, q)
+        if spread is not None and spread not in cls.spreads:
+            raise ValueError('Unknown spread {}. Use one of {}'
+                             .format(spread, cls.spreads))
+
+        x = np.asarray(x, dtype=float).ravel()
+        y = np.asarray(y, dtype=float).ravel()
+        if x.size != y.size:
+            raise ValueError('Arrays must be the same size. Got {} and {}'
+                             .format(x.size, y.size))
+        valid = ~(np.isnan(x) | np.isnan(y))
+        x = x[valid]
+        y = y[valid]
+        if x.size == 0:
+            return None
+
+        if edges is None:
+            edges = cls.edges(x, n)
+        else:
+            edges = np.asarray(edges, dtype=float)
+            n = len(edges) - 1
+        centers = (edges[:-1] + edges[1:]) / 2.
+
+        # Sort once, then locate all inner bin edges at once
+        order = np.argsort(x, kind='mergesort')
+        xs = x[order]
+        ys = y[order]
+        inner = np.searchsorted(xs, edges[1:-1], side='left')
+        # Everything outside [edges[0], edges[-1]] is dropped
+        first = np.searchsorted(xs, edges[0], side='left')
+        last = np.searchsorted(xs, edges[-1], side='right')
+        bounds = np.clip(np.concatenate(([first], inner, [last])), first, last)
+        starts = bounds[:-1]
+        counts = bounds[1:] - starts
+        ys = ys[first:last]
+        starts = starts - first
+        binIndex = np.repeat(np.arange(n), counts)
+        return cls.reduceSegments(centers, ys, binIndex, starts, counts,
+                                  reducer, q, spread)
+
+    @classmethod
+    def reduceSegments(cls, centers, ys, binIndex, starts, counts,
+                       reducer='median', q=None, spread=None,
+                       presorted=False):
+        """
+        Reduces values that are already grouped by bin. Bin i holds
+        ys[starts[i]:starts[i]+counts[i]], binIndex is the bin of each value.
+        If presorted is true, the values are sorted within each bin, which
+        saves the sort for medians and percentiles.
+
+        Returns centers, values, counts, spreads like reduce.
+        """
+        reducer, q = cls.parseReducer(reducer, q)
+        n = len(counts)
+        ends = starts + counts
+        filled = counts > 0
+        safeCounts = np.where(filled, counts, 1)
+
+        means = None
+        if reducer in ('mean', 'nanmean', 'std', 'var') or spread == 'std':
+            means = cls.segmentSums(ys, starts, ends) / safeCounts
+            means[~filled] = 0
+
+        medians = None
+        if reducer in ('median', 'nanmedian') or spread == 'mad':
+            medians = cls.segmentQuantiles(ys, binIndex, starts, counts, 50.,
+                                           presorted)
+
+        if reducer in ('mean', 'nanmean'):
+            values = means
+        elif reducer in ('median', 'nanmedian'):
+            values = medians
+        elif reducer == 'percentile':
+            values = cls.segmentQuantiles(ys, binIndex, starts, counts, q,
+                                          presorted)
+        elif reducer == 'sum':
+            values = cls.segmentSums(ys, starts, ends)
+        elif reducer in ('min', 'max') and presorted:
+            values = np.zeros(n)
+            index = starts if reducer == 'min' else ends - 1
+            values[filled] = ys[index[filled]]
+        elif reducer in ('min', 'max'):
+            ufunc = np.minimum if reducer == 'min' else np.maximum
+            values = np.zeros(n)
+            if filled.any():
+                values[filled] = ufunc.reduceat(ys, starts[filled])
+        elif reducer in ('std', 'var'):
+            dev = ys - np.repeat(means, counts)
+            values = cls.segmentSums(dev * dev, starts, ends) / safeCounts
+            if reducer == 'std':
+                values = np.sqrt(values)
+        else:
+            func = reducer if callable(reducer) else getattr(np, reducer)
+            values = np.zeros(n)
+            for i in np.flatnonzero(filled):
+                values[i] = func(ys[starts[i]:ends[i]])
+        values[~filled] = 0
+
+        spreads = None
+        if spread == 'std':
+            dev = ys - np.repeat(means, counts)
+            spreads = np.sqrt(cls.segmentSums(dev * dev, starts, ends) /
+                              safeCounts)
+        elif spread == 'mad':
+            dev = np.abs(ys - np.repeat(medians, counts))
+            spreads = cls.segmentQuantiles(dev, binIndex, starts, counts, 50.)
+        if spreads is not None:
+            spreads[~filled] = 0
+
+        return centers, values, counts, spreads
@@ -0,0 +1,105 @@
+import collections
+import hashlib
+import threading
+
+import numpy as np
+
+def arrayHash(*arrays):
+    """
+    Fast digest of the contents of numpy arrays, usable as a cache key.
+    Arrays with the same values but different dtypes hash differently.
+    """
+    digest = hashlib.sha1()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(str(array.dtype) + str(array.shape))
+        digest.update(array.data)
+    return digest.hexdigest()
+
+
+class LRUCache(object):
+    """
+    Least-recently-used cache bounded by the memory footprint of its values.
+    The footprint is estimated with LRUCache.sizeof, which counts numpy array
+    buffers (or the nbytes of other objects) and walks dicts, lists and
+    tuples. Entries larger than the whole budget are not stored. Access is
+    guarded by a lock so the cache can be shared with worker threads.
+    """
+    def __init__(self, maxBytes=200 * 1024**2):
+        self.maxBytes = maxBytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def sizeof(value):
+        """ Estimates the memory used by value in bytes """
+        # numpy arrays and objects reporting their own footprint
+        if hasattr(value, 'nbytes'):
+            return value.nbytes
+        if isinstance(value, dict):
+            return sum(LRUCache.sizeof(k) + LRUCache.sizeof(v)
+                       for k, v in value.iteritems()) + 64
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return sum(LRUCache.sizeof(v) for v in value) + 64
+        if isinstance(value, basestring):
+            return len(value) + 40
+        return 32
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, size = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            # Re-insert as most recently used
+            self._entries[key] = (value, size)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                _, oldSize = self._entries.pop(key)
+                self.nbytes -= oldSize
+            if size > self.maxBytes:
+                return False
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.maxBytes:
+                _, (_, evictedSize) = self._entries.popitem(last=False)
+                self.nbytes -= evictedSize
+        return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            try:
+                value, size = self._entries.pop(key)
+            except KeyError:
+                return default
+            self.nbytes -= size
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """ Returns a short human-readable summary of the cache state """
+        total = self.hits + self.misses
+        rate = self.hits / float(total) * 100 if total else 0.
+        return ('{} entries, {:.1f} of {:.1f} MB, {:.0f}% hits'
+                .format(len(self), self.nbytes / 1024.**2,
+                        self.maxBytes / 1024.**2, rate))
@@ -0,0 +1,546 @@
+import warnings
+
+import numpy as np
+
+from binning import Binning
+
+def nearestIndices(array, values):
+    """
+    Indices of the elements of the sorted `array` closest to each of
+    `values`. Ties resolve to the lower index, like Conversion.valtoind.
+    """
+    array = np.asarray(array)
+    values = np.asarray(values, dtype=float)
+    right = np.clip(np.searchsorted(array, values), 1, len(array) - 1)
+    left = right - 1
+    if len(array) == 1:
+        return np.zeros(values.shape, dtype=int)
+    takeLeft = np.abs(values - array[left]) <= np.abs(array[right] - values)
+    return np.where(takeLeft, left, right)
+
+
+def groupMeans(values, keep, n):
+    """
+    Averages every n consecutive kept samples along the last axis of
+    `values`, the same way SpatialPlot.averageData does for a single window:
+    samples not in `keep` are dropped first, a trailing group with fewer
+    than n samples evaluates to NaN.
+
+    Returns the means and a mask of the groups that exist, both of shape
+    values.shape[:-1] + (ceil(width/n),).
+    """
+    shape = values.shape[:-1]
+    width = values.shape[-1]
+    groups = -(-width // n)
+    rows = int(np.prod(shape))
+    values = values.reshape(rows, width)
+    keep = keep.reshape(rows, width)
+
+    rank = np.cumsum(keep, axis=1) - 1
+    flat = (np.arange(rows)[:, None] * groups + rank // n)[keep]
+    sums = np.bincount(flat, weights=values[keep], minlength=rows * groups)
+    counts = np.bincount(flat, minlength=rows * groups)
+
+    means = np.full(rows * groups, np.nan)
+    full = counts == n
+    means[full] = sums[full] / n
+    return (means.reshape(shape + (groups,)),
+            (counts > 0).reshape(shape + (groups,)))
+
+
+def windowAverages(centers, data, times, positions, ssl, range, avgNum,
+                   ignoreNans=True):
+    """
+    Averaged data and strikeline distances of every probe in windows of
+    `range` samples around the sample indices `centers` (any shape), as
+    SpatialPlot.getDataInTimeWindow, getDeltaS and averageData compute them
+    for a single window. Windows are cut off at the ends of the data.
+
+    Returns three dicts probe -> array of shape centers.shape + (groups,):
+    the averaged data, the averaged distances and a mask of the groups that
+    exist.
+    """
+    dt = (range - 1) // 2
+    indices = np.asarray(centers)[..., None] + np.arange(-dt, dt + 1)
+
+    n = max(avgNum, 1)
+    averages = {}
+    distances = {}
+    exists = {}
+    sslTime = np.asarray(ssl['time'])
+    sslData = np.asarray(ssl['data'])
+    for probe in data:
+        values = np.asarray(data[probe])
+        valid = (indices >= 0) & (indices < len(values))
+        clipped = np.clip(indices, 0, len(values) - 1)
+        values = values[clipped]
+        sampleTimes = np.asarray(times[probe])[clipped]
+        ds = positions[probe] - sslData[nearestIndices(sslTime, sampleTimes)]
+        keep = valid & ~np.isnan(values) if ignoreNans else valid
+        averages[probe], exists[probe] = groupMeans(values, keep, n)
+        distances[probe], _ = groupMeans(ds, keep, n)
+    return averages, distances, exists
+
+
+def probeProfiles(averages, distances, exists, reducer=None):
+    """
+    Spatial profiles of all windows returned by windowAverages, as arrays of
+    shape centers.shape + (columns,). With reducer 'median' or 'mean' every
+    probe contributes one column, the reduced data and distance of its
+    groups, otherwise every group of every probe is a column of its own.
+    Missing values are NaN.
+
+    Returns the data and the distances.
+    """
+    values = []
+    positions = []
+    for probe in sorted(averages):
+        data = np.where(exists[probe], averages[probe], np.nan)
+        ds = np.where(np.isnan(data), np.nan, distances[probe])
+        if reducer in ('median', 'mean'):
+            reduce = np.nanmedian if reducer == 'median' else np.nanmean
+            with np.errstate(invalid='ignore'), warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                data = reduce(data, axis=-1)[..., None]
+                ds = reduce(ds, axis=-1)[..., None]
+        values.append(data)
+        positions.append(ds)
+    return np.concatenate(values, axis=-1), np.concatenate(positions, axis=-1)
+
+
+def profileMaxima(values, positions):
+    """
+    Position of the maximum of every profile along the last axis of
+    `values`, ignoring NaNs. Profiles without any data evaluate to NaN.
+    """
+    valid = ~np.isnan(values)
+    index = np.argmax(np.where(valid, values, -np.inf), axis=-1)
+    maxima = np.take_along_axis(positions, index[..., None], axis=-1)[..., 0]
+    return np.where(valid.any(axis=-1), maxima, np.nan)
+
+
+def sampleMeans(values, n):
+    """
+    Means of every n consecutive samples, as TemporalPlot.averageData
+    computes them: the samples are padded with NaN to a multiple of n, so a
+    trailing group with fewer than n samples evaluates to NaN.
+    """
+    values = np.asarray(values, dtype=float).ravel()
+    rest = values.size % n
+    if rest:
+        values = np.pad(values, (0, n - rest), 'constant',
+                        constant_values=np.nan)
+    return values.reshape(-1, n).mean(axis=1)
+
+
+def synchronizeELMs(time, data, ELMonsets, ELMends, ELMmaxima, ELMtoELM,
+                    start, end, normalize=False, compare='Start', pad=0.,
+                    binning=False, binNumber=None):
+    """
+    ELM-synchronizes the samples of a temporal signal for every ELM with an
+    onset in [start, end], see TemporalPlot.computeCELMA. Every ELM takes
+    the samples from 1 ms before its onset to the next onset, both widened
+    by `pad` seconds, shifted to its onset, end or maximum according to
+    `compare` ('Start', 'End' or 'Maximum'). With `normalize` the times are
+    given in units of the ELM-to-ELM duration.
+
+    Returns a dictionary holding the ELM onsets ('onsets'), the
+    synchronized time and data arrays of each ELM ('times', 'data'), the
+    ELM durations ('durations') and the sign with which the longest
+    selected duration is to be marked ('durationSign', None if it is not
+    marked), the minimum and maximum of time and data of each ELM
+    ('ranges', one row per ELM) and the ELMAggregate of binNumber bins
+    ('aggregate', None unless binning). Returns None if there are no ELMs
+    in range. Raises ValueError for an unknown compare mode.
+    """
+    time = np.asarray(time, dtype=float)
+    data = np.asarray(data, dtype=float)
+    valid = ~np.isnan(data)
+    time = time[valid]
+    data = data[valid]
+
+    ind = np.where((ELMonsets >= start) & (ELMonsets <= end))[0]
+    if len(ind) == 0:
+        return
+    ELMonsets = ELMonsets[ind]
+    ELMtoELM = ELMtoELM[ind]
+    ELMends = ELMends[ind]
+    ELMmaxima = ELMmaxima[ind]
+    ELMdurations = ELMends - ELMonsets
+
+    if compare == 'Start':
+        shiftArray = ELMonsets
+        durationSign = 1
+    elif compare == 'End':
+        shiftArray = ELMends
+        durationSign = -1
+    elif compare == 'Maximum':
+        shiftArray = ELMmaxima
+        durationSign = None
+    else:
+        raise ValueError('Unknown compare mode {}'.format(compare))
+
+    times = []
+    datas = []
+    ranges = np.full((len(ind), 4), np.nan)
+    for i, (ton, dt, shift) in enumerate(zip(ELMonsets, ELMtoELM,
+                                             shiftArray)):
+        window = np.where((ton - 0.001 - pad <= time) &
+                          (time <= ton + dt + pad))[0]
+        if normalize:
+            timeELM = (time[window] - shift)/dt
+        else:
+            timeELM = time[window] - shift
+        times.append(timeELM)
+        datas.append(data[window])
+        if len(window):
+            ranges[i] = (timeELM.min(), timeELM.max(),
+                         data[window].min(), data[window].max())
+
+    aggregate = None
+    if binning:
+        aggregate = ELMAggregate(binNumber, times, datas)
+
+    return {'onsets': ELMonsets,
+            'times': times,
+            'data': datas,
+            'durations': ELMdurations,
+            'durationSign': durationSign,
+            'ranges': ranges,
+            'aggregate': aggregate}
+
+
+class CELMACube():
+    """
+    ELM-synchronized data cube of a spatial plot. For every phase (POI
+    relative to the ELM onsets), every ELM and every probe it holds the
+    averaged data and strikeline distances that SpatialPlot.computeCELMA
+    would extract at that POI. Building gathers all windows at once, after
+    which a frame is a plain lookup for any selection of the ELMs.
+
+    Assumes the time arrays of all probes to be identical and sorted, which
+    the windowing in SpatialPlot.getDataInTimeWindow assumes as well.
+    """
+    def __init__(self, phases, ELMonsets, ELMtoELM, unit, timeArray, data,
+                 times, positions, ssl, range, avgNum, ignoreNans=True):
+        """
+        Parameters:
+            phases:     POIs relative to the ELM onsets, as passed to
+                        coherentELMaveraging
+            ELMonsets:  onsets of the ELMs to synchronize
+            ELMtoELM:   ELM-to-ELM durations, one more than ELMonsets. The
+                        first element belongs to the ELM preceding the
+                        first onset.
+            unit:       '%' or '0.1 ms'
+            timeArray:  common time base used to locate the POIs
+            data:       dict probe -> data array
+            times:      dict probe -> time array
+            positions:  dict probe -> absolute probe position
+            ssl:        dict with strikeline 'time' and 'data' arrays
+            range:      number of samples around the POI to take into account
+            avgNum:     number of samples to average to one value
+            ignoreNans: drop NaN samples before averaging
+        """
+        self.phases = np.asarray(phases, dtype=float)
+        ELMonsets = np.asarray(ELMonsets, dtype=float)
+        ELMtoELM = np.asarray(ELMtoELM, dtype=float)
+        self.unit = unit
+        self.ELMonsets = ELMonsets
+        self.probes = sorted(data.keys())
+
+        # POIs of all phases and ELMs, shape (phases, ELMs)
+        if unit == '%':
+            durations = np.where(self.phases[:, None] > 0,
+                                 ELMtoELM[None, 1:], ELMtoELM[None, :-1])
+            self.shifted = durations * self.phases[:, None]
+            self.POIs = ELMonsets[None, :] + self.shifted
+        elif unit == '0.1 ms':
+            self.shifted = self.phases[:, None]
+            self.POIs = ELMonsets[None, :] + self.phases[:, None]
+        else:
+            raise ValueError('Unknown POI unit {}'.format(unit))
+
+        # Windows of all phases and ELMs, shape (phases, ELMs, groups)
+        centers = nearestIndices(timeArray, self.POIs)
+        self.data, self.positions, self.exists = windowAverages(
+                centers, data, times, positions, ssl, range, avgNum,
+                ignoreNans)
+
+    @property
+    def nbytes(self):
+        arrays = [self.phases, self.ELMonsets, self.shifted, self.POIs]
+        for values in (self.data, self.positions, self.exists):
+            arrays += values.values()
+        return sum(np.asarray(a).nbytes for a in arrays)
+
+    def phaseIndex(self, phase):
+        """ Index of `phase` in the cube or None if it is not covered """
+        if self.phases.size == 0:
+            return
+        i = np.abs(self.phases - phase).argmin()
+        if abs(self.phases[i] - phase) > 1e-9:
+            return
+        return i
+
+    def covers(self, phases):
+        return all(self.phaseIndex(phase) is not None for phase in phases)
+
+    def frame(self, phase, selected=None):
+        """
+        Returns the CELMA at `phase` of the ELMs in the boolean mask
+        `selected` (default: all) in the format of SpatialPlot.computeCELMA.
+        Returns None if the phase is not in the cube.
+        """
+        p = self.phaseIndex(phase)
+        if p is None:
+            return
+        if selected is None:
+            selected = np.ones(self.POIs.shape[1], dtype=bool)
+        elms = np.flatnonzero(selected)
+        order = elms[np.argsort(self.POIs[p][elms], kind='mergesort')]
+        POIs = self.POIs[p][order]
+        shifted = self.shifted[p]
+        if self.unit == '%':
+            shifted = shifted[elms]
+        data = {}
+        positions = {}
+        for e, POI in zip(order, POIs):
+            data[POI] = {}
+            positions[POI] = {}
+            for probe in self.probes:
+                exists = self.exists[probe][p, e]
+                data[POI][probe] = self.data[probe][p, e][exists]
+                positions[POI][probe] = self.positions[probe][p, e][exists]
+        return {'POIs': POIs,
+                'POIsShifted': np.sort(shifted),
+                'data': data,
+                'positions': positions}
+
+
+class RankTree():
+    """
+    Fenwick tree counting the selected elements of a fixed sorted array.
+    Selecting or deselecting m elements and finding the k-th selected
+    element both take O(log size) per element.
+    """
+    def __init__(self, selected):
+        """ selected: boolean mask of the initially selected elements """
+        self.size = len(selected)
+        prefix = np.concatenate(([0], np.cumsum(selected, dtype=int)))
+        index = np.arange(1, self.size + 1)
+        self.tree = np.zeros(self.size + 1, dtype=int)
+        self.tree[1:] = prefix[index] - prefix[index - (index & -index)]
+        self.top = 1
+        while self.top * 2 <= self.size:
+            self.top *= 2
+
+    @property
+    def nbytes(self):
+        return self.tree.nbytes
+
+    def update(self, positions, delta):
+        """ Adds delta (1 or -1) to the elements at positions """
+        index = np.asarray(positions, dtype=int) + 1
+        while index.size:
+            np.add.at(self.tree, index, delta)
+            index = index + (index & -index)
+            index = index[index <= self.size]
+
+    def select(self, ranks):
+        """ Positions of the selected elements of the given 0-based ranks """
+        ranks = np.asarray(ranks, dtype=int) + 1
+        position = np.zeros(ranks.shape, dtype=int)
+        step = self.top
+        while step:
+            following = position + step
+            inside = following <= self.size
+            counts = np.where(inside,
+                              self.tree[np.minimum(following, self.size)], 0)
+            advance = inside & (counts < ranks)
+            position = np.where(advance, following, position)
+            ranks = ranks - np.where(advance, counts, 0)
+            step //= 2
+        return position
+
+
+class ELMAggregate():
+    """
+    Binned aggregate of ELM-synchronized data that supports adding and
+    removing single ELMs. Running sums and counts per bin are updated in
+    time proportional to the samples of the toggled ELM. The samples of all
+    ELMs are kept sorted by bin and value once, and a RankTree over them
+    counts the selected ones, so medians, percentiles, minima and maxima of
+    any selection are found in O(bins log samples) as well. Other reducers
+    and spreads filter the sorted samples of the selection, which takes
+    time proportional to all samples.
+
+    The bins span the data of the selected ELMs, as in Binning.reduce. Only
+    a selection change that moves this span rebuilds the aggregate.
+    """
+    def __init__(self, n, x, y, selected=None):
+        """
+        n:          number of bins
+        x, y:       lists holding the synchronized time and data array of
+                    each ELM
+        selected:   boolean mask of the ELMs to aggregate, defaults to all
+        """
+        self.n = n
+        self.x = []
+        self.y = []
+        for _x, _y in zip(x, y):
+            _x = np.asarray(_x, dtype=float).ravel()
+            _y = np.asarray(_y, dtype=float).ravel()
+            valid = ~(np.isnan(_x) | np.isnan(_y))
+            self.x.append(_x[valid])
+            self.y.append(_y[valid])
+        self.xmin = np.array([_x.min() if _x.size else np.inf
+                              for _x in self.x])
+        self.xmax = np.array([_x.max() if _x.size else -np.inf
+                              for _x in self.x])
+        self.edges = None
+        if selected is None:
+            selected = np.ones(len(self.x), dtype=bool)
+        self.selected = np.zeros(len(self.x), dtype=bool)
+        self.select(selected)
+
+    @property
+    def nbytes(self):
+        arrays = self.x + self.y
+        if self.edges is not None:
+            arrays += self.bins + self.ranks + [
+                    self.sortedValues, self.sortedELMs, self.sortedBins,
+                    self.sums, self.counts, self.rankTree]
+        return sum(a.nbytes for a in arrays)
+
+    def spanEdges(self, selected):
+        """ Bin edges spanning the data of the selected ELMs """
+        if not selected.any():
+            return
+        lo = self.xmin[selected].min()
+        hi = self.xmax[selected].max()
+        if not np.isfinite(lo):
+            return
+        return np.linspace(lo, hi, self.n + 1)
+
+    def rebuild(self, edges, selected):
+        """ Bins all samples for the given edges and resets the totals """
+        self.edges = edges
+        self.centers = (edges[:-1] + edges[1:]) / 2.
+        self.bins = []
+        for _x in self.x:
+            bins = np.searchsorted(edges[1:-1], _x, side='right')
+            # Samples outside the span belong to unselected ELMs only
+            bins[(_x < edges[0]) | (_x > edges[-1])] = -1
+            self.bins.append(bins)
+
+        lengths = [len(_x) for _x in self.x]
+        bins = np.concatenate(self.bins) if lengths else np.array([], int)
+        values = np.concatenate(self.y) if lengths else np.array([])
+        elms = np.repeat(np.arange(len(self.x)), lengths)
+        inside = bins >= 0
+        bins, values, elms = bins[inside], values[inside], elms[inside]
+        order = np.lexsort((values, bins))
+        self.sortedBins = bins[order]
+        self.sortedValues = values[order]
+        self.sortedELMs = elms[order]
+        # Positions of the samples of each ELM in the sorted samples
+        byELM = np.argsort(self.sortedELMs, kind='mergesort')
+        perELM = np.bincount(self.sortedELMs, minlength=len(self.x))
+        self.ranks = np.split(byELM, np.cumsum(perELM)[:-1])
+        self.rankTree = RankTree(np.zeros(len(self.sortedValues), dtype=bool))
+
+        self.sums = np.zeros(self.n)
+        self.counts = np.zeros(self.n, dtype=int)
+        self.selected = np.zeros(len(self.x), dtype=bool)
+        for i in np.flatnonzero(selected):
+            self.add(i)
+
+    def add(self, i):
+        """ Adds ELM i to the running totals """
+        if self.selected[i]:
+            return
+        inside = self.bins[i] >= 0
+        bins = self.bins[i][inside]
+        self.sums += np.bincount(bins, self.y[i][inside], minlength=self.n)
+        self.counts += np.bincount(bins, minlength=self.n)
+        self.rankTree.update(self.ranks[i], 1)
+        self.selected[i] = True
+
+    def remove(self, i):
+        """ Removes ELM i from the running totals """
+        if not self.selected[i]:
+            return
+        inside = self.bins[i] >= 0
+        bins = self.bins[i][inside]
+        self.sums -= np.bincount(bins, self.y[i][inside], minlength=self.n)
+        self.counts -= np.bincount(bins, minlength=self.n)
+        self.rankTree.update(self.ranks[i], -1)
+        self.selected[i] = False
+
+    def select(self, selected):
+        """
+        Aggregates the ELMs in the boolean mask `selected`. Only the ELMs
+        whose state changes are added or removed, unless the span of the
+        selected data moves.
+        """
+        selected = np.asarray(selected, dtype=bool)
+        edges = self.spanEdges(selected)
+        if edges is None:
+            self.edges = None
+            self.selected = selected.copy()
+            return
+        if self.edges is None or not np.array_equal(edges, self.edges):
+            self.rebuild(edges, selected)
+            return
+        for i in np.flatnonzero(self.selected & ~selected):
+            self.remove(i)
+        for i in np.flatnonzero(selected & ~self.selected):
+            self.add(i)
+
+    def reduce(self, reducer='median', q=None, spread=None):
+        """
+        Reduces the selected ELMs' data in each bin. Arguments and return
+        value are the same as for Binning.reduce.
+        """
+        if self.edges is None or not self.counts.any():
+            return
+        reducer, q = Binning.parseReducer(reducer, q)
+        if reducer in ('mean', 'nanmean', 'sum') and spread is None:
+            filled = self.counts > 0
+            values = self.sums.copy()
+            if reducer != 'sum':
+                values[filled] /= self.counts[filled]
+            values[~filled] = 0
+            return self.centers, values, self.counts.copy(), None
+        quantiles = {'median': 50., 'nanmedian': 50., 'percentile': q,
+                     'min': 0., 'max': 100.}
+        if reducer in quantiles and spread is None:
+            return self.quantiles(quantiles[reducer])
+
+        keep = self.selected[self.sortedELMs]
+        values = self.sortedValues[keep]
+        binIndex = self.sortedBins[keep]
+        counts = np.bincount(binIndex, minlength=self.n)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        return Binning.reduceSegments(self.centers, values, binIndex, starts,
+                                      counts, reducer, q, spread,
+                                      presorted=True)
+
+    def quantiles(self, q):
+        """
+        Linearly interpolated q-th percentiles of the selected data in each
+        bin, as Binning.segmentQuantiles computes them, looked up in the
+        RankTree. Returns centers, values, counts, spreads like reduce.
+        """
+        counts = self.counts.copy()
+        filled = counts > 0
+        starts = np.cumsum(counts) - counts
+        pos = starts[filled] + q / 100. * (counts[filled] - 1)
+        lo = np.floor(pos).astype(int)
+        hi = np.ceil(pos).astype(int)
+        frac = pos - lo
+        low = self.sortedValues[self.rankTree.select(lo)]
+        high = self.sortedValues[self.rankTree.select(hi)]
+        values = np.zeros(self.n)
+        values[filled] = low + (high - low) * frac
+        return self.centers, values, counts, None
@@ -0,0 +1,257 @@
+import os
+import csv
+import json
+import time
+
+from jobqueue import JobQueue
+from shotdata import ShotLoader, ShotDataError
+
+OK = 'ok'
+MISSING = 'missing'
+ERROR = 'error'
+
+# Quantities of the plots the GUI creates when loading a shot
+QUANTITIES = ('jsat', 'te', 'ne')
+
+# Shot loader of a crawler process, set by initCrawler
+_loader = None
+
+def parseShots(spec):
+    """
+    Shot numbers from a specification like '33000-33010,33020,33025'.
+    Ranges include both ends. Raises ValueError for invalid specifications.
+    """
+    shots = []
+    for part in spec.replace(' ', '').split(','):
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            first, last = int(first), int(last)
+            if last < first:
+                raise ValueError('Invalid shot range {}'.format(part))
+            shots.extend(range(first, last + 1))
+        else:
+            shots.append(int(part))
+    return shots
+
+
+def readPhases(path):
+    """
+    (shot, start, end) tuples of the rows of a feature table CSV file as
+    written by FeaturePicker.saveTable, in order and without duplicates.
+    Start and end are kept as strings as the GUI uses them. Raises
+    ValueError if the columns 'Shot', 'CELMA start' and 'CELMA end' do not
+    exist.
+    """
+    phases = []
+    with open(path, 'r') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        try:
+            columns = [header.index(label)
+                       for label in ('Shot', 'CELMA start', 'CELMA end')]
+        except ValueError:
+            raise ValueError('Table needs the columns Shot, CELMA start and '
+                             'CELMA end')
+        for row in reader:
+            if not row:
+                continue
+            shot, start, end = [row[col].strip() for col in columns]
+            # Shots may be stored as floats, e.g. 33123.0
+            phase = (str(int(float(shot))), start, end)
+            if phase not in phases:
+                phases.append(phase)
+    return phases
+
+
+def makeEntry(shot, status, duration=0., message=''):
+    """ Result of crawling a shot as stored in checkpoints and job queues """
+    return {'shot': shot, 'status': status, 'duration': round(duration, 3),
+            'message': message, 'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def crawlData(loader, shotnr):
+    """
+    Reads all data the GUI loads for shot shotnr with the ShotLoader
+    loader, so that it ends up in the cache.
+
+    Returns the status of the shot and a message: OK, MISSING if some
+    diagnostic could not be read or ERROR if the shot cannot be loaded at
+    all, which is also the case if its ELM data is missing.
+    """
+    try:
+        loader.open(shotnr)
+        loader.openLSC()
+    except ShotDataError, e:
+        return ERROR, str(e)
+
+    # Per quantity True, False if the ELM data is missing or None if the
+    # plot cannot be created, as for ApplicationWindow.createPlot
+    oks = []
+    errors = []
+    for quantity in QUANTITIES:
+        try:
+            data = loader.shotData(quantity)
+            loader.positions(data)
+            loader.calibrations()
+        except ShotDataError, e:
+            errors.append(str(e))
+            oks.append(None)
+            continue
+        ok = True
+        for shared in ('elms', 'strikeline'):
+            try:
+                loader.shotData(shared)
+            except ShotDataError, e:
+                if str(e) not in errors:
+                    errors.append(str(e))
+                ok = None if shared == 'strikeline' else False
+        oks.append(ok)
+
+    if not any(oks):
+        return ERROR, '; '.join(errors)
+    loader.statData()
+    if all(oks):
+        return OK, ''
+    return MISSING, '; '.join(errors)
+
+
+def initCrawler(settings):
+    """
+    Pool initializer, creates the ShotLoader of a crawler process from the
+    dict settings of its keyword arguments
+    """
+    global _loader
+    _loader = ShotLoader(**settings)
+
+
+def crawlShot(shotnr):
+    """
+    Crawls shot shotnr in a crawler process. Returns the shot, its status,
+    the duration and a message.
+    """
+    start = time.time()
+    try:
+        status, message = crawlData(_loader, shotnr)
+    except Exception, e:
+        status, message = ERROR, "{}: {}".format(type(e).__name__, e)
+    return shotnr, status, time.time() - start, message
+
+
+def crawlQueueWorker(path):
+    """
+    Crawls the jobs of the queue at path in a crawler process until none is
+    left, also waiting for jobs leased by other workers in case their lease
+    expires.
+    """
+    queue = JobQueue(path)
+    while True:
+        job = queue.acquire()
+        if job is None:
+            if queue.finished():
+                return
+            time.sleep(10)
+            continue
+        name, shots = job
+        results = []
+        for shotnr in shots:
+            shotnr, status, duration, message = crawlShot(shotnr)
+            results.append(makeEntry(shotnr, status, duration, message))
+            queue.renew(name)
+        queue.complete(name, results)
+
+
+class Checkpoint(object):
+    """
+    Append-only record of crawled shots. Every line of the file is a JSON
+    object with the shot number, its status (OK, MISSING or ERROR), the
+    crawl duration and a message, so an interrupted crawl loses at most the
+    shots in progress and can be resumed from the file. Later entries of a
+    shot supersede earlier ones.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Line cut off by a crash
+                        continue
+                    self.entries[entry['shot']] = entry
+
+    def status(self, shot):
+        entry = self.entries.get(shot)
+        return entry['status'] if entry else None
+
+    def pending(self, shots, retry=(ERROR,)):
+        """ Shots not crawled yet or with a status contained in retry """
+        return [shot for shot in shots
+                if shot not in self.entries
+                or self.entries[shot]['status'] in retry]
+
+    def record(self, shot, status, duration=0., message=''):
+        self.add([makeEntry(shot, status, duration, message)])
+
+    def add(self, entries):
+        """ Records entries created by makeEntry, e.g. merged from a queue """
+        with open(self.path, 'a') as f:
+            for entry in entries:
+                self.entries[entry['shot']] = entry
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def counts(self, shots=None):
+        """ Number of shots per status, of all shots or the given ones """
+        counts = dict((status, 0) for status in (OK, MISSING, ERROR))
+        if shots is not None:
+            shots = set(shots)
+        for shot, entry in self.entries.iteritems():
+            if shots is None or shot in shots:
+                counts[entry['status']] = counts.get(entry['status'], 0) + 1
+        return counts
+
+
+class Throughput(object):
+    """ Tracks the crawl rate and estimates the remaining time """
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.start = time.time()
+
+    def update(self, n=1):
+        self.done += n
+
+    def set(self, done):
+        self.done = done
+
+    @property
+    def rate(self):
+        """ Shots per hour """
+        elapsed = time.time() - self.start
+        return self.done / elapsed * 3600 if elapsed > 0 else 0.
+
+    @property
+    def eta(self):
+        """ Estimated remaining time in seconds, None while unknown """
+        if not self.done:
+            return None
+        elapsed = time.time() - self.start
+        return elapsed / self.done * (self.total - self.done)
+
+    def summary(self):
+        eta = self.eta
+        if eta is None:
+            left = '??:??:??'
+        else:
+            m, s = divmod(eta, 60)
+            h, m = divmod(m, 60)
+            left = '{:02}:{:02}:{:02.0f}'.format(int(h), int(m), s)
+        return ('{} of {} shots ({:.1f}%), {:.1f} shots/h, time left: {}'
+                .format(self.done, self.total,
+                        100. * self.done / self.total if self.total else 100.,
+                        self.rate, left))
@@ -0,0 +1,139 @@
+import sys
+
+import numpy as np
+
+# Cost of the cells outside the band
+UNREACHABLE = float(sys.maxint)
+
+# Band cells by (M, N, window), pairs of sequences mostly share their shape
+_bands = {}
+
+def distance(x, y):
+    return np.abs(x - y)
+
+
+def bandCells(M, N, window=None):
+    """
+    Flat indices into an M x N matrix of the cells (i, j) with i, j > 0 and
+    |i - j| <= window, ordered by anti-diagonal i + j, and the boundaries
+    of the anti-diagonals in that order.
+    """
+    if window is None or window > M + N:
+        window = M + N
+    key = (M, N, window)
+    if key in _bands:
+        return _bands[key]
+    i, j = np.nonzero(np.abs(np.subtract.outer(np.arange(M), np.arange(N)))
+                      <= window)
+    inner = (i > 0) & (j > 0)
+    i, j = i[inner], j[inner]
+    order = np.argsort(i + j, kind='mergesort')
+    i, j = i[order], j[order]
+    bounds = np.flatnonzero(np.diff(i + j)) + 1
+    bounds = np.concatenate([[0], bounds, [len(i)]])
+    _bands[key] = i, j, bounds
+    return i, j, bounds
+
+
+def costMatrix(A, B, window=None, d=distance):
+    """
+    Accumulated cost matrix of dynamic time warping of the sequences A and
+    B. Only the Sakoe-Chiba band |i - j| <= window (everything if window is
+    None) and the first row and column are computed, the other cells are
+    UNREACHABLE. The cells of an anti-diagonal only depend on the two
+    previous anti-diagonals, so each of them is computed at once with
+    numpy. d is the distance of elements and is called with arrays.
+    """
+    A, B = np.array(A), np.array(B)
+    M, N = len(A), len(B)
+    cost = np.full((M, N), UNREACHABLE)
+    cost[:, 0] = np.cumsum(d(A, B[0]))
+    cost[0, :] = np.cumsum(d(A[0], B))
+    i, j, bounds = bandCells(M, N, window)
+    distances = d(A[i], B[j])
+    cells = i * N + j
+    diagonal, left, up = cells - N - 1, cells - 1, cells - N
+    flat = cost.ravel()
+    for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        best = flat[diagonal[start:end]]
+        # Taken in the order of min() over (diagonal, left, up), which
+        # keeps the first of equal or NaN costs
+        for other in (flat[left[start:end]], flat[up[start:end]]):
+            best = np.where(other < best, other, best)
+        flat[cells[start:end]] = best + distances[start:end]
+    return cost
+
+
+def warpingPath(cost):
+    """ Optimal warping path through the cost matrix, from the end """
+    M, N = cost.shape
+    # Python floats are faster to look up one by one
+    cost = cost.tolist()
+    n, m = N - 1, M - 1
+    path = []
+    while (m, n) != (0, 0):
+        path.append((m, n))
+        m, n = min((m - 1, n), (m, n - 1), (m - 1, n - 1),
+                   key=lambda x: cost[x[0]][x[1]])
+    path.append((0, 0))
+    return path
+
+
+def dtw(A, B, window=None, d=distance, path=True):
+    """
+    Dynamic time warping distance of the sequences A and B within a
+    Sakoe-Chiba band of half width window, see costMatrix. Returns the cost
+    and the warping path, or only the cost if path is False.
+    """
+    cost = costMatrix(A, B, window, d)
+    if not path:
+        return cost[-1, -1]
+    return cost[-1, -1], warpingPath(cost)
+
+
+def envelope(B, length, window=None):
+    """
+    Upper and lower envelope of the sequence B for a sequence of the given
+    length: the extremes of the elements of B that a warping path within
+    the Sakoe-Chiba band of half width window can pair with each of its
+    positions, see costMatrix. These are the elements within window of the
+    position and the first element, whose column is computed outside the
+    band. NaN elements are left out.
+    """
+    B = np.asarray(B, dtype=float)
+    N = len(B)
+    if window is None or window > max(length, N):
+        window = max(length, N)
+    upper = np.full(length, B[0])
+    lower = np.full(length, B[0])
+    positions = np.arange(length)
+    for offset in xrange(-window, window + 1):
+        index = positions + offset
+        valid = (index >= 0) & (index < N)
+        upper[valid] = np.fmax(upper[valid], B[index[valid]])
+        lower[valid] = np.fmin(lower[valid], B[index[valid]])
+    return upper, lower
+
+
+def lowerBound(A, upper, lower):
+    """
+    LB_Keogh lower bound of the dynamic time warping cost of the sequence A
+    against a sequence with the envelope upper, lower (see envelope) for
+    the absolute distance: every element of A is paired at least once, at
+    best with the nearest value within the envelope. NaN elements do not
+    count.
+    """
+    A = np.asarray(A, dtype=float)
+    with np.errstate(invalid='ignore'):
+        excess = np.where(A > upper, A - upper,
+                          np.where(A < lower, lower - A, 0.))
+    return np.nansum(excess)
+
+
+def dtwLowerBound(A, B, window=None):
+    """
+    Lower bound of dtw(A, B, window, path=False), the larger of the
+    LB_Keogh bounds of A against B and B against A
+    """
+    return max(lowerBound(A, *envelope(B, len(A), window)),
+               lowerBound(B, *envelope(A, len(B), window)))
@@ -0,0 +1,519 @@
+import os
+import csv
+import json
+
+import numpy as np
+import pandas as pd
+
+# Columns identifying a row of the feature database
+KEY = ['Shot', 'CELMA start', 'CELMA end', 'quantity', 'probe']
+
+NUMBER = 'number'
+TEXT = 'text'
+COORDINATE = 'coordinate'
+
+def toNumbers(text):
+    """ Floats of the numeric strings of the Series text, NaN elsewhere """
+    numbers = pd.to_numeric(text, errors='coerce')
+    valid = numbers.notnull()
+    try:
+        # to_numeric may be off in the last digit, float() is exact
+        numbers[valid] = text[valid].values.astype(float)
+    except ValueError:
+        pass
+    return numbers
+
+
+def parseColumn(values):
+    """
+    Typed values of a column of feature table cells given as strings.
+    Columns of numbers and empty cells become float columns. Otherwise,
+    numbers are converted to floats, 'x | y' to coordinate tuples of floats
+    (both NaN if either is invalid) and other text is kept without question
+    marks. Empty cells and cells with more than one '|' become NaN.
+    """
+    text = pd.Series(values, dtype=object).fillna('').astype(unicode)
+    text = text.str.strip()
+    numbers = toNumbers(text)
+    empty = text.str.lower().isin([u'', u'nan'])
+    if (numbers.notnull() | empty).all():
+        return numbers.astype(float)
+
+    column = text.str.replace('?', '', regex=False)
+    column = column.where(~empty, np.nan).astype(object)
+    isNumber = numbers.notnull()
+    column[isNumber] = numbers[isNumber]
+    parts = text.str.count(r'\|')
+    column[parts > 1] = np.nan
+    isCoordinate = (parts == 1) & ~isNumber
+    if isCoordinate.any():
+        xy = text[isCoordinate].str.split('|', n=1, expand=True)
+        x = toNumbers(xy[0].str.strip())
+        y = toNumbers(xy[1].str.strip())
+        invalid = x.isnull() | y.isnull()
+        x[invalid] = np.nan
+        y[invalid] = np.nan
+        column[isCoordinate] = pd.Series(list(zip(x, y)), index=x.index)
+    return column
+
+
+def formatValue(value):
+    """ Text of a cell value as shown in and saved from the feature table """
+    if isinstance(value, tuple):
+        return u'{} | {}'.format(*value)
+    if value is None:
+        return u''
+    if isinstance(value, (float, np.floating)):
+        value = float(value)
+        if np.isnan(value):
+            return u''
+        if value.is_integer() and abs(value) < 1e15:
+            return unicode(int(value))
+        return unicode(repr(value))
+    if isinstance(value, str):
+        return value.decode('utf8')
+    return unicode(value)
+
+
+def isEmpty(value):
+    return value is None or (isinstance(value, (float, np.floating)) and
+                             np.isnan(value))
+
+
+def isNumber(value):
+    return (isinstance(value, (int, long, float, np.number)) and
+            not isinstance(value, bool))
+
+
+def coordinateLabels(label):
+    """ Labels of the x and y columns of coordinate column label """
+    return label + ' x', label + ' y'
+
+
+def columnKind(column):
+    """
+    Kind of a column of typed cells: NUMBER for numbers and empty cells,
+    COORDINATE for coordinates and empty cells and TEXT otherwise. TEXT
+    columns may mix text, numbers and coordinates.
+    """
+    if column.dtype.kind in 'biuf':
+        return NUMBER
+    cells = [cell for cell in column.values if not isEmpty(cell)]
+    if all(isNumber(cell) for cell in cells):
+        return NUMBER
+    if all(isinstance(cell, tuple) for cell in cells):
+        return COORDINATE
+    return TEXT
+
+
+def rowKey(shot, start, end, quantity, probe):
+    """
+    Normalized key of a row, so that e.g. the shot 33123, 33123.0 and
+    '33123' all match. Numbers are floats, missing text is ''.
+    """
+    def number(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
+    return (number(shot), number(start), number(end),
+            formatValue(quantity).replace('?', ''),
+            formatValue(probe).replace('?', ''))
+
+
+def _encode(value):
+    if isinstance(value, tuple):
+        return [None if isEmpty(v) else float(v) for v in value]
+    if isEmpty(value):
+        return None
+    if isNumber(value):
+        return float(value)
+    return formatValue(value)
+
+
+def _decode(value):
+    if isinstance(value, list):
+        return tuple(np.nan if v is None else v for v in value)
+    if value is None:
+        return np.nan
+    return value
+
+
+class FeatureDatabase(object):
+    """
+    Feature database shared by the GUI and the analysis scripts.
+
+    The rows are identified by KEY and, as a table may hold several rows of
+    the same KEY, by their occurrence among these. The table of typed cells
+    (see parseColumn) is stored column by column in a numpy archive at path:
+    numbers as floats, coordinates as two float columns and text as
+    strings. `frame` is the DataFrame the analysis works with. Its index
+    is a sorted MultiIndex over KEY, numbers are floats, every coordinate
+    column is split into the float columns given by coordinateLabels and
+    text columns are kept as typed cells.
+
+    upsert() appends the rows it changes to a journal next to the archive
+    (<path>.journal, one JSON object per line). Reading the database
+    replays the journal, also if there is no archive yet, save() merges it
+    into the archive. Files of earlier versions of the feature table are
+    read and written by fromCsv() and exportCsv().
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self._setTable(pd.DataFrame(columns=KEY))
+        if path is None:
+            return
+        if os.path.isfile(path):
+            self._read()
+        if os.path.isfile(self.journalPath):
+            self._replay()
+
+    @property
+    def journalPath(self):
+        return self.path + '.journal'
+
+    @classmethod
+    def fromCsv(cls, csvPath, path=None):
+        """
+        Database of the feature table CSV file at csvPath. It is written to
+        path only by save().
+        """
+        df = pd.read_csv(csvPath, dtype=object, keep_default_na=False,
+                         encoding='utf8')
+        db = cls(path)
+        db._setTable(df.apply(parseColumn))
+        return db
+
+    @staticmethod
+    def exists(path):
+        """ Whether there is a database at path, saved or only journaled """
+        return os.path.isfile(path) or os.path.isfile(path + '.journal')
+
+    @classmethod
+    def open(cls, path):
+        """ Database at path, which may also be a feature table CSV file """
+        if path.lower().endswith('.csv'):
+            return cls.fromCsv(path)
+        return cls(path)
+
+    def _setTable(self, table):
+        """ Replaces the database by table, a DataFrame of typed cells """
+        table = table.reset_index(drop=True)
+        for label in KEY:
+            if label not in table.columns:
+                table[label] = np.nan
+        keys = [rowKey(*key) for key in zip(*[table[label] for label
+                                               in KEY])]
+        for label, values in zip(KEY, zip(*keys) or [[]] * len(KEY)):
+            table[label] = pd.Series(values, index=table.index,
+                                     dtype=object)
+        for label in KEY[:3]:
+            table[label] = table[label].astype(float)
+        self.labels = [label for label in table.columns if label not in KEY]
+        self.kinds = dict((label, columnKind(table[label]))
+                          for label in table.columns)
+        for label, kind in self.kinds.iteritems():
+            if kind == NUMBER:
+                table[label] = pd.to_numeric(table[label], errors='coerce')
+        self._table = table
+        self._frame = None
+        self._keyIndex = None
+
+    def table(self):
+        """ Copy of the rows as DataFrame of typed cells """
+        return self._table.copy()
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            self._frame = self._buildFrame()
+        return self._frame
+
+    def _buildFrame(self):
+        table = self._table
+        columns = []
+        for label in self.labels:
+            if self.kinds[label] != COORDINATE:
+                columns.append(table[label])
+                continue
+            x = np.full(table.shape[0], np.nan)
+            y = np.full(table.shape[0], np.nan)
+            for row, cell in enumerate(table[label].values):
+                if isinstance(cell, tuple):
+                    x[row], y[row] = cell
+            xLabel, yLabel = coordinateLabels(label)
+            columns.append(pd.Series(x, index=table.index, name=xLabel))
+            columns.append(pd.Series(y, index=table.index, name=yLabel))
+        frame = pd.concat(columns, axis=1) if columns else \
+            pd.DataFrame(index=table.index)
+        frame.index = pd.MultiIndex.from_arrays([table[label] for label
+                                                 in KEY], names=KEY)
+        return frame.sort_index()
+
+    def rows(self, shot=None, start=None, end=None, quantity=None,
+             probe=None):
+        """
+        Rows of frame matching the given key values, all rows for values
+        that are None. Looked up in the index.
+        """
+        values = (shot, start, end, quantity, probe)
+        key = rowKey(*values)
+        key = [slice(None) if value is None else normalized
+               for value, normalized in zip(values, key)]
+        try:
+            return self.frame.iloc[self.frame.index.get_locs(key)]
+        except KeyError:
+            return self.frame.iloc[:0]
+
+    def upsert(self, rows):
+        """
+        Updates the rows of the DataFrame rows of typed cells, matched by
+        KEY, or inserts them if they do not exist yet. The n-th row of rows
+        with a key matches the n-th row of the database with that key, so
+        rows of the same key are kept apart. Only the columns of rows are
+        changed; new columns are added. The changed cells are appended to the
+        journal. Returns the number of changed rows.
+        """
+        changes = []
+        occurrences = {}
+        for record in rows.to_dict('records'):
+            key = rowKey(*[record.get(label) for label in KEY])
+            cells = dict((label, value) for label, value in record.iteritems()
+                         if label not in KEY)
+            n = occurrences.get(key, 0)
+            occurrences[key] = n + 1
+            changes.append((key, n, cells))
+        changes = self._merge(changes)
+        if changes and self.path is not None:
+            with open(self.journalPath, 'a') as f:
+                for key, n, cells in changes:
+                    entry = {'key': [_encode(value) for value in key],
+                             'n': n,
+                             'cells': dict((label, _encode(value))
+                                           for label, value
+                                           in cells.iteritems())}
+                    f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        return len(changes)
+
+    def _positions(self):
+        """ Dict key -> positions of its rows, in order, built on demand """
+        if self._keyIndex is None:
+            index = {}
+            keys = zip(*[self._table[label].values for label in KEY])
+            for position, key in enumerate(keys):
+                index.setdefault(key, []).append(position)
+            self._keyIndex = index
+        return self._keyIndex
+
+    def _merge(self, changes):
+        """
+        Applies (key, n, cells) changes to the n-th row of key, or inserts a
+        row if key has fewer rows. Returns the changes that change data,
+        reduced to the cells that differ.
+        """
+        table = self._table
+        size = len(table)
+        positions = self._positions()
+        records = []
+        updates = {}
+
+        def current(position, label):
+            if position >= size:
+                return records[position - size].get(label, np.nan)
+            if position in updates.get(label, {}):
+                return updates[label][position]
+            if label not in table.columns:
+                return np.nan
+            return table[label].values[position]
+
+        def same(a, b):
+            if isEmpty(a) or isEmpty(b):
+                return isEmpty(a) and isEmpty(b)
+            return formatValue(a) == formatValue(b)
+
+        changed = []
+        for key, n, cells in changes:
+            rows = positions.setdefault(key, [])
+            if n >= len(rows):
+                record = dict(zip(KEY, key))
+                record.update(cells)
+                rows.append(size + len(records))
+                records.append(record)
+                changed.append((key, n, cells))
+                continue
+            position = rows[n]
+            cells = dict((label, value) for label, value in cells.iteritems()
+                         if not same(current(position, label), value))
+            if not cells:
+                continue
+            for label, value in cells.iteritems():
+                if position >= size:
+                    records[position - size][label] = value
+                else:
+                    updates.setdefault(label, {})[position] = value
+            changed.append((key, n, cells))
+        if changed:
+            self._apply(updates, records)
+        return changed
+
+    def _apply(self, updates, records):
+        """
+        Writes the updated cells, dict label -> {position: value}, and
+        appends the records of new rows. Only the changed columns are
+        checked for their kind again, unchanged ones are kept as they are.
+        """
+        table = self._table
+        size = len(table)
+        labels = list(table.columns)
+        if size == 0:
+            for record in records:
+                labels.extend(label for label in record if label not in labels)
+            keyIndex = self._keyIndex
+            self._setTable(pd.DataFrame.from_records(records, columns=labels))
+            self._keyIndex = keyIndex
+            return
+
+        cells = dict((label, dict(values)) for label, values
+                     in updates.iteritems())
+        for i, record in enumerate(records):
+            for label, value in record.iteritems():
+                cells.setdefault(label, {})[size + i] = value
+                if label not in labels:
+                    labels.append(label)
+        if records:
+            table = table.reindex(range(size + len(records)))
+        for label in labels:
+            if label not in cells:
+                continue
+            values = cells[label]
+            if label in table.columns:
+                kind = self.kinds[label]
+                column = table[label].values
+            else:
+                kind = NUMBER
+                column = np.full(len(table), np.nan)
+            if label in KEY:
+                column = column.copy()
+                for position, value in values.iteritems():
+                    column[position] = value
+                table[label] = column
+                continue
+            if kind == NUMBER and all(isNumber(value) or isEmpty(value)
+                                      for value in values.itervalues()):
+                column = column.astype(float)
+                for position, value in values.iteritems():
+                    column[position] = np.nan if isEmpty(value) else value
+                table[label] = column
+                continue
+            column = column.astype(object)
+            for position, value in values.iteritems():
+                column[position] = value
+            column = pd.Series(column, index=table.index)
+            # The kind is kept if the new cells cannot change it, a TEXT
+            # column with new text or a COORDINATE column with new
+            # coordinates, else it is checked on the whole column again
+            kept = [cell for cell in values.itervalues() if not isEmpty(cell)]
+            if not (kind == TEXT and any(
+                        not isNumber(cell) and not isinstance(cell, tuple)
+                        for cell in kept) or
+                    kind == COORDINATE and kept and
+                    all(isinstance(cell, tuple) for cell in kept)):
+                kind = columnKind(column)
+            if kind == NUMBER:
+                column = pd.to_numeric(column, errors='coerce')
+            table[label] = column
+            self.kinds[label] = kind
+        for label in labels:
+            self.kinds.setdefault(label, NUMBER)
+        self.labels = [label for label in table.columns if label not in KEY]
+        self._table = table
+        self._frame = None
+
+    def _replay(self):
+        changes = []
+        with open(self.journalPath, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Line cut off by a crash
+                    continue
+                key = tuple(_decode(value) for value in entry['key'])
+                cells = dict((label, _decode(value)) for label, value
+                             in entry['cells'].iteritems())
+                changes.append((key, entry.get('n', 0), cells))
+        self._merge(changes)
+
+    def _read(self):
+        with np.load(self.path) as archive:
+            labels = list(archive['labels'])
+            kinds = list(archive['kinds'])
+            columns = {}
+            for i, (label, kind) in enumerate(zip(labels, kinds)):
+                name = 'c{}'.format(i)
+                if kind == NUMBER:
+                    columns[label] = archive[name]
+                elif kind == COORDINATE:
+                    x, y = archive[name + 'x'], archive[name + 'y']
+                    valid = ~(np.isnan(x) & np.isnan(y))
+                    cells = np.full(len(x), np.nan, dtype=object)
+                    for row in np.flatnonzero(valid):
+                        cells[row] = (x[row], y[row])
+                    columns[label] = cells
+                else:
+                    columns[label] = parseColumn(archive[name]).values.astype(
+                        object)
+        self._setTable(pd.DataFrame(columns, columns=labels))
+        # Text columns stay text even if their cells all read as numbers,
+        # e.g. '2?' saved as '2'
+        for label, kind in zip(labels, kinds):
+            if kind == TEXT and self.kinds[label] != TEXT:
+                self._table[label] = columns[label]
+                self.kinds[label] = TEXT
+
+    def save(self, path=None):
+        """
+        Writes the database to path, by default the path it was read from,
+        and clears the journal.
+        """
+        if path is not None:
+            self.path = path
+        table = self._table
+        labels = list(table.columns)
+        kinds = [self.kinds.get(label, TEXT) for label in labels]
+        arrays = {'labels': np.array(labels, dtype=unicode),
+                  'kinds': np.array(kinds, dtype=unicode)}
+        for i, (label, kind) in enumerate(zip(labels, kinds)):
+            name = 'c{}'.format(i)
+            column = table[label]
+            if kind == NUMBER:
+                arrays[name] = column.values.astype(float)
+            elif kind == COORDINATE:
+                xy = [cell if isinstance(cell, tuple) else (np.nan, np.nan)
+                      for cell in column.values]
+                xy = np.array(xy, dtype=float).reshape(-1, 2)
+                arrays[name + 'x'], arrays[name + 'y'] = xy[:, 0], xy[:, 1]
+            else:
+                arrays[name] = np.array([formatValue(cell) for cell
+                                         in column.values], dtype=unicode)
+        # Written to a temporary file first so a crash keeps the old one
+        tmpPath = self.path + '.tmp'
+        with open(tmpPath, 'wb') as f:
+            np.savez(f, **arrays)
+        os.rename(tmpPath, self.path)
+        if os.path.isfile(self.journalPath):
+            os.remove(self.journalPath)
+
+    def exportCsv(self, path):
+        """ Writes the rows as feature table CSV file """
+        table = self._table
+        labels = list(table.columns)
+        columns = [[formatValue(cell).encode('utf8') for cell in table[label]]
+                   for label in labels]
+        with open(path, 'w') as stream:
+            writer = csv.writer(stream)
+            writer.writerow([unicode(label).encode('utf8')
+                             for label in labels])
+            writer.writerows(zip(*columns))
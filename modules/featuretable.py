@@ -0,0 +1,277 @@
+import csv
+
+import numpy as np
+import pandas as pd
+from PyQt4 import QtGui, QtCore
+
+from featuredb import parseColumn, formatValue
+
+GOTO = 'Go to'
+
+
+class FeatureTableModel(QtCore.QAbstractTableModel):
+    """
+    Table model over a DataFrame holding the typed values of the feature
+    table, one column per feature (see parseColumn). Rows are positions;
+    the DataFrame always has a default integer index. The 'Go to' column
+    holds no data, GotoDelegate draws a button into it instead.
+    """
+    def __init__(self, parent=None):
+        super(FeatureTableModel, self).__init__(parent)
+        self._df = pd.DataFrame()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._df.shape[0]
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._df.shape[1]
+
+    def labels(self):
+        return list(self._df.columns)
+
+    def label(self, column):
+        return self._df.columns[column]
+
+    def columnIndex(self, label):
+        """ Position of column label or None if there is none """
+        try:
+            return self.labels().index(label)
+        except ValueError:
+            return
+
+    def isGotoColumn(self, column):
+        return self.label(column) == GOTO
+
+    def value(self, row, label):
+        return self._df[label].iat[row]
+
+    def text(self, row, label):
+        return formatValue(self.value(row, label))
+
+    def texts(self, labels):
+        """ Display texts of the columns labels, one tuple per row """
+        columns = [[formatValue(v) for v in self._df[label]]
+                   for label in labels]
+        return zip(*columns)
+
+    def dataFrame(self):
+        """ Copy of the typed table data """
+        return self._df.copy()
+
+    def setDataFrame(self, df):
+        """ Replaces the table by df, whose columns are parsed already """
+        self.beginResetModel()
+        self._df = df.reset_index(drop=True)
+        self.endResetModel()
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return QtCore.QVariant()
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            if self.isGotoColumn(index.column()):
+                return QtCore.QVariant()
+            value = self._df.iat[index.row(), index.column()]
+            return QtCore.QVariant(formatValue(value))
+        return QtCore.QVariant()
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return QtCore.QVariant()
+        if orientation == QtCore.Qt.Horizontal:
+            if 0 <= section < self.columnCount():
+                return QtCore.QVariant(self.label(section))
+            return QtCore.QVariant()
+        return QtCore.QVariant(section + 1)
+
+    def flags(self, index):
+        if not index.isValid():
+            return QtCore.Qt.ItemIsEnabled
+        if self.isGotoColumn(index.column()):
+            return QtCore.Qt.ItemIsEnabled
+        return (QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable |
+                QtCore.Qt.ItemIsEditable)
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if not index.isValid() or role != QtCore.Qt.EditRole:
+            return False
+        text = unicode(value.toString())
+        self.setValue(index.row(), self.label(index.column()),
+                      parseColumn([text]).iloc[0])
+        return True
+
+    def setValue(self, row, label, value):
+        """
+        Sets the cell of row and column label. Strings are parsed like
+        loaded cells, other values are stored as they are.
+        """
+        if isinstance(value, basestring):
+            value = parseColumn([value]).iloc[0]
+        column = self._df[label]
+        isNumber = (isinstance(value, (int, long, float, np.number)) and
+                    not isinstance(value, bool))
+        if column.dtype.kind == 'f' and not isNumber:
+            # Text or coordinates in a column of numbers so far
+            self._df[label] = column = column.astype(object)
+        elif isNumber:
+            value = float(value)
+        if isinstance(value, tuple):
+            # Assigned as one object, not as a sequence of values
+            values = column.values.copy()
+            values[row] = value
+            self._df[label] = values
+        else:
+            self._df.iat[row, self.columnIndex(label)] = value
+        index = self.index(row, self.columnIndex(label))
+        self.dataChanged.emit(index, index)
+
+    def insertRows(self, position, count, parent=QtCore.QModelIndex()):
+        n = self.rowCount()
+        self.beginInsertRows(QtCore.QModelIndex(), position,
+                             position + count - 1)
+        order = np.concatenate([np.arange(position),
+                                np.arange(n, n + count),
+                                np.arange(position, n)])
+        self._df = (self._df.reindex(np.arange(n + count)).iloc[order]
+                    .reset_index(drop=True))
+        self.endInsertRows()
+        return True
+
+    def removeRows(self, position, count, parent=QtCore.QModelIndex()):
+        self.beginRemoveRows(QtCore.QModelIndex(), position,
+                             position + count - 1)
+        self._df = (self._df.drop(self._df.index[position:position + count])
+                    .reset_index(drop=True))
+        self.endRemoveRows()
+        return True
+
+    def clearRows(self):
+        self.beginResetModel()
+        self._df = self._df.iloc[:0]
+        self.endResetModel()
+
+    def addColumn(self, label):
+        """ Appends an empty column. Returns False if label exists. """
+        if label in self._df.columns:
+            return False
+        position = self.columnCount()
+        self.beginInsertColumns(QtCore.QModelIndex(), position, position)
+        self._df[label] = np.full(self.rowCount(), np.nan)
+        self.endInsertColumns()
+        return True
+
+    def removeColumns(self, position, count, parent=QtCore.QModelIndex()):
+        self.beginRemoveColumns(QtCore.QModelIndex(), position,
+                                position + count - 1)
+        self._df = self._df.drop(self._df.columns[position:position + count],
+                                 axis=1)
+        self.endRemoveColumns()
+        return True
+
+    def sortOrder(self, label, descending=False):
+        """
+        Row order sorting column label. Numbers sort before coordinates
+        (by x) and text, empty cells always come last.
+        """
+        column = self._df[label]
+        if column.dtype.kind == 'f':
+            values = column.values
+            # NaNs are sorted last either way
+            order = np.argsort(-values if descending else values,
+                               kind='mergesort')
+            return order
+        empty = column.isnull().values
+        valid = np.flatnonzero(~empty)
+
+        def key(i):
+            value = column.iat[i]
+            if isinstance(value, tuple):
+                return (1, value[0], u'')
+            if isinstance(value, (float, np.number)):
+                return (0, value, u'')
+            return (2, 0., formatValue(value))
+        valid = sorted(valid, key=key, reverse=descending)
+        return np.concatenate([np.array(valid, dtype=int),
+                               np.flatnonzero(empty)])
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        if not 0 <= column < self.columnCount() or self.isGotoColumn(column):
+            return
+        self.layoutAboutToBeChanged.emit()
+        rows = self.sortOrder(self.label(column),
+                              order == QtCore.Qt.DescendingOrder)
+        self._df = self._df.iloc[rows].reset_index(drop=True)
+        newRows = np.empty(len(rows), dtype=int)
+        newRows[rows] = np.arange(len(rows))
+        old = self.persistentIndexList()
+        self.changePersistentIndexList(
+            old, [self.index(int(newRows[index.row()]), index.column())
+                  for index in old])
+        self.layoutChanged.emit()
+
+    def load(self, path, columnOrder=None):
+        """
+        Replaces the table by the CSV file at path, with a 'Go to' column
+        first. columnOrder lists labels to put first in the given order.
+        """
+        df = pd.read_csv(path, dtype=object, keep_default_na=False,
+                         encoding='utf8')
+        self.setTable(df.apply(parseColumn), columnOrder)
+
+    def setTable(self, df, columnOrder=None):
+        """
+        Replaces the table by the DataFrame df of typed cells, with a 'Go to'
+        column first. columnOrder lists labels to put first in the given
+        order.
+        """
+        df = df.copy()
+        df.insert(0, GOTO, np.nan)
+        if columnOrder:
+            first = [label for label in columnOrder if label in df.columns]
+            df = df[first + [label for label in df.columns
+                             if label not in first]]
+        self.setDataFrame(df)
+
+    def save(self, path):
+        """ Writes the table without the 'Go to' column to a CSV file """
+        labels = [label for label in self.labels() if label != GOTO]
+        columns = [[formatValue(v).encode('utf8') for v in self._df[label]]
+                   for label in labels]
+        with open(path, 'w') as stream:
+            writer = csv.writer(stream)
+            writer.writerow([unicode(label).encode('utf8')
+                             for label in labels])
+            writer.writerows(zip(*columns))
+
+
+class GotoDelegate(QtGui.QStyledItemDelegate):
+    """
+    Draws a 'View' button into the 'Go to' column of a FeatureTableModel
+    and emits `clicked` with the row when it is clicked. Other columns are
+    drawn and edited as usual.
+    """
+    clicked = QtCore.pyqtSignal(int)
+
+    def paint(self, painter, option, index):
+        if not index.model().isGotoColumn(index.column()):
+            return super(GotoDelegate, self).paint(painter, option, index)
+        button = QtGui.QStyleOptionButton()
+        button.rect = option.rect
+        button.text = 'View'
+        button.state = QtGui.QStyle.State_Enabled
+        QtGui.QApplication.style().drawControl(QtGui.QStyle.CE_PushButton,
+                                               button, painter)
+
+    def editorEvent(self, event, model, option, index):
+        if not model.isGotoColumn(index.column()):
+            return super(GotoDelegate, self).editorEvent(event, model, option,
+                                                         index)
+        if event.type() == QtCore.QEvent.MouseButtonRelease:
+            if option.rect.contains(event.pos()):
+                self.clicked.emit(index.row())
+            return True
+        return event.type() in (QtCore.QEvent.MouseButtonPress,
+                                QtCore.QEvent.MouseButtonDblClick)
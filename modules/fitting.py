@@ -2,6 +2,8 @@ from scipy.optimize import curve_fit
 from scipy.special import erfc
 from scipy import exp
 from scipy.integrate import trapz
+import multiprocessing
+import time
 import numpy as np
 
 class FitFunctions():
@@ -30,7 +32,81 @@ class FitFunctions():
         return 0.5*p2*exp(z*z-(x)/p3)*erfc(z-(x)/p4) + p5
     
     @staticmethod
-    def fit(x, y, p0=None, detachment=False):
+    def eich_jacobian(x, p2, p3, p4, p5):
+        """ Analytic derivatives of eich_model, shape (len(x), 4) """
+        x = np.asarray(x, dtype=float)
+        z = p4/2.0/p3
+        u = z - x/p4
+        expo = np.exp(z*z - x/p3)
+        b = erfc(u)
+        # exp(z^2 - x/p3) * exp(-u^2), combined to avoid overflow
+        g = 2/np.sqrt(np.pi)*np.exp(z*z - x/p3 - u*u)
+        d2 = 0.5*expo*b
+        d3 = 0.5*p2*(expo*b*(x - z*p4)/p3**2 + g*p4/(2.0*p3**2))
+        d4 = 0.5*p2*(expo*b*z/p3 - g*(1/(2.0*p3) + x/p4**2))
+        d5 = np.ones_like(x)
+        return np.column_stack((d2, d3, d4, d5))
+
+    @staticmethod
+    def eich_jacobian_detached(x, p2, p3, p4, p5, p6):
+        """ Analytic derivatives of eich_model_detached, shape (len(x), 5) """
+        x = np.asarray(x, dtype=float)
+        jac = FitFunctions.eich_jacobian(x - p6, p2, p3, p4, p5)
+        # The shift enters as -d/dx of the undetached model
+        z = p4/2.0/p3
+        u = z - (x - p6)/p4
+        expo = np.exp(z*z - (x - p6)/p3)
+        g = 2/np.sqrt(np.pi)*np.exp(z*z - (x - p6)/p3 - u*u)
+        d6 = 0.5*p2*(expo*erfc(u)/p3 - g/p4)
+        return np.column_stack((jac, d6))
+
+    # Physically motivated bounds of the parameters of profiles normalized
+    # to their maximum. Lengths are given in m.
+    bounds = {
+            'eich': ([0, 1e-4, 1e-5, -np.inf],
+                     [np.inf, 0.5, 0.5, np.inf]),
+            'detached': ([0, 1e-4, 1e-5, -np.inf, -0.5],
+                         [np.inf, 0.5, 0.5, np.inf, 0.5]),
+            }
+    # Parameters fitted as logarithms in log space (lambda_q and S)
+    logParams = [1, 2]
+
+    # Accumulated over all fits, see FitFunctions.summary
+    statistics = {'fits': 0, 'converged': 0, 'evaluations': 0,
+                  'jacobians': 0}
+
+    @staticmethod
+    def resetStatistics():
+        for key in FitFunctions.statistics:
+            FitFunctions.statistics[key] = 0
+
+    @staticmethod
+    def summary(statistics=None):
+        """ Human-readable convergence rate and evaluations per fit """
+        if statistics is None:
+            statistics = FitFunctions.statistics
+        fits = statistics['fits']
+        if not fits:
+            return 'No fits'
+        return ('{} fits, {:.0f}% converged, {:.1f} evaluations and {:.1f} '
+                'jacobians per fit'
+                .format(fits, 100. * statistics['converged'] / fits,
+                        statistics['evaluations'] / float(fits),
+                        statistics['jacobians'] / float(fits)))
+
+    @staticmethod
+    def fit(x, y, p0=None, detachment=False, jacobian=True, bounded=True,
+            logSpace=False, statistics=None):
+        """
+        Fits the (detached) Eich model to y, which should be normalized to
+        its maximum. Uses the analytic jacobian and the parameter bounds in
+        FitFunctions.bounds unless disabled. Bounds are only imposed in a
+        second fit if the unbounded one fails or leaves them. With logSpace,
+        lambda_q and S are fitted as logarithms, which keeps them positive
+        and evens out their scale. The fit is counted in `statistics`,
+        FitFunctions.statistics by default. Raises RuntimeError if no fit
+        is found.
+        """
         if p0 is None:
             p0 = [
                     1, 
@@ -39,8 +115,248 @@ class FitFunctions():
                     np.median(y),
                     0.01
                  ]
-        
+
+        if detachment:
+            model = FitFunctions.eich_model_detached
+            jac = FitFunctions.eich_jacobian_detached
+            lower, upper = FitFunctions.bounds['detached']
+        else:
+            model = FitFunctions.eich_model
+            jac = FitFunctions.eich_jacobian
+            lower, upper = FitFunctions.bounds['eich']
+        n = len(lower)
+        p0 = np.array(p0[:n], dtype=float)
+        if bounded:
+            lower = np.array(lower, dtype=float)
+            upper = np.array(upper, dtype=float)
+            p0 = np.clip(p0, lower, upper)
+        else:
+            lower = np.full(n, -np.inf)
+            upper = np.full(n, np.inf)
+
+        logs = FitFunctions.logParams if logSpace else []
+        if logSpace:
+            p0[logs] = np.log(p0[logs])
+            with np.errstate(divide='ignore'):
+                lower[logs] = np.log(np.maximum(lower[logs], 0))
+            upper[logs] = np.log(upper[logs])
+
+        counts = {'evaluations': 0, 'jacobians': 0}
+
+        def toParams(theta):
+            params = np.array(theta, dtype=float)
+            params[logs] = np.exp(params[logs])
+            return params
+
+        def f(x, *theta):
+            counts['evaluations'] += 1
+            return model(x, *toParams(theta))
+
+        def j(x, *theta):
+            counts['jacobians'] += 1
+            params = toParams(theta)
+            derivatives = jac(x, *params)
+            derivatives[:, logs] *= params[logs]
+            return derivatives
+
+        kwargs = {}
+        if jacobian:
+            kwargs['jac'] = j
+
+        stats = statistics
+        if stats is None:
+            stats = FitFunctions.statistics
+        stats['fits'] += 1
+        try:
+            # The unbounded Levenberg-Marquardt fit is considerably cheaper
+            # per iteration than the bounded trust region reflective one and
+            # usually ends up inside the bounds anyway
+            try:
+                theta = curve_fit(f, x, y, p0=p0, **kwargs)[0]
+            except RuntimeError:
+                if not bounded:
+                    raise
+                theta = None
+            if bounded and (theta is None or (theta < lower).any() or
+                            (theta > upper).any()):
+                theta = curve_fit(f, x, y, p0=p0, bounds=(lower, upper),
+                                  **kwargs)[0]
+        finally:
+            stats['evaluations'] += counts['evaluations']
+            stats['jacobians'] += counts['jacobians']
+        stats['converged'] += 1
+        return toParams(theta)
+
+    @staticmethod
+    def canonicalProfile(x, y):
+        """
+        Returns the profile without points with NaN in x or y, sorted by x
+        (and y for equal x). Fits of profiles with the same canonical form
+        are identical.
+        """
+        x = np.asarray(x, dtype=float).ravel()
+        y = np.asarray(y, dtype=float).ravel()
+        valid = ~(np.isnan(x) | np.isnan(y))
+        x = x[valid]
+        y = y[valid]
+        order = np.lexsort((y, x))
+        return x[order], y[order]
+
+    @staticmethod
+    def evaluate(x, params, detachment=False):
+        """ Evaluates the (detached) Eich model with fitted parameters """
         if detachment:
-            return curve_fit(FitFunctions.eich_model_detached, x, y, p0=p0)[0]
+            return FitFunctions.eich_model_detached(x, *params)
+        return FitFunctions.eich_model(x, *params)
+
+
+def fitProfiles(args):
+    """
+    Fits a contiguous run of profiles, each one starting from the parameters
+    of its predecessor. Module-level so that it can be sent to worker
+    processes by BatchFitter.
+
+    args: (profiles, p0, detachment, logSpace) with profiles a list of
+          (x, y) tuples
+    Returns the parameters (NaN where no fit was found), the fit status of
+    each profile and the FitFunctions statistics of these fits alone.
+    """
+    profiles, p0, detachment, logSpace = args
+    statistics = dict.fromkeys(FitFunctions.statistics, 0)
+    nParams = len(p0) if detachment else len(p0) - 1
+    params = np.full((len(profiles), nParams), np.nan)
+    status = np.full(len(profiles), BatchFitter.NODATA, dtype=int)
+    warm = None
+    for i, (x, y) in enumerate(profiles):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        valid = ~(np.isnan(x) | np.isnan(y))
+        x = x[valid]
+        y = y[valid]
+        if x.size <= nParams:
+            warm = None
+            continue
+        # Normalize y values so curve_fit will not break because of too
+        # large/small values. Warm starts are exchanged in these units.
+        scale = np.max(np.abs(y))
+        if scale == 0:
+            warm = None
+            continue
+        y = y / scale
+
+        # Fall back to a cold start if the warm start does not converge
+        cold = list(p0[:3]) + [np.median(y)] + list(p0[4:])
+        ft = None
+        for start in ([cold] if warm is None else [warm, cold]):
+            try:
+                ft = FitFunctions.fit(x, y, p0=start, detachment=detachment,
+                                      logSpace=logSpace,
+                                      statistics=statistics)
+            except (RuntimeError, ValueError):
+                continue
+            if np.isfinite(ft).all():
+                break
+            ft = None
+
+        if ft is None:
+            status[i] = BatchFitter.FAILED
+            warm = None
+            continue
+        # Starting parameters always carry the detachment shift
+        warm = list(ft) + list(p0[len(ft):])
+        ft = np.array(ft, dtype=float)
+        # Scaling and background scale with the data
+        ft[0] *= scale
+        ft[3] *= scale
+        params[i] = ft
+        status[i] = BatchFitter.OK
+    return params, status, statistics
+
+
+class BatchFitter():
+    """
+    Fits the Eich model to series of profiles. The series is cut into
+    contiguous chunks that are fitted in a process pool. Within a chunk every
+    fit is warm-started from the parameters of its temporal neighbour, which
+    usually converges in a fraction of the iterations of a cold start.
+    """
+    OK = 0
+    FAILED = 1
+    NODATA = 2
+
+    def __init__(self, processes=None, chunkSize=None, detachment=False,
+                 p0=None, logSpace=False):
+        """
+        processes:  number of worker processes, all CPUs if None or 0. With
+                    one process the fits run in the calling process.
+        chunkSize:  profiles per chunk. Defaults to four chunks per process.
+        detachment: fit the detached Eich model
+        p0:         cold start parameters as in FitFunctions.fit
+        logSpace:   fit lambda_q and S in log space, see FitFunctions.fit
+        """
+        self.processes = processes or multiprocessing.cpu_count()
+        self.chunkSize = chunkSize
+        self.detachment = detachment
+        if p0 is None:
+            p0 = [1, 10.0e-3, 5.0e-3, 0., 0.01]
+        self.p0 = p0
+        self.logSpace = logSpace
+        self.statistics = {}
+        self.elapsed = 0.
+        self.rate = 0.
+
+    def chunks(self, n):
+        """ Boundaries of the contiguous chunks of n profiles """
+        size = self.chunkSize
+        if not size:
+            size = max(int(np.ceil(n / (4. * self.processes))), 1)
+        return [(i, min(i + size, n)) for i in range(0, n, size)]
+
+    def fit(self, times, profiles, decimation=1):
+        """
+        Fits every `decimation`-th profile.
+
+        times:      time of each profile
+        profiles:   list of (x, y) tuples, one per time
+
+        Returns the times of the fitted profiles, their parameters (one row
+        per time, NaN where no fit was found) and the fit status
+        (BatchFitter.OK, FAILED or NODATA) of each. The duration and the
+        throughput in fits per second are kept in `elapsed` and `rate`, the
+        summed FitFunctions statistics of all fits in `statistics`. They are
+        added to FitFunctions.statistics as well.
+        """
+        if len(times) != len(profiles):
+            raise ValueError('Got {} times but {} profiles'
+                             .format(len(times), len(profiles)))
+        decimation = max(int(decimation), 1)
+        times = np.asarray(times)[::decimation]
+        profiles = profiles[::decimation]
+        bounds = self.chunks(len(profiles))
+        jobs = [(profiles[a:b], self.p0, self.detachment, self.logSpace)
+                for a, b in bounds]
+
+        tstart = time.time()
+        if self.processes == 1 or len(jobs) <= 1:
+            results = map(fitProfiles, jobs)
         else:
-            return curve_fit(FitFunctions.eich_model, x, y, p0=p0[:-1])[0]
+            pool = multiprocessing.Pool(min(self.processes, len(jobs)))
+            try:
+                results = pool.map(fitProfiles, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        self.elapsed = time.time() - tstart
+        self.rate = len(profiles) / self.elapsed if self.elapsed else 0.
+
+        self.statistics = dict((key, sum(r[2][key] for r in results))
+                               for key in FitFunctions.statistics)
+        for key, value in self.statistics.iteritems():
+            FitFunctions.statistics[key] += value
+        nParams = len(self.p0) if self.detachment else len(self.p0) - 1
+        if not results:
+            return (times, np.empty((0, nParams)),
+                    np.empty(0, dtype=int))
+        params = np.concatenate([r[0] for r in results])
+        status = np.concatenate([r[1] for r in results])
+        return times, params, status
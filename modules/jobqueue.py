@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import socket
+
+class JobQueue(object):
+    """
+    Job queue in a directory shared by several hosts. It needs no server and
+    no locks: every state change of a job is a single rename of its file,
+    which succeeds for exactly one of several competing workers.
+
+    Layout of the queue directory:
+        queue.json  settings of the queue, written by the first worker once
+                    all jobs are in todo/
+        todo/       jobs waiting for a worker
+        leased/     jobs being worked on, the mtime is the last heartbeat
+        done/       results of finished jobs
+        failed/     jobs that exceeded the maximum number of attempts
+
+    Job files are named <id>.<attempt> and hold a JSON list of items. A job
+    whose lease has not been renewed for `leaseTime` seconds is considered
+    lost with its worker and put back into todo/ with the attempt counter
+    increased. As the lease expiry is judged by file modification times, the
+    clocks of the hosts should agree to well within `leaseTime`.
+    """
+    STATES = ('todo', 'leased', 'done', 'failed')
+
+    def __init__(self, path, leaseTime=1800, maxAttempts=3):
+        self.path = path
+        self.leaseTime = leaseTime
+        self.maxAttempts = maxAttempts
+        self.worker = '{}:{}'.format(socket.gethostname(), os.getpid())
+        for state in self.STATES:
+            directory = os.path.join(path, state)
+            if not os.path.isdir(directory):
+                try:
+                    os.makedirs(directory)
+                except OSError:
+                    # Created concurrently by another worker
+                    if not os.path.isdir(directory):
+                        raise
+
+    def _file(self, state, name):
+        return os.path.join(self.path, state, name)
+
+    def _write(self, path, data):
+        """ Atomically writes data as JSON to path """
+        tmp = os.path.join(os.path.dirname(path),
+                           '.{}.{}'.format(os.path.basename(path),
+                                           self.worker.replace(':', '-')))
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, path)
+
+    @staticmethod
+    def _read(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _split(name):
+        jobId, attempt = name.rsplit('.', 1)
+        return jobId, int(attempt)
+
+    def _list(self, state):
+        return sorted(name for name in os.listdir(os.path.join(self.path,
+                                                               state))
+                      if not name.startswith('.'))
+
+    def submit(self, items, chunkSize=10):
+        """
+        Fills the queue with items, chunkSize items per job. Only the first
+        call on a queue directory has an effect, so every worker may call it.
+        Returns whether the jobs were created by this call.
+        """
+        try:
+            os.close(os.open(os.path.join(self.path, '.submitting'),
+                             os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except OSError:
+            return False
+        chunkSize = max(int(chunkSize), 1)
+        jobs = [items[i:i + chunkSize]
+                for i in range(0, len(items), chunkSize)]
+        for i, job in enumerate(jobs):
+            self._write(self._file('todo', '{:06d}.1'.format(i)), job)
+        self._write(os.path.join(self.path, 'queue.json'),
+                    {'items': len(items), 'jobs': len(jobs),
+                     'chunkSize': chunkSize, 'created': time.time(),
+                     'creator': self.worker})
+        return True
+
+    def submitted(self):
+        """ Whether the queue has been filled completely """
+        return os.path.isfile(os.path.join(self.path, 'queue.json'))
+
+    def requeueExpired(self):
+        """
+        Puts jobs whose lease expired back into todo/, or into failed/ after
+        maxAttempts attempts. Returns the number of jobs requeued.
+        """
+        requeued = 0
+        now = time.time()
+        for name in self._list('leased'):
+            path = self._file('leased', name)
+            try:
+                expired = now - os.path.getmtime(path) > self.leaseTime
+            except OSError:
+                # Completed or requeued meanwhile
+                continue
+            if not expired:
+                continue
+            jobId, attempt = self._split(name)
+            if attempt >= self.maxAttempts:
+                target = self._file('failed', name)
+            else:
+                target = self._file('todo', '{}.{}'.format(jobId,
+                                                           attempt + 1))
+            try:
+                os.rename(path, target)
+            except OSError:
+                continue
+            requeued += 1
+        return requeued
+
+    def acquire(self):
+        """
+        Leases the next job. Returns a (name, items) tuple or None if there
+        is no job left to lease right now.
+        """
+        self.requeueExpired()
+        for name in self._list('todo'):
+            path = self._file('leased', name)
+            try:
+                # Refresh the mtime first, else the job could look expired
+                # to other workers right after the rename
+                os.utime(self._file('todo', name), None)
+                os.rename(self._file('todo', name), path)
+            except OSError:
+                # Taken by another worker
+                continue
+            os.utime(path, None)
+            return name, self._read(path)
+        return None
+
+    def renew(self, name):
+        """ Extends the lease of job name. Returns False if it was lost. """
+        try:
+            os.utime(self._file('leased', name), None)
+        except OSError:
+            return False
+        return True
+
+    def complete(self, name, results):
+        """
+        Stores the results of job name and removes its lease. The results of
+        a job that was completed by another worker in the meantime are kept.
+        """
+        self._write(self._file('done', name + '.json'),
+                    {'worker': self.worker, 'items': results})
+        try:
+            os.remove(self._file('leased', name))
+        except OSError:
+            pass
+
+    def finished(self):
+        """ Whether no job is waiting or leased anymore """
+        return (self.submitted() and not self._list('todo') and
+                not self._list('leased'))
+
+    def results(self):
+        """
+        Merged results of all finished jobs, in job order. If a job was
+        completed more than once, the result of the latest attempt is used.
+        """
+        latest = {}
+        for name in self._list('done'):
+            jobId, attempt = self._split(name[:-len('.json')])
+            if attempt >= latest.get(jobId, (0, None))[0]:
+                latest[jobId] = (attempt, name)
+        results = []
+        for jobId in sorted(latest):
+            results.extend(self._read(self._file('done',
+                                                 latest[jobId][1]))['items'])
+        return results
+
+    def status(self):
+        """ Number of jobs per state """
+        return dict((state, len(self._list(state))) for state in self.STATES)
+
+    def failedItems(self):
+        """ Items of the jobs that exceeded the maximum number of attempts """
+        items = []
+        for name in self._list('failed'):
+            items.extend(self._read(self._file('failed', name)))
+        return items
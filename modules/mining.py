@@ -0,0 +1,354 @@
+import os
+import copy
+import time
+import pickle
+import collections
+
+import numpy as np
+from matplotlib import cm
+from matplotlib.colors import to_rgba, to_rgba_array
+
+from crawling import OK, ERROR
+from shotdata import ShotLoader, ShotDataError
+from celma import CELMACube, sampleMeans, synchronizeELMs
+from binning import Binning
+
+# Miner of a miner process, set by initMiner
+_miner = None
+
+# Quantities of the GUI's plots, the probes of which share its colormap
+PLOT_QUANTITIES = ('te', 'ne', 'jsat')
+
+# Order in which the GUI's 'Save raw' collects the artists
+KINDS = ('line', 'collection', 'patch')
+
+class Miner(object):
+    """
+    Performs the temporal and spatial CELMAs of phases of shots without any
+    GUI and saves them like the GUI's 'Save raw': every plot goes to a
+    *_RAW.npz file of its artists' data, keyed by label, and a .info pickle
+    of their kinds and colors. The CELMA settings are those the GUI starts
+    with: all ELMs in the phase except the ignored ones, synchronized by
+    their start, not normalized and binned.
+
+    Temporal dumps hold per probe a collection for every ELM
+    ('<probe> ELM <i> @<onset>s') and the binned average ('Linear regression
+    <probe>') as well as the ELM duration patch ('ELM duration'). Spatial
+    dumps hold per probe and POI the CELMA samples ('<probe> POI <POI>s') and
+    their average ('Average <probe> POI <POI>s'), as (position, value) rows.
+    Probes are colored like in the GUI, so the .info files equal those of
+    the GUI for the same CELMAs.
+    """
+    def __init__(self, loader, saveDir, probes=None, quantities=('jsat', 'te'),
+                 POIs=(0.0035, 0.006, 0.012), unit='0.1 ms', Dt=15,
+                 temporalAvgNum=2, spatialAvgNum=3, pad=0., binNumber=100,
+                 avgMethod='mean', ignoreNans=True, calibrate=True,
+                 ELMcache=None, probeColors=None, colorScheme='gist_rainbow',
+                 temporalAlpha=0.4, spatialAlpha=0.1):
+        """
+        Parameters:
+            loader:         ShotLoader reading the shots
+            saveDir:        directory of the dumps
+            probes:         names of the probes to include, all if None
+            quantities:     quantities of the temporal and spatial CELMAs
+            POIs:           POIs of the spatial CELMAs relative to the ELM
+                            onsets, in unit
+            unit:           '%' or '0.1 ms', see CELMACube
+            Dt:             samples around a POI taken into account
+            temporalAvgNum: samples averaged to one temporal value
+            spatialAvgNum:  samples averaged to one spatial value
+            pad:            padding of the temporal CELMAs in seconds
+            binNumber:      number of bins of the temporal averages
+            avgMethod:      reducer of the temporal averages
+            ignoreNans:     drop NaN samples of spatial CELMAs
+            calibrate:      convert jsat to current densities
+            ELMcache:       pickle of the ignored ELMs, dict shot -> onsets
+            probeColors:    dict probe -> RGBA array of the configured probe
+                            colors
+            colorScheme:    colormap of the other probes
+            temporalAlpha:  alpha of the temporal CELMA samples
+            spatialAlpha:   alpha of the spatial CELMA samples
+        """
+        try:
+            Binning.parseReducer(avgMethod)
+        except ValueError:
+            avgMethod = 'median'
+        self.loader = loader
+        self.saveDir = saveDir
+        self.probes = probes
+        self.quantities = quantities
+        self.POIs = list(POIs)
+        self.unit = unit
+        self.Dt = Dt
+        self.temporalAvgNum = temporalAvgNum
+        self.spatialAvgNum = spatialAvgNum
+        self.pad = pad
+        self.binNumber = binNumber
+        self.avgMethod = avgMethod
+        self.ignoreNans = ignoreNans
+        self.calibrate = calibrate
+        self.ELMcache = ELMcache
+        self.probeColors = probeColors or {}
+        self.colorScheme = colorScheme
+        self.temporalAlpha = temporalAlpha
+        self.spatialAlpha = spatialAlpha
+        self.shot = None
+
+    def load(self, shot):
+        """ Reads the data of shot, the phases of which are mined next """
+        self.shot = None
+        self.loader.open(int(shot))
+        self.loader.openLSC()
+        self.elms = self.loader.shotData('elms')
+        self.ssl = self.loader.shotData('strikeline')
+        self.data = {}
+        for quantity in self.quantities:
+            data = copy.deepcopy(self.loader.shotData(quantity))
+            if quantity == 'jsat' and self.calibrate:
+                calib = self.loader.calibrations()
+                for probe, probeData in data.iteritems():
+                    l, w = calib.get(probe, (0, 0))
+                    # Probes of invalid dimensions stay uncalibrated
+                    if l*w:
+                        probeData['data'] = probeData['data']/(l*w)
+            self.data[quantity] = data
+        names = set()
+        for data in self.data.values():
+            names.update(data)
+        self.positions = self.loader.positions(sorted(names))
+        self.colors = self.attributeColors()
+        self.ignore = []
+        if self.ELMcache:
+            try:
+                with open(self.ELMcache, 'rb') as f:
+                    self.ignore = pickle.load(f).get(int(shot), [])
+            except (IOError, EOFError):
+                pass
+        self.shot = str(shot)
+
+    def attributeColors(self):
+        """
+        Colors of the probes of the current shot, dict probe -> color, as
+        ApplicationWindow.attributeColorsToProbes: the configured colors and
+        for the others the colormap over the probes of all plots
+        """
+        probeNames = []
+        for quantity in PLOT_QUANTITIES:
+            try:
+                data = self.loader.shotData(quantity)
+            except ShotDataError:
+                # The GUI has no plot of quantity either
+                continue
+            probeNames.extend([probe for probe in data
+                               if probe not in probeNames])
+        probeNames = list(set(probeNames))
+        colors = cm.get_cmap(self.colorScheme)(
+                np.linspace(0, 1, len(probeNames)))
+        probeColors = {}
+        for probeName, color in zip(probeNames, colors):
+            if probeName in self.probeColors:
+                probeColors[probeName] = self.probeColors[probeName]
+            else:
+                probeColors[probeName] = tuple(color)[:-1]
+        return probeColors
+
+    def included(self, data):
+        """ Names of the probes of data to include, in the order of data """
+        return [probe for probe in data
+                if self.probes is None or probe in self.probes]
+
+    def temporalArtists(self, quantity, start, end):
+        """
+        Artists of the temporal CELMA, dicts label -> data and info, the
+        latter ordered as the GUI draws them
+        """
+        artists = {}
+        info = collections.OrderedDict()
+        elms = self.elms
+        for probe in self.included(self.data[quantity]):
+            probeData = self.data[quantity][probe]
+            n = self.temporalAvgNum
+            result = synchronizeELMs(
+                sampleMeans(probeData['time'], n),
+                sampleMeans(probeData['data'], n),
+                elms['onsets'], elms['ends'], elms['maxima'],
+                elms['ELMtoELM'], start, end, pad=self.pad, binning=True,
+                binNumber=self.binNumber)
+            if result is None:
+                continue
+            selected = ~np.in1d(result['onsets'], self.ignore)
+            if not selected.any():
+                continue
+            color = self.colors[probe]
+            for i, e in enumerate(np.flatnonzero(selected)):
+                label = '{} ELM {} @{:.4f}s'.format(probe, i,
+                                                   result['onsets'][e])
+                artists[label] = np.column_stack((result['times'][e],
+                                                  result['data'][e]))
+                info[label] = ('collection',
+                               to_rgba_array(color, self.temporalAlpha))
+
+            duration = (result['durationSign'] *
+                        max(result['durations'][selected]))
+            artists['ELM duration'] = np.array([[duration, 0], [duration, 1],
+                                                [0, 1], [0, 0],
+                                                [duration, 0]])
+            info['ELM duration'] = ('patch', to_rgba('grey', .3))
+
+            aggregate = result['aggregate']
+            aggregate.select(selected)
+            binned = aggregate.reduce(self.avgMethod)
+            if binned is not None:
+                label = 'Linear regression {}'.format(probe)
+                artists[label] = np.column_stack(binned[:2])
+                info[label] = ('line', color)
+        return artists, info
+
+    def spatialArtists(self, quantity, start, end):
+        """
+        Artists of the spatial CELMA, dicts label -> data and info, the
+        latter ordered as the GUI draws them
+        """
+        elms = self.elms
+        ind = np.where((elms['onsets'] >= start) & (elms['onsets'] <= end))[0]
+        if len(ind) == 0:
+            return {}, {}
+        # The duration of the ELM before the first one is needed for
+        # negative POIs
+        durInd = np.pad(ind, (1, 0), 'constant', constant_values=ind[0] - 1)
+        region = self.loader.region
+        data = {}
+        times = {}
+        for probe, probeData in self.data[quantity].iteritems():
+            if probe.startswith(region):
+                data[probe] = probeData['data']
+                times[probe] = probeData['time']
+        if not data:
+            return {}, {}
+        timeArray = times[sorted(times)[0]]
+        cube = CELMACube(self.POIs, elms['onsets'][ind],
+                         elms['ELMtoELM'][durInd], self.unit, timeArray,
+                         data, times, dict((probe, self.positions[probe])
+                                           for probe in data),
+                         self.ssl, self.Dt, self.spatialAvgNum,
+                         self.ignoreNans)
+        selected = ~np.in1d(cube.ELMonsets, self.ignore)
+        if not selected.any():
+            return {}, {}
+
+        artists = {}
+        info = collections.OrderedDict()
+        for POI in self.POIs:
+            frame = cube.frame(POI, selected)
+            for probe in self.included(data):
+                values = np.concatenate([frame['data'][p][probe]
+                                         for p in frame['POIs']])
+                locs = np.concatenate([frame['positions'][p][probe]
+                                       for p in frame['POIs']])
+                if not values.size:
+                    continue
+                color = self.colors[probe]
+                label = '{} POI {:.4f}s'.format(probe, POI)
+                artists[label] = np.column_stack((locs, values))
+                info[label] = ('collection',
+                               to_rgba_array(color, self.spatialAlpha))
+                label = 'Average ' + label
+                artists[label] = np.array([[np.nanmean(locs),
+                                            np.nanmedian(values)]])
+                info[label] = ('line', color)
+        return artists, info
+
+    def fileName(self, plotType, quantity, start, end):
+        """ File name of a dump, as ApplicationWindow.plotFileName """
+        probes = self.included(self.data[quantity])
+        if len(probes) > 1:
+            probeName = 'multiple'
+        elif len(probes) == 1:
+            probeName = probes[0]
+        else:
+            probeName = 'None'
+        return '_'.join([self.shot, plotType, quantity, 'CELMA',
+                         '{:.4f}'.format(start), '{:.4f}'.format(end),
+                         probeName, 'default', 'syncedByStart']) + '_RAW.npz'
+
+    def save(self, fileName, artists, info):
+        """
+        Writes the npz file of artists and the .info file of info. The
+        latter is filled as by the GUI, with the labels as text and the
+        lines before the collections before the patches, so its pickle is
+        the same.
+        """
+        if not os.path.isdir(self.saveDir):
+            try:
+                os.makedirs(self.saveDir)
+            except OSError:
+                # Created concurrently by another miner
+                if not os.path.isdir(self.saveDir):
+                    raise
+        path = os.path.join(self.saveDir, fileName)
+        np.savez(path, **artists)
+        plotTypes = {}
+        for kind in KINDS:
+            for label, value in info.iteritems():
+                if value[0] == kind:
+                    plotTypes[unicode(label)] = value
+        with open(os.path.splitext(path)[0] + '.info', 'wb') as f:
+            pickle.dump(plotTypes, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return path
+
+    def minePhase(self, shot, start, end):
+        """
+        Performs the CELMAs of the phase [start, end] of shot and saves them.
+        The shot is only loaded if it is not the current one.
+
+        Returns the status (OK or ERROR), a message and the paths of the
+        saved files.
+        """
+        if self.shot != str(shot):
+            try:
+                self.load(shot)
+            except ShotDataError, e:
+                return ERROR, str(e), []
+        start = float(start)
+        end = float(end)
+        files = []
+        for plotType, compute in (('temporal', self.temporalArtists),
+                                  ('spatial', self.spatialArtists)):
+            for quantity in self.quantities:
+                artists, info = compute(quantity, start, end)
+                if artists:
+                    files.append(self.save(
+                        self.fileName(plotType, quantity, start, end),
+                        artists, info))
+        if not files:
+            return ERROR, 'No CELMA could be created', []
+        return OK, '', files
+
+
+def initMiner(loaderSettings, settings):
+    """
+    Pool initializer, creates the Miner of a miner process. loaderSettings
+    and settings are the keyword arguments of its ShotLoader and Miner.
+    """
+    global _miner
+    _miner = Miner(ShotLoader(**loaderSettings), **settings)
+
+
+def minePhases(phases):
+    """
+    Mines (shot, start, end) phases of a single shot in a miner process, so
+    the shot is loaded only once. Returns per phase the shot, start, end,
+    status, duration, message and saved files.
+    """
+    results = []
+    for shot, start, end in phases:
+        tstart = time.time()
+        try:
+            status, message, files = _miner.minePhase(shot, start, end)
+        except Exception, e:
+            status, message, files = (ERROR,
+                                      "{}: {}".format(type(e).__name__, e),
+                                      [])
+        results.append((shot, start, end, status, time.time() - tstart,
+                        message, files))
+    return results
@@ -0,0 +1,170 @@
+import os
+import json
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+# Function and data of the worker process, set by initWorker
+_context = None
+
+def unorderedPairs(n):
+    """ Index pairs (i, j) with i < j of n items, in nested loop order """
+    for i in xrange(n):
+        for j in xrange(i + 1, n):
+            yield i, j
+
+
+def initWorker(func, data):
+    """ Pool initializer, keeps the data shared by all pairs """
+    global _context
+    _context = func, data
+
+
+def computeChunk(chunk):
+    """ Rows of the (position, i, j) pairs of chunk, see computePairs """
+    func, data = _context
+    return [(position, func(data, i, j)) for position, i, j in chunk]
+
+
+class CheckpointMismatch(Exception):
+    """ A checkpoint was recorded with other parameters """
+    pass
+
+
+class PairCheckpoint(object):
+    """
+    Append-only record of the rows of computed pairs, so an interrupted
+    computation can be resumed. The first line of the file is a JSON object
+    with the parameters of the computation, every further line one with the
+    keys of both items of a pair and its row, null for pairs without a row.
+    The keys identify the items across runs, e.g. their file names.
+
+    The rows are only valid for the parameters they were computed with, so
+    a checkpoint of other parameters raises CheckpointMismatch.
+    """
+    def __init__(self, path, parameters=None):
+        self.path = path
+        # As read back from JSON, e.g. tuples become lists
+        self.parameters = json.loads(json.dumps(parameters or {}))
+        self.rows = {}
+        recorded = None
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Line cut off by a crash
+                        continue
+                    if 'parameters' in entry:
+                        recorded = entry['parameters']
+                    else:
+                        self.rows[tuple(entry['pair'])] = entry['row']
+        if recorded is None and not self.rows:
+            with open(path, 'w') as f:
+                f.write(json.dumps({'parameters': self.parameters}) + '\n')
+        elif recorded != self.parameters:
+            raise CheckpointMismatch(
+                'Checkpoint {} was recorded with the parameters {}, not {}'
+                .format(path, recorded, self.parameters))
+
+    def __contains__(self, pair):
+        return pair in self.rows
+
+    def add(self, entries):
+        """ Records (pair, row) entries """
+        with open(self.path, 'a') as f:
+            for pair, row in entries:
+                self.rows[pair] = row
+                f.write(json.dumps({'pair': list(pair), 'row': row}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def computePairs(func, data, pairs, columns, keys=None, processes=None,
+                 chunkSize=50, checkpoint=None, parameters=None,
+                 callback=None):
+    """
+    Table of the rows func(data, i, j) of the pairs (i, j) of items, e.g.
+    from unorderedPairs. func returns the values of the columns or None if
+    the pair has no row. It must be a module-level function, as pairs are
+    computed in chunks of chunkSize pairs by a pool of processes. data is
+    handed to the processes once when they start.
+
+    The rows are collected into preallocated arrays, one per column, and
+    returned as one DataFrame in the order of pairs. Its index counts the
+    rows from 0.
+
+    keys:       keys of the items, required to use a checkpoint
+    processes:  number of worker processes, all CPUs if None or 0. With one
+                process the pairs are computed in the calling process.
+    checkpoint: path of a PairCheckpoint. Pairs recorded in it are not
+                computed again, new pairs are recorded after every chunk.
+    parameters: dict of the parameters the rows depend on, JSON
+                serializable. A checkpoint recorded with other parameters
+                raises CheckpointMismatch.
+    callback:   called with the number of pairs done and the total
+    """
+    pairs = list(pairs)
+    n = len(pairs)
+    values = [np.empty(n, dtype=object) for _ in columns]
+    valid = np.zeros(n, dtype=bool)
+
+    def store(position, row):
+        if row is None:
+            return
+        valid[position] = True
+        for array, value in zip(values, row):
+            array[position] = value
+
+    record = None
+    jobs = []
+    done = 0
+    if checkpoint is not None:
+        record = PairCheckpoint(checkpoint, parameters)
+    for position, (i, j) in enumerate(pairs):
+        if record is not None and (keys[i], keys[j]) in record:
+            store(position, record.rows[(keys[i], keys[j])])
+            done += 1
+        else:
+            jobs.append((position, i, j))
+    chunks = [jobs[k:k + chunkSize] for k in xrange(0, len(jobs), chunkSize)]
+
+    def collect(results):
+        for position, row in results:
+            store(position, row)
+        if record is not None:
+            record.add([((keys[pairs[position][0]], keys[pairs[position][1]]),
+                         None if row is None else list(row))
+                        for position, row in results])
+
+    if callback is not None:
+        callback(done, n)
+    processes = min(processes or multiprocessing.cpu_count(), len(chunks))
+    if processes <= 1:
+        initWorker(func, data)
+        for chunk in chunks:
+            collect(computeChunk(chunk))
+            done += len(chunk)
+            if callback is not None:
+                callback(done, n)
+    else:
+        pool = multiprocessing.Pool(processes, initWorker, (func, data))
+        finished = False
+        try:
+            for results in pool.imap_unordered(computeChunk, chunks):
+                collect(results)
+                done += len(results)
+                if callback is not None:
+                    callback(done, n)
+            finished = True
+        finally:
+            if finished:
+                pool.close()
+            else:
+                # Interrupted, the checkpoint keeps the pairs done so far
+                pool.terminate()
+            pool.join()
+    return pd.DataFrame(dict((column, array[valid]) for column, array
+                             in zip(columns, values)), columns=columns)
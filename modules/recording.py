@@ -0,0 +1,141 @@
+import os
+import Queue
+import threading
+import subprocess
+
+import numpy as np
+from matplotlib import image
+
+class Recorder(object):
+    """
+    Records frames of matplotlib Agg canvases without re-rendering them.
+    grab() copies the buffers the canvases were last drawn into and queues
+    them; a background thread encodes and writes them. The queue is bounded,
+    so a writer that cannot keep up slows the recording down instead of
+    filling the memory.
+
+    Formats:
+        'png'   one PNG per canvas and frame, named <name>.png
+        'video' all canvases of a frame tiled into a grid and piped to
+                ffmpeg as one video stream (video.mp4). Without ffmpeg the
+                tiled frames are written as PNGs frame_<n>.png instead.
+    """
+    formats = ('png', 'video')
+
+    def __init__(self, path, format='png', fps=10, queueSize=32, columns=2):
+        if format not in self.formats:
+            raise ValueError('Unknown recording format {}. Use one of {}'
+                             .format(format, ', '.join(self.formats)))
+        self.path = path
+        self.format = format
+        self.fps = fps
+        self.columns = columns
+        self.frames = 0
+        self.error = None
+        self._ffmpeg = None
+        self._queue = Queue.Queue(max(queueSize, 1))
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @staticmethod
+    def snapshot(canvas):
+        """
+        Copy of the RGBA buffer of an Agg canvas as (height, width, 4) array.
+        Canvases that have not been drawn yet are drawn first.
+        """
+        renderer = getattr(canvas, 'renderer', None)
+        if renderer is None:
+            canvas.draw()
+            renderer = canvas.renderer
+        buf = np.frombuffer(renderer.buffer_rgba(), dtype=np.uint8)
+        return buf.reshape(int(renderer.height), int(renderer.width),
+                           4).copy()
+
+    def grab(self, canvases, names):
+        """
+        Queues a frame of the canvases. names are the file names without
+        extension of the canvases for the 'png' format.
+        """
+        if self.error is not None:
+            raise IOError(self.error)
+        frame = [(name, self.snapshot(canvas))
+                 for canvas, name in zip(canvases, names)]
+        self._queue.put(frame)
+
+    def close(self):
+        """ Writes the queued frames and waits for the writer to finish """
+        self._queue.put(None)
+        self._thread.join()
+        return self.error is None
+
+    def tile(self, images):
+        """ Tiles images into a grid with `columns` columns """
+        rows = -(-len(images) // self.columns)
+        height = max(im.shape[0] for im in images)
+        width = max(im.shape[1] for im in images)
+        # Even dimensions are required by most video codecs
+        frame = np.full((rows * height + rows * height % 2,
+                         self.columns * width + self.columns * width % 2, 4),
+                        255, dtype=np.uint8)
+        for i, im in enumerate(images):
+            r, c = divmod(i, self.columns)
+            frame[r * height:r * height + im.shape[0],
+                  c * width:c * width + im.shape[1]] = im
+        return frame
+
+    def _openVideo(self, frame):
+        height, width = frame.shape[:2]
+        cmd = ['ffmpeg', '-y', '-loglevel', 'error',
+               '-f', 'rawvideo', '-pix_fmt', 'rgba',
+               '-s', '{}x{}'.format(width, height), '-r', str(self.fps),
+               '-i', '-', '-c:v', 'libx264', '-pix_fmt', 'yuv420p',
+               os.path.join(self.path, 'video.mp4')]
+        try:
+            return subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        except OSError:
+            return None
+
+    def _write(self, frame):
+        if self.format == 'png':
+            for name, im in frame:
+                image.imsave(os.path.join(self.path, name + '.png'), im)
+            return
+        tiled = self.tile([im for _, im in frame])
+        if self.frames == 0:
+            self._ffmpeg = self._openVideo(tiled)
+            self._shape = tiled.shape
+        if self._ffmpeg is not None:
+            if tiled.shape != self._shape:
+                # Canvases resized during the recording
+                resized = np.full(self._shape, 255, dtype=np.uint8)
+                h = min(self._shape[0], tiled.shape[0])
+                w = min(self._shape[1], tiled.shape[1])
+                resized[:h, :w] = tiled[:h, :w]
+                tiled = resized
+            self._ffmpeg.stdin.write(tiled.tostring())
+        else:
+            image.imsave(os.path.join(self.path, 'frame_{:06d}.png'
+                                      .format(self.frames)), tiled)
+
+    def _run(self):
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                break
+            if self.error is not None:
+                # Keep draining so grab() never blocks forever
+                continue
+            try:
+                self._write(frame)
+                self.frames += 1
+            except (IOError, OSError), e:
+                self.error = str(e)
+        if self._ffmpeg is not None:
+            try:
+                self._ffmpeg.stdin.close()
+            except IOError:
+                pass
+            if self._ffmpeg.wait() != 0 and self.error is None:
+                self.error = 'ffmpeg exited with status {}'.format(
+                    self._ffmpeg.returncode)
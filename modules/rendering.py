@@ -0,0 +1,305 @@
+import os
+import pickle
+import multiprocessing
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection, PathCollection, \
+                                   PolyCollection
+from matplotlib.patches import Polygon
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Figures of the worker process, built once by initRenderer
+_figures = None
+
+def coordinateTransforms(axes):
+    """ (name, transform) pairs of the coordinate systems of axes """
+    return [('data', axes.transData),
+            ('xaxis', axes.get_xaxis_transform()),
+            ('yaxis', axes.get_yaxis_transform()),
+            ('axes', axes.transAxes)]
+
+
+def artistSpec(axes, artist):
+    """
+    Picklable description (method, args, kwargs) of a visible artist of
+    axes, or None if the artist is not supported. Calling
+    drawSpec(axes, spec) on other axes draws an equivalent artist.
+    """
+    if not artist.get_visible():
+        return
+    label = artist.get_label()
+    if artist in axes.lines:
+        kwargs = {'color': artist.get_color(), 'ls': artist.get_linestyle(),
+                  'lw': artist.get_linewidth(), 'alpha': artist.get_alpha(),
+                  'marker': artist.get_marker(),
+                  'markersize': artist.get_markersize(),
+                  'zorder': artist.get_zorder(), 'label': label}
+        transform = artist.get_transform()
+        x, y = artist.get_xdata(), artist.get_ydata()
+        if transform is axes.get_xaxis_transform():
+            return ('axvline', (x[0],), kwargs)
+        if transform is axes.get_yaxis_transform():
+            return ('axhline', (y[0],), kwargs)
+        if transform is not axes.transData:
+            return
+        return ('plot', (np.asarray(x), np.asarray(y)), kwargs)
+    if artist in axes.texts:
+        kwargs = {'color': artist.get_color(),
+                  'fontsize': artist.get_fontsize(),
+                  'ha': artist.get_ha(), 'va': artist.get_va()}
+        if artist.get_transform() is axes.transAxes:
+            kwargs['axesCoords'] = True
+        elif artist.get_transform() is not axes.transData:
+            return
+        x, y = artist.get_position()
+        return ('text', (x, y, artist.get_text()), kwargs)
+    if artist in axes.patches:
+        # Patches are redrawn as polygons of their outline, e.g. the spans
+        # of axvspan, which are in data x and axes y coordinates
+        transform = artist.get_data_transform()
+        coordinates = [name for name, other in coordinateTransforms(axes)
+                       if transform is other]
+        if not coordinates:
+            return
+        vertices = artist.get_patch_transform().transform(
+            artist.get_path().vertices)
+        kwargs = {'facecolor': artist.get_facecolor(),
+                  'edgecolor': artist.get_edgecolor(),
+                  'fill': artist.get_fill(), 'lw': artist.get_linewidth(),
+                  'ls': artist.get_linestyle(), 'alpha': artist.get_alpha(),
+                  'zorder': artist.get_zorder(), 'label': label,
+                  'coordinates': coordinates[0]}
+        return ('patch', (vertices,), kwargs)
+    kwargs = {'alpha': artist.get_alpha(), 'zorder': artist.get_zorder(),
+              'label': label}
+    if isinstance(artist, PathCollection):
+        offsets = np.asarray(artist.get_offsets())
+        if offsets.size == 0:
+            return
+        paths = artist.get_paths()
+        # Empty colors stand for unfilled or borderless markers
+        facecolors = artist.get_facecolor()
+        edgecolors = artist.get_edgecolor()
+        kwargs.update({'s': artist.get_sizes(),
+                       'facecolors': facecolors if len(facecolors) else 'none',
+                       'edgecolors': edgecolors if len(edgecolors) else
+                                     'none'})
+        if paths:
+            kwargs['marker'] = paths[0]
+        return ('scatter', (offsets[:, 0], offsets[:, 1]), kwargs)
+    if isinstance(artist, LineCollection):
+        kwargs.update({'colors': artist.get_color(),
+                       'linewidths': artist.get_linewidth()})
+        return ('segments', (artist.get_segments(),), kwargs)
+    if isinstance(artist, PolyCollection):
+        kwargs.update({'facecolors': artist.get_facecolor(),
+                       'edgecolors': artist.get_edgecolor()})
+        return ('polygons', ([path.vertices for path in artist.get_paths()],),
+                kwargs)
+
+
+def panelScene(fig, name, exclude=()):
+    """
+    Picklable description of the figure fig, rendered into files
+    <name><frame>.png. Artists in `exclude`, usually the ones that change
+    from frame to frame, are left out. The axes limits are fixed, so the
+    artists of the frames do not rescale the axes.
+    """
+    exclude = set(exclude)
+    axes = []
+    for ax in fig.axes:
+        artists = ax.lines + ax.texts + ax.collections + ax.patches
+        specs = [artistSpec(ax, artist) for artist in artists
+                 if artist not in exclude]
+        legend = ax.get_legend()
+        axes.append({'position': ax.get_position().bounds,
+                     'xlim': ax.get_xlim(), 'ylim': ax.get_ylim(),
+                     'xscale': ax.get_xscale(), 'yscale': ax.get_yscale(),
+                     'xlabel': ax.get_xlabel(), 'ylabel': ax.get_ylabel(),
+                     'title': ax.get_title(),
+                     'frameon': ax.patch.get_visible(),
+                     'ylabelPosition': ax.yaxis.get_label_position(),
+                     'legend': legend is not None and legend.get_visible(),
+                     'artists': [spec for spec in specs if spec is not None]})
+    return {'name': name, 'size': tuple(fig.get_size_inches()),
+            'dpi': fig.dpi, 'axes': axes}
+
+
+def drawSpec(axes, spec):
+    """ Draws the artist described by spec, see artistSpec """
+    method, args, kwargs = spec
+    kwargs = dict(kwargs)
+    if method == 'segments':
+        axes.add_collection(LineCollection(args[0], **kwargs))
+    elif method == 'polygons':
+        axes.add_collection(PolyCollection(args[0], **kwargs))
+    elif method == 'patch':
+        transforms = dict(coordinateTransforms(axes))
+        axes.add_patch(Polygon(args[0], closed=True,
+                               transform=transforms[kwargs.pop('coordinates')],
+                               **kwargs))
+    else:
+        if kwargs.pop('axesCoords', False):
+            kwargs['transform'] = axes.transAxes
+        getattr(axes, method)(*args, **kwargs)
+
+
+def buildFigure(scene):
+    """ Off-screen Agg figure of a scene created by panelScene """
+    fig = Figure(figsize=scene['size'], dpi=scene['dpi'])
+    FigureCanvasAgg(fig)
+    for settings in scene['axes']:
+        axes = fig.add_axes(settings['position'],
+                            frameon=settings['frameon'])
+        for spec in settings['artists']:
+            drawSpec(axes, spec)
+        axes.set_xscale(settings['xscale'])
+        axes.set_yscale(settings['yscale'])
+        axes.set_xlim(settings['xlim'])
+        axes.set_ylim(settings['ylim'])
+        axes.set_autoscale_on(False)
+        axes.set_xlabel(settings['xlabel'])
+        axes.set_ylabel(settings['ylabel'])
+        axes.set_title(settings['title'])
+        if settings['ylabelPosition'] == 'right':
+            axes.yaxis.tick_right()
+            axes.yaxis.set_label_position('right')
+        if settings['legend']:
+            axes.legend()
+    return fig
+
+
+def initRenderer(scenes):
+    """ Pool initializer, builds the figures of the worker process """
+    global _figures
+    _figures = [(scene['name'], buildFigure(scene)) for scene in scenes]
+
+
+def renderFrame(job):
+    """
+    Renders frame (index, path, frame) of all figures to PNG files in path.
+    frame maps scene names to the specs of the artists to draw onto the
+    first axes of the figure for this frame only. Returns the index.
+    """
+    index, path, frame = job
+    for name, fig in _figures:
+        axes = fig.axes[0]
+        before = set(axes.get_children())
+        containers = len(axes.containers)
+        for spec in frame.get(name, []):
+            drawSpec(axes, spec)
+        fig.savefig(os.path.join(path, '{}{}.png'.format(name, index)),
+                    dpi=fig.dpi)
+        for artist in axes.get_children():
+            if artist not in before:
+                artist.remove()
+        del axes.containers[containers:]
+    return index
+
+
+def renderFrames(scenes, frames, path, processes=None, callback=None):
+    """
+    Renders frames off-screen with the Agg backend, in a pool of processes
+    that each build their own figures of the scenes once. Frame k (counting
+    from 1) of the scene named <name> is written to <path>/<name><k>.png.
+
+    scenes:     scene descriptions created by panelScene
+    frames:     one dict per frame, see renderFrame
+    processes:  number of worker processes, all CPUs if None or 0. With one
+                process the frames are rendered in the calling process.
+    callback:   called with the number of frames done after every frame.
+                Rendering is cancelled if it returns True.
+
+    Returns the number of frames rendered.
+    """
+    jobs = [(k + 1, path, frame) for k, frame in enumerate(frames)]
+    processes = min(processes or multiprocessing.cpu_count(), len(jobs))
+    if processes <= 1:
+        initRenderer(scenes)
+        for done, job in enumerate(jobs, 1):
+            renderFrame(job)
+            if callback is not None and callback(done):
+                return done
+        return len(jobs)
+
+    pool = multiprocessing.Pool(processes, initRenderer, (scenes,))
+    done = 0
+    finished = False
+    try:
+        for done, _ in enumerate(pool.imap_unordered(renderFrame, jobs), 1):
+            if callback is not None and callback(done):
+                break
+        else:
+            finished = True
+    finally:
+        if finished:
+            pool.close()
+        else:
+            # Cancelled or failed, drop the frames still pending
+            pool.terminate()
+        pool.join()
+    return done
+
+
+def snapshotFigure(fig):
+    """
+    Serialized copy of the current state of fig for saveFigure. Figures are
+    pickled; if that fails, e.g. because an artist refers to a GUI object,
+    the supported artists are described by a scene, see panelScene.
+    """
+    try:
+        return ('pickle', pickle.dumps(fig, pickle.HIGHEST_PROTOCOL))
+    except (pickle.PicklingError, TypeError, AttributeError, RuntimeError):
+        return ('scene', panelScene(fig, None))
+
+
+def restoreFigure(snapshot):
+    """ Off-screen Agg figure of a snapshot created by snapshotFigure """
+    kind, data = snapshot
+    if kind == 'scene':
+        return buildFigure(data)
+    fig = pickle.loads(data)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def saveFigure(job):
+    """
+    Saves the figure of job (snapshot, path) in the format given by the
+    extension of path. Returns the path and an error message, which is None
+    if the figure was saved.
+    """
+    snapshot, path = job
+    try:
+        fig = restoreFigure(snapshot)
+        fig.savefig(path, format=os.path.splitext(path)[1][1:])
+    except Exception, e:
+        return path, str(e) or e.__class__.__name__
+    return path, None
+
+
+def saveFigures(jobs, processes=None):
+    """
+    Saves the (snapshot, path) jobs in a pool of processes. Yields the path
+    and error message (None on success) of every file as soon as it is
+    written, so in the order of completion.
+    """
+    processes = min(processes or multiprocessing.cpu_count(), len(jobs))
+    if processes <= 1:
+        for job in jobs:
+            yield saveFigure(job)
+        return
+    pool = multiprocessing.Pool(processes)
+    finished = False
+    try:
+        for result in pool.imap_unordered(saveFigure, jobs):
+            yield result
+        finished = True
+    finally:
+        if finished:
+            pool.close()
+        else:
+            # The caller stopped early, drop the files still pending
+            pool.terminate()
+        pool.join()
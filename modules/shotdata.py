@@ -0,0 +1,435 @@
+import os
+import copy
+
+import numpy as np
+
+# Diagnostic holding each quantity
+DIAGNOSTICS = {'te': 'LSD',
+               'ne': 'LSD',
+               'jsat': 'LSF',
+               'elms': 'ELM',
+               'strikeline': 'FPG'}
+
+class ShotDataError(Exception):
+    """ Data of a shot is neither cached nor readable from its shotfile """
+
+
+class ShotLoader(object):
+    """
+    Reads the Langmuir probe, ELM and strikeline data of a shot from its
+    shotfiles without any GUI. The probe mapping, positions and dimensions
+    come from the latest LSC shotfile before the shot, the LSC shot.
+
+    Data read for the current shot and its LSC shot is kept in `cache`, a
+    dict keyed by shot number, and written to the cache file of that shot
+    right away, so the GUI and crawler processes share it. Each cache file
+    is replaced atomically, so neither a crash nor concurrent crawlers leave
+    a truncated one behind.
+
+    Shotfiles are read with dd, which is imported on first use. Data that
+    can neither be found in the cache nor be read raises ShotDataError.
+    Returned data is shared with the cache and must not be modified.
+    """
+    def __init__(self, cacheDir, segment='8', region='ua', experiments=None,
+                 useCache=True, useLSC=True, mapFile='', calibFile=''):
+        """
+        Parameters:
+            cacheDir:    directory holding the cache files in shotdata/
+            segment:     divertor segment, e.g. '8'
+            region:      probe region, e.g. 'ua'
+            experiments: dict diagnostic -> experiment of its shotfiles,
+                         AUGD for diagnostics not in it
+            useCache:    read from and write to the cache
+            useLSC:      read probe mapping and dimensions from the LSC
+                         shotfile instead of mapFile and calibFile
+            mapFile:     probe-channel mapping file
+            calibFile:   probe dimensions file
+        """
+        self.cacheDir = cacheDir
+        self.segment = segment
+        self.region = region
+        self.experiments = experiments or {}
+        self.useCache = useCache
+        self.useLSC = useLSC
+        self.mapFile = mapFile
+        self.calibFile = calibFile
+        self.cache = {}
+        self.shotnr = None
+        self.LSCshotnr = None
+        self.map = {}
+        self.calib = {}
+        self.probePositions = {}
+
+    def experiment(self, diag):
+        return self.experiments.get(diag) or 'AUGD'
+
+    def cachePath(self, shotnr):
+        return os.path.join(self.cacheDir, 'shotdata', "{}-{}-{}.npy"
+                            .format(shotnr, self.segment, self.region))
+
+    def loadCache(self, shotnr):
+        """ Reads the cache file of shotnr. Returns whether there is one. """
+        path = os.path.join(self.cacheDir, 'shotdata')
+        if not os.path.isdir(path):
+            return False
+        filename = "{}-{}-{}".format(shotnr, self.segment, self.region)
+        found = False
+        for fname in os.listdir(path):
+            fpath = os.path.join(path, fname)
+            if fname.startswith(filename) and os.path.isfile(fpath):
+                try:
+                    cache = np.load(fpath)
+                except IOError:
+                    continue
+                self.cache[shotnr] = cache.item()
+                found = True
+        return found
+
+    def saveCache(self, shots=None):
+        """ Writes the cache files of shots, default the current ones """
+        if shots is None:
+            shots = (self.shotnr, self.LSCshotnr)
+        directory = os.path.join(self.cacheDir, 'shotdata')
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Created concurrently by another crawler
+                if not os.path.isdir(directory):
+                    raise
+        for shotnr in set(shots):
+            if shotnr not in self.cache:
+                continue
+            path = self.cachePath(shotnr)
+            tmp = os.path.join(directory, '.{}.{}'.format(
+                os.path.basename(path), os.getpid()))
+            with open(tmp, 'wb') as f:
+                np.save(f, self.cache[shotnr])
+            os.rename(tmp, path)
+
+    def cached(self, shotnr, key):
+        """ Value cached for shotnr under key or None """
+        if not self.useCache:
+            return
+        return self.cache.get(shotnr, {}).get(key)
+
+    def store(self, shotnr, key, value):
+        """ Caches value for shotnr under key and saves its cache file """
+        if not self.useCache:
+            return
+        self.cache.setdefault(shotnr, {})[key] = value
+        self.saveCache([shotnr])
+
+    def open(self, shotnr):
+        """
+        Makes shotnr the current shot and reads its cache file. Returns
+        whether the shot is cached. openLSC has to be called before reading
+        data.
+        """
+        self.cache.clear()
+        self.shotnr = shotnr
+        self.LSCshotnr = None
+        self.map = {}
+        self.calib = {}
+        self.probePositions = {}
+        cached = self.useCache and self.loadCache(shotnr)
+        self.cache.setdefault(shotnr, {})
+        return cached
+
+    def openLSC(self):
+        """ Finds the LSC shot of the current shot and reads its cache """
+        LSCshotnr = self.latestLSC(self.shotnr)
+        self.LSCshotnr = LSCshotnr
+        self.cache.setdefault(LSCshotnr, {})
+        if self.useCache:
+            self.loadCache(LSCshotnr)
+        return LSCshotnr
+
+    def latestLSC(self, shotnr):
+        """ Number of the latest shot with an LSC shotfile before shotnr """
+        LSCshotnr = self.cached(shotnr, 'latestLSC')
+        if LSCshotnr:
+            return LSCshotnr
+        import dd
+        try:
+            LSCshotnr = dd.getLastShotNumber('LSC', shotnr,
+                                             self.experiment('LSC'))
+        except Exception, e:
+            raise ShotDataError("Latest LSC shotfile of shot {} could not be "
+                                "found: {}".format(shotnr, e))
+        if LSCshotnr == 0:
+            raise ShotDataError("getLastShotNumber() returned 0 for the LSC "
+                                "shotfile of shot {}".format(shotnr))
+        self.store(shotnr, 'latestLSC', LSCshotnr)
+        return LSCshotnr
+
+    def shotfile(self, diag, shotnr=None):
+        """
+        Opens the shotfile of diag of shotnr, by default the current shot or
+        for LSC its LSC shot. Falls back to AUGD if there is none of the
+        configured experiment.
+        """
+        import dd
+        if shotnr is None:
+            shotnr = self.LSCshotnr if diag == 'LSC' else self.shotnr
+        exp = self.experiment(diag)
+        try:
+            return dd.shotfile(diag, shotnr, exp)
+        except Exception, e:
+            if exp == 'AUGD':
+                raise ShotDataError("No {} shotfile for shot {}: {}"
+                                    .format(diag, shotnr, e))
+        try:
+            return dd.shotfile(diag, shotnr)
+        except Exception, e:
+            raise ShotDataError("No {} shotfile for shot {} at {} nor at AUGD: "
+                                "{}".format(diag, shotnr, exp, e))
+
+    def shotData(self, quantity):
+        """
+        Data of quantity ('te', 'ne', 'jsat', 'elms' or 'strikeline') of the
+        current shot. Probe data has the format data[probe]['data'/'time'].
+        """
+        try:
+            diag = DIAGNOSTICS[quantity]
+        except KeyError:
+            raise ShotDataError("Unknown quantity {}".format(quantity))
+        data = self.cached(self.shotnr, quantity)
+        if data:
+            return data
+        shotfile = self.shotfile(diag)
+        try:
+            if diag == 'LSD':
+                data = self.readLSD(shotfile, quantity)
+            elif diag == 'LSF':
+                data = self.readLSF(shotfile)
+            elif diag == 'ELM':
+                data = self.readELM(shotfile)
+            else:
+                data = self.readStrikeline(shotfile)
+        finally:
+            shotfile.close()
+        if not data:
+            raise ShotDataError("No {} data in the {} shotfile of shot {}"
+                                .format(quantity, diag, self.shotnr))
+        self.store(self.shotnr, quantity, data)
+        return data
+
+    def readLSD(self, shotfile, quantity):
+        signalNames = shotfile.getSignalNames()
+        region = 'ua'
+        probes = [s.split('-')[-1] for s in signalNames
+                                    if s.startswith(quantity)
+                                    and s.split('-')[-1][:2] == region]
+        rawdata = {}
+        for probe in probes:
+            signal = quantity + '-' + probe
+            try:
+                data = shotfile(signal).data
+                time = shotfile(signal).time
+            except Exception:
+                # Unreadable signals are skipped
+                continue
+            rawdata[probe] = {'data': data, 'time': time}
+        return rawdata
+
+    def readLSF(self, shotfile):
+        mapping = self.mapping()
+        rawdata = {}
+        for objName in shotfile.getObjectNames().values():
+            if not objName.startswith('CH'):
+                continue
+            for probe, (channel, ind) in mapping.iteritems():
+                if channel == objName:
+                    try:
+                        rawdata[probe] = {
+                            'data': shotfile(channel).data[ind],
+                            'time': shotfile(channel).time}
+                    except TypeError:
+                        continue
+        return rawdata
+
+    def readELM(self, shotfile):
+        try:
+            onsets = shotfile('t_begELM')
+            data = {"onsets": onsets,
+                    "ends": shotfile('t_endELM').data,
+                    "maxima": shotfile('t_maxELM').data,
+                    "frequencies": shotfile('freq_ELM').data,
+                    "ELMtoELM": np.append(np.diff(onsets), 0),
+                    "ELMenergy": shotfile('ELMENER').data,
+                    "preELMWmhd": shotfile('Wmhd').data,
+                    "electrons": shotfile('ELMPART').data,
+                    "preELMelectrons": shotfile('ELECTRNS').data}
+        except Exception, e:
+            raise ShotDataError("Invalid ELM shotfile for shot {}: {}"
+                                .format(self.shotnr, e))
+        return data
+
+    def readStrikeline(self, shotfile):
+        try:
+            signal = shotfile('Suna2b')
+            return {'data': signal.data, 'time': signal.time}
+        except Exception, e:
+            raise ShotDataError("Strikeline positions of shot {} not "
+                                "readable: {}".format(self.shotnr, e))
+
+    def mapping(self):
+        """ Probe-channel mapping, dict probe -> (LSF channel, index) """
+        if self.map:
+            return self.map
+        mapping = self.cached(self.LSCshotnr, 'mapping')
+        if mapping:
+            self.map = copy.deepcopy(mapping)
+            return self.map
+        if self.useLSC:
+            self.map = self.mappingFromShotfile()
+        else:
+            self.map = self.mappingFromFile()
+        if not self.map:
+            raise ShotDataError("Failed to get probe-channel mapping")
+        self.store(self.LSCshotnr, 'mapping', self.map)
+        return self.map
+
+    def mappingFromShotfile(self):
+        shotfile = self.shotfile('LSC')
+        signalName = 'ZSI' + self.segment
+        mapping = {}
+        try:
+            for obj in shotfile.getObjectNames().values():
+                if not obj.startswith(self.region):
+                    continue
+                data = shotfile(obj)[signalName].data
+                info = ''.join([el for el in data if el.split() != []])
+                try:
+                    channel, ind = info.split('_')
+                except ValueError:
+                    continue
+                # Actual LSC data starts with 'ch' while shotfile object
+                # names start with 'CH'. Indices are saved as numbers 1-6 but
+                # must serve as indexes 0-5.
+                mapping[obj] = ('CH' + channel[2:], int(ind) - 1)
+        finally:
+            shotfile.close()
+        return mapping
+
+    def mappingFromFile(self):
+        if not self.mapFile or not os.path.isfile(self.mapFile):
+            raise ShotDataError("Mapping file '{}' not found"
+                                .format(self.mapFile))
+        mapping = {}
+        with open(self.mapFile) as f:
+            for line in f:
+                try:
+                    probe, quantity, channel, ind = line.split()
+                except ValueError:
+                    break
+                # LSF object names start with 'CH'
+                if not channel.startswith('CH'):
+                    channel = 'CH' + channel
+                # Only care about the saturation current of probes in this
+                # segment and region. Indices are saved as 1-6.
+                if (probe.startswith(self.segment + self.region) and
+                        quantity == 'Isat'):
+                    mapping[probe[1:].lower()] = (channel, int(ind) - 1)
+        return mapping
+
+    def calibrations(self):
+        """ Probe dimensions, dict probe -> (length, width) """
+        if self.calib:
+            return self.calib
+        calib = self.cached(self.LSCshotnr, 'probeDimensions')
+        if calib:
+            self.calib = copy.deepcopy(calib)
+            return self.calib
+        calib = {}
+        if self.useLSC:
+            shotfile = self.shotfile('LSC')
+            try:
+                for probe in shotfile.getObjectNames().values():
+                    if not probe.startswith(self.region):
+                        continue
+                    try:
+                        l, w = shotfile(probe)['Geom'].data[:2]
+                    except Exception:
+                        continue
+                    calib[probe] = (float(l), float(w))
+            finally:
+                shotfile.close()
+        else:
+            try:
+                with open(self.calibFile) as f:
+                    for line in f.readlines()[1:]:
+                        probe, l, w = line.split()
+                        calib[probe] = (float(l), float(w))
+            except (IOError, ValueError), e:
+                raise ShotDataError("Invalid calibration file '{}': {}"
+                                    .format(self.calibFile, e))
+        self.calib = calib
+        self.store(self.LSCshotnr, 'probeDimensions', calib)
+        return self.calib
+
+    def positions(self, probes):
+        """ Probe positions including those of probes, dict probe -> s """
+        if not self.probePositions:
+            positions = self.cached(self.LSCshotnr, 'probePositions')
+            if positions:
+                self.probePositions = copy.deepcopy(positions)
+        missing = [probe for probe in probes
+                   if probe not in self.probePositions]
+        if not missing:
+            return self.probePositions
+        shotfile = self.shotfile('LSC')
+        try:
+            for probe in missing:
+                self.probePositions[probe] = shotfile(probe)['Ort'].data/1000.
+        finally:
+            shotfile.close()
+        self.store(self.LSCshotnr, 'probePositions', self.probePositions)
+        return self.probePositions
+
+    def statData(self):
+        """
+        Heating power, line-averaged density, Tdiv and fuelling and seeding
+        rates of the current shot, each a dict with 'data' and 'time' or
+        None if its shotfile is not available.
+        """
+        statData = self.cached(self.shotnr, 'statData')
+        if statData:
+            return statData
+        import dd
+        statData = {}
+        for key, diag, name in [('Ptot', 'TOT', 'P_TOT'),
+                                ('n_H-1', 'DCN', 'H-1'),
+                                ('Tdiv', 'DDS', 'Tdiv')]:
+            try:
+                shotfile = dd.shotfile(diag, self.shotnr)
+            except Exception:
+                statData[key] = None
+                continue
+            try:
+                signal = shotfile(name)
+                statData[key] = {'time': signal.time, 'data': signal.data}
+            finally:
+                shotfile.close()
+
+        # Seeding rates, empty for species that were not used
+        rates = [('D_rate', 'D_tot'), ('N_rate', 'N_tot'),
+                 ('Ne_rate', 'Ne_tot')]
+        try:
+            shotfile = dd.shotfile('UVS', self.shotnr)
+        except Exception:
+            statData.update(dict.fromkeys(key for key, _ in rates))
+        else:
+            try:
+                for key, name in rates:
+                    statData[key] = {}
+                    try:
+                        signal = shotfile(name)
+                    except Exception:
+                        continue
+                    statData[key] = {'time': signal.time, 'data': signal.data}
+            finally:
+                shotfile.close()
+        self.store(self.shotnr, 'statData', statData)
+        return statData
@@ -0,0 +1,133 @@
+"""
+Benchmark the banded DTW of dtw.py against the previous implementation
+
+Compares both on all pairs of regression curves of a probe in a directory
+of numpy dumpfiles, as similarity.py does in dumps mode. Reports the time
+per pair and checks that costs and warping paths are identical.
+"""
+import os
+import sys
+import time
+import argparse
+import itertools
+
+import numpy as np
+sys.path.insert(0, '../modules')
+import dtw
+
+def parse_args():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('-f', '--folder', default='../data/dumps',
+                           help='Directory containing numpy dumpfiles')
+    argparser.add_argument('-p', '--probe', default='ua4',
+                           help='Probe signal to compare')
+    argparser.add_argument('-w', '--window', type=int, default=4,
+                           help='Half width of the Sakoe-Chiba band')
+    argparser.add_argument('--tmax', type=float, default=12.,
+                           help='Maximum x value in ms to be considered')
+    argparser.add_argument('-n', '--number', type=int, default=None,
+                           help='Maximum number of pairs')
+    return argparser.parse_args()
+
+
+def reference_dtw(A, B, window=sys.maxint, d=lambda x, y: abs(x - y)):
+    """
+    Measures.DTW of similarity.py before the banded implementation. The
+    path is None if the backtracking runs out of the matrix instead of
+    raising an IndexError, so the costs can still be compared.
+    """
+    # create the cost matrix
+    A, B = np.array(A), np.array(B)
+    M, N = len(A), len(B)
+    cost = sys.maxint * np.ones((M, N))
+
+    # initialize the first row and column
+    cost[0, 0] = d(A[0], B[0])
+    for i in range(1, M):
+        cost[i, 0] = cost[i-1, 0] + d(A[i], B[0])
+
+    for j in range(1, N):
+        cost[0, j] = cost[0, j-1] + d(A[0], B[j])
+    # fill in the rest of the matrix
+    for i in range(1, M):
+        for j in range(max(1, i - window), min(N, i + window + 1)):
+            choices = cost[i - 1, j - 1], cost[i, j-1], cost[i-1, j]
+            cost[i, j] = min(choices) + d(A[i], B[j])
+
+    # find the optimal path
+    n, m = N - 1, M - 1
+    path = []
+
+    try:
+        while (m, n) != (0, 0):
+            path.append((m, n))
+            m, n = min((m - 1, n), (m, n - 1), (m - 1, n - 1),
+                       key = lambda x: cost[x[0], x[1]])
+    except IndexError:
+        return cost[-1, -1], None
+
+    path.append((0,0))
+    return cost[-1, -1], path
+
+
+def load_curves(folder, probe, max_t):
+    signal = 'Linear regression {}'.format(probe)
+    curves = []
+    for name in sorted(os.listdir(folder)):
+        if not name.endswith('.npz'):
+            continue
+        data = np.load(os.path.join(folder, name))
+        if signal in data:
+            x, y = data[signal].transpose()
+            curves.append(y[x < max_t])
+    return curves
+
+
+def banded_dtw(A, B, window):
+    """ dtw.dtw with a path of None like reference_dtw """
+    try:
+        return dtw.dtw(A, B, window)
+    except IndexError:
+        return dtw.dtw(A, B, window, path=False), None
+
+
+def same(a, b):
+    return a == b or (np.isnan(a) and np.isnan(b))
+
+
+def timed(func, pairs):
+    start = time.time()
+    results = [func(A, B) for A, B in pairs]
+    return results, time.time() - start
+
+
+def main():
+    args = parse_args()
+    curves = load_curves(args.folder, args.probe, args.tmax / 1000)
+    pairs = list(itertools.permutations(curves, 2))[:args.number]
+    if not pairs:
+        sys.exit('No curves of probe {} found'.format(args.probe))
+    print('{} curves of probe {}, {} pairs, window {}'.format(
+        len(curves), args.probe, len(pairs), args.window))
+
+    window = args.window
+    reference, t_reference = timed(
+        lambda A, B: reference_dtw(A, B, window), pairs)
+    banded, t_banded = timed(lambda A, B: banded_dtw(A, B, window), pairs)
+    costs, t_costs = timed(
+        lambda A, B: dtw.dtw(A, B, window, path=False), pairs)
+
+    print('{:<22}{:>12}{:>10}'.format('', 'ms per pair', 'speedup'))
+    for label, t in (('previous', t_reference), ('banded', t_banded),
+                     ('banded, cost only', t_costs)):
+        print('{:<22}{:>12.3f}{:>10.1f}'.format(label, 1000 * t / len(pairs),
+                                               t_reference / t))
+
+    same_costs = sum(same(ref[0], cost)
+                     for ref, cost in zip(reference, costs))
+    same_paths = sum(ref[1] == new[1] for ref, new in zip(reference, banded))
+    print('Identical costs: {} of {}'.format(same_costs, len(pairs)))
+    print('Identical paths: {} of {}'.format(same_paths, len(pairs)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark the Eich fitters on the same synthetic profiles
+
+Compares the least-squares fit of fitting.FitFunctions with the likelihood
+based simplex fit of EichFit in terms of fits per second, convergence rate
+and accuracy of the fitted lambda_q and S.
+"""
+import sys
+import time
+import argparse
+import warnings
+
+import numpy as np
+sys.path.insert(0, '../modules')
+from fitting import FitFunctions
+import EichFit
+
+def parse_args():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('-n', '--number', type=int, default=200,
+                           help='Number of profiles to fit')
+    argparser.add_argument('-p', '--points', type=int, default=40,
+                           help='Number of data points per profile')
+    argparser.add_argument('--noise', type=float, default=0.05,
+                           help='Relative noise level of the profiles')
+    argparser.add_argument('--maxiter', type=int, default=None,
+                           help='Iteration budget of EichFit')
+    argparser.add_argument('--maxtime', type=float, default=None,
+                           help='Time budget of EichFit per fit in seconds')
+    argparser.add_argument('-s', '--seed', type=int, default=0,
+                           help='Random seed')
+    return argparser.parse_args()
+
+
+def make_profiles(n, points, noise, seed=0):
+    """
+    Returns locations, noisy profiles, their uncertainties and the true
+    lambda_q and S of each profile.
+    """
+    rng = np.random.RandomState(seed)
+    x = np.linspace(-0.02, 0.08, points)
+    profiles = []
+    uncertainties = []
+    truth = []
+    for _ in range(n):
+        lambdaq = rng.uniform(2e-3, 2e-2)
+        S = rng.uniform(1e-3, 8e-3)
+        y = FitFunctions.eich_model(x, 1., lambdaq, S, rng.uniform(0, .2))
+        err = noise * y.max() * np.ones_like(x)
+        profiles.append(y + err * rng.randn(points))
+        uncertainties.append(err)
+        truth.append((lambdaq, S))
+    return x, profiles, uncertainties, np.array(truth)
+
+
+def run(name, fitter, truth):
+    """ Fits every profile with fitter(i) and prints a summary line """
+    results = np.full(truth.shape, np.nan)
+    tstart = time.time()
+    for i in range(len(truth)):
+        try:
+            results[i] = fitter(i)
+        except (RuntimeError, ValueError):
+            pass
+    elapsed = time.time() - tstart
+    ok = ~np.isnan(results).any(axis=1)
+    error = np.abs(results[ok] - truth[ok]) / truth[ok]
+    print('{:<28} {:>8.0f} {:>10.0f}% {:>12.1f}% {:>8.1f}%'
+          .format(name, len(truth) / elapsed,
+                  100. * ok.sum() / len(truth),
+                  100 * np.median(error[:, 0]) if ok.any() else np.nan,
+                  100 * np.median(error[:, 1]) if ok.any() else np.nan))
+
+
+def main():
+    args = parse_args()
+    warnings.simplefilter('ignore')
+    x, profiles, uncertainties, truth = make_profiles(args.number,
+                                                      args.points,
+                                                      args.noise, args.seed)
+
+    def least_squares(i, **kwargs):
+        y = profiles[i]
+        return FitFunctions.fit(x, y / np.max(y), **kwargs)[1:3]
+
+    def likelihood(i, weighted=False):
+        p = EichFit.fit(x, profiles[i], uncertainties[i], weighted,
+                        maxiter=args.maxiter, maxtime=args.maxtime)
+        return p[2:4]
+
+    print('{} profiles of {} points, {:.0f}% noise'
+          .format(args.number, args.points, 100 * args.noise))
+    print('{:<28} {:>8} {:>11} {:>13} {:>9}'
+          .format('Fitter', 'Fits/s', 'Converged', 'lambda_q err', 'S err'))
+    run('FitFunctions', least_squares, truth)
+    run('FitFunctions, no jacobian',
+        lambda i: least_squares(i, jacobian=False, bounded=False), truth)
+    run('FitFunctions, log space',
+        lambda i: least_squares(i, logSpace=True), truth)
+    run('EichFit', likelihood, truth)
+    run('EichFit, weighted', lambda i: likelihood(i, True), truth)
+
+
+if __name__ == '__main__':
+    main()
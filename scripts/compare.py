@@ -19,6 +19,9 @@ from matplotlib.pyplot import *
 import matplotlib.gridspec as gridspec
 mpl.rcParams['svg.fonttype'] = 'none'
 
+sys.path.insert(0, '../modules')
+from featuredb import FeatureDatabase
+
 def parse_args():
     argparser = argparse.ArgumentParser()
     argparser.add_argument('-d', '--dumpfiles', nargs='+', dest='dumps',
@@ -34,7 +37,8 @@ def parse_args():
     argparser.add_argument('-s', '--shots', nargs='+', dest='shots',
                            help='Shots to plot')
     argparser.add_argument('-c', '--database', dest='database',
-                           help='Database to get probe locations from. ' +
+                           help='Feature database (or CSV file) to get ' +
+                           'probe locations and parameters from. ' +
                            'Necessary if plotting nth probe')
     argparser.add_argument('--share', dest='share', action='store_true',
                            help='Plots share one figure')
@@ -76,11 +80,7 @@ class DumpfilePlotter(object):
         return grouped_dfiles
 
     def get_first_probe(self, database, shot, start, end):
-        df = pd.read_csv(database)
-        match_shot = df['Shot'].astype(str) == str(shot)
-        match_start = df['CELMA start'].astype(str) == str(start)
-        match_end = df['CELMA end'].astype(str) == str(end)
-        df = df[(match_shot) & (match_start) & (match_end)]
+        df = database.rows(shot, start, end)
         #deltas = []
         firsts = []
         for ind, row in df.iterrows():
@@ -167,16 +167,12 @@ class DumpfilePlotter(object):
 
     def get_parameter(self, param, shot, start, end, db=None):
         db = db or self.db
-        df = pd.read_csv(db)
-        match_shot = df['Shot'].astype(str) == str(shot)
-        match_start = df['CELMA start'].astype(str) == str(start)
-        match_end = df['CELMA end'].astype(str) == str(end)
-        df = df[(match_shot) & (match_start) & (match_end)]
+        df = db.rows(shot, start, end)
         # Should be same value for every entry belonging to same phase
         # so mean() just fetches that value
         param = next((p for p in df.columns if p.lower() == param.lower()),
                      None)
-        return df[param].mean()
+        return pd.to_numeric(df[param], errors='coerce').mean()
 
     def plot_dumpfiles(self, dfiles, probes, colors=None,
                        show_empty_figs=False, params=[]):
@@ -322,7 +318,8 @@ if __name__ == '__main__':
 
     plotter = DumpfilePlotter()
     plotter.params = params
-    plotter.db = database
+    if database:
+        plotter.db = FeatureDatabase.open(database)
     plotter.cmap = cmap
     plotter.path = path
     if cycle:
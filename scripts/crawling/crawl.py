@@ -1,59 +1,157 @@
+"""
+Survey of the divertor temperature of all shots in a range
+
+For every shot, checks that the shotfiles needed for the analysis exist and
+computes the median of Tdiv. Shots are scanned concurrently by a bounded
+pool of processes. Existence is checked from the shotfile index without
+opening any shotfile, and the only data read is the Tdiv signal.
+
+Every result is appended to a survey CSV file right away (shot, status,
+median Tdiv, missing shotfiles, duration), so an interrupted scan resumes
+where it stopped. Shots with all shotfiles available are also appended to
+tdiv_results.txt as before.
+"""
 from __future__ import print_function
+import os
+import csv
 import sys
+import time
+import argparse
+import multiprocessing
 #sys.path.insert(0, '/afs/ipp/aug/ads-diags/common/python/lib')
 sys.path.insert(0, '../not_used')
 import dd
-import simplejson
-import time
 import numpy as np
 
 tdiv_range = [-10, 15]
-shotnumber_range = [33895, None]
-
-def check_shotfile_availability(shotnr):
-    diags = ['LSF', 'LSD', 'FPG', 'TOT', 'DCN']
-    for diag in diags:
-        try:
-            shotfile = dd.shotfile(diag, shotnr)
-        except:
-            print("{} not available".format(diag))
-            return
-    return True
-
-if shotnumber_range[1] is None:
-    shotnumber_range[1] = dd.getLastShotNumber('LSF', 100000)
-
-size = len(range(*shotnumber_range))
-matches = {}
-duration = 0
-for i, shotnr in enumerate(range(*shotnumber_range)):
+diags = ['LSF', 'LSD', 'FPG', 'TOT', 'DCN']
+columns = ['shot', 'status', 'tdiv', 'missing', 'duration']
+
+def parse_args():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--first', type=int, default=33895,
+                           help='First shot to scan')
+    argparser.add_argument('--last', type=int, default=None,
+                           help='Last shot to scan. Default: last LSF shot')
+    argparser.add_argument('-j', '--jobs', type=int, default=16,
+                           help='Number of shots scanned concurrently')
+    argparser.add_argument('-o', '--output', default='tdiv_survey.csv',
+                           help='Survey file, also used to resume a scan')
+    argparser.add_argument('--results', default='tdiv_results.txt',
+                           help='File the medians of usable shots are '
+                                'appended to')
+    argparser.add_argument('--retry', action='store_true',
+                           help='Scan shots again that failed with an error')
+    return argparser.parse_args()
+
+
+def exists(diag, shotnr):
+    """ Whether a shotfile exists, judged from the shotfile index only """
+    return dd.getLastShotNumber(diag, shotnr) == shotnr
+
+
+def scan(shotnr):
+    """
+    Returns the survey row of shot shotnr. The status is 'ok', 'no_dds'
+    if there is no Tdiv, 'missing' if any of the other shotfiles is missing
+    and 'error' if the scan failed otherwise.
+    """
+    start_time = time.time()
+    row = {'shot': shotnr, 'status': 'ok', 'tdiv': '', 'missing': ''}
+    try:
+        missing = [diag for diag in diags if not exists(diag, shotnr)]
+        if not exists('DDS', shotnr):
+            row['status'] = 'no_dds'
+        else:
+            shotfile = dd.shotfile()
+            try:
+                shotfile.open('DDS', shotnr)
+                Tdiv, _ = shotfile.getSignalCalibrated('Tdiv')
+            finally:
+                shotfile.close()
+            row['tdiv'] = '{:.1f}'.format(np.nanmedian(Tdiv))
+            if missing:
+                row['status'] = 'missing'
+                row['missing'] = ' '.join(missing)
+    except Exception as e:
+        row['status'] = 'error'
+        row['missing'] = str(e).replace('\n', ' ')
+    row['duration'] = '{:.3f}'.format(time.time() - start_time)
+    return row
+
+
+def read_survey(path):
+    """ Survey rows by shot number of a previous scan """
+    rows = {}
+    if os.path.isfile(path):
+        with open(path, 'r') as f:
+            for row in csv.DictReader(f):
+                try:
+                    rows[int(row['shot'])] = row
+                except (TypeError, ValueError):
+                    # Line cut off by an interruption
+                    continue
+    return rows
+
+
+def main():
+    args = parse_args()
+    last = args.last
+    if last is None:
+        last = int(dd.getLastShotNumber('LSF', 100000))
+
+    done = read_survey(args.output)
+    retry = ('error',) if args.retry else ()
+    shots = [shotnr for shotnr in range(args.first, last + 1)
+             if shotnr not in done or done[shotnr]['status'] in retry]
+    print("Scanning {} shots, {} already in {}"
+          .format(len(shots), len(range(args.first, last + 1)) - len(shots),
+                  args.output))
+    if not shots:
+        return
+
+    new = not os.path.isfile(args.output)
+    survey = open(args.output, 'a')
+    results = open(args.results, 'a')
+    writer = csv.DictWriter(survey, columns)
+    if new:
+        writer.writeheader()
+    pool = multiprocessing.Pool(max(args.jobs, 1))
     start_time = time.time()
-    time_left = duration * (size - (i + 1))
-    minutes_left, seconds_left = divmod(time_left, 60)
-    hours_left, minutes_left = divmod(minutes_left, 60)
-    progress = float(i + 1) / (shotnumber_range[1] - shotnumber_range[0]) * 100
-    status = "\n\n({:.1f}% | {}:{:02}:{:02} left)".format(progress,
-                                                     int(hours_left),
-                                                     int(minutes_left),
-                                                     int(seconds_left))
     try:
-        shotfile = dd.shotfile('DDS', shotnr)
-        Tdiv = shotfile('Tdiv').data
-        shotfile.close()
-    except:
-        print("{} No DDS shotfile".format(status))
-        duration = time.time() - start_time
-        continue
-
-    if not check_shotfile_availability(shotnr):
-        print("{} Missing vital shotfile(s)".format(status))
-        duration = time.time() - start_time
-        continue
-
-    mean = np.nanmedian(Tdiv)
-    if tdiv_range[0] < mean < tdiv_range[1]:
-        matches[shotnr] = mean
-        print("{} MATCH {:>7}{:>7.1f}".format(status, shotnr, mean))
-    with open('tdiv_results.txt', 'a') as f:
-        f.write("{:<7}{:<.1f}\n".format(shotnr, mean))
-    duration = time.time() - start_time
+        for i, row in enumerate(pool.imap_unordered(scan, shots)):
+            writer.writerow(row)
+            survey.flush()
+            if row['status'] == 'ok':
+                results.write("{:<7}{:<.1f}\n".format(row['shot'],
+                                                      float(row['tdiv'])))
+                results.flush()
+
+            elapsed = time.time() - start_time
+            time_left = elapsed / (i + 1) * (len(shots) - (i + 1))
+            minutes_left, seconds_left = divmod(time_left, 60)
+            hours_left, minutes_left = divmod(minutes_left, 60)
+            status = "({:.1f}% | {:.1f} shots/s | {}:{:02}:{:02} left)".format(
+                100. * (i + 1) / len(shots), (i + 1) / elapsed,
+                int(hours_left), int(minutes_left), int(seconds_left))
+            if row['status'] == 'ok':
+                match = tdiv_range[0] < float(row['tdiv']) < tdiv_range[1]
+                print("{} {} {:>7}{:>7}".format(
+                    status, 'MATCH' if match else 'ok   ', row['shot'],
+                    row['tdiv']))
+            else:
+                print("{} {} {:>7} {}".format(status, row['status'],
+                                              row['shot'], row['missing']))
+    except KeyboardInterrupt:
+        pool.terminate()
+        print("Interrupted, run again to resume")
+    else:
+        pool.close()
+    finally:
+        pool.join()
+        survey.close()
+        results.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Exercises the crawl job queue locally: several worker processes share a
+queue in a temporary directory, some of them crash in the middle of a job.
+Checks that every shot ends up crawled despite the crashes.
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, '../../modules')
+from jobqueue import JobQueue
+import crawling
+
+def parse_args():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('-w', '--workers', type=int, default=6,
+                           help='Number of worker processes')
+    argparser.add_argument('-n', '--shots', type=int, default=200,
+                           help='Number of shots to crawl')
+    argparser.add_argument('--crash', type=float, default=0.05,
+                           help='Probability of a worker crashing per job')
+    argparser.add_argument('--lease', type=float, default=2.,
+                           help='Lease time in seconds')
+    return argparser.parse_args()
+
+
+def worker(path, shots, crash, lease, seed):
+    random.seed(seed)
+    queue = JobQueue(path, leaseTime=lease, maxAttempts=10)
+    queue.submit(shots, chunkSize=7)
+    while not queue.submitted():
+        time.sleep(0.01)
+    while True:
+        job = queue.acquire()
+        if job is None:
+            if queue.finished():
+                return
+            time.sleep(0.05)
+            continue
+        name, items = job
+        if random.random() < crash:
+            # Dies holding the lease
+            os._exit(1)
+        results = []
+        for shot in items:
+            time.sleep(random.uniform(0, 0.01))
+            results.append(crawling.makeEntry(shot, crawling.OK))
+            queue.renew(name)
+        queue.complete(name, results)
+
+
+def main():
+    args = parse_args()
+    path = tempfile.mkdtemp()
+    shots = range(30000, 30000 + args.shots)
+    try:
+        start = time.time()
+        processes = [multiprocessing.Process(target=worker,
+                                             args=(path, shots, args.crash,
+                                                   args.lease, seed))
+                     for seed in range(args.workers)]
+        for p in processes:
+            p.start()
+        # Replace crashed workers until the queue is done
+        seed = args.workers
+        while not JobQueue(path).finished():
+            for i, p in enumerate(processes):
+                if not p.is_alive() and p.exitcode != 0:
+                    processes[i] = multiprocessing.Process(
+                        target=worker, args=(path, shots, args.crash,
+                                             args.lease, seed))
+                    processes[i].start()
+                    seed += 1
+            time.sleep(0.1)
+        for p in processes:
+            p.join()
+        queue = JobQueue(path)
+        crawled = sorted(entry['shot'] for entry in queue.results())
+        print('{} workers, {} restarts, {:.1f}s: {}'
+              .format(args.workers, seed - args.workers,
+                      time.time() - start, queue.status()))
+        if crawled != list(shots):
+            print('FAILED: {} of {} shots crawled'
+                  .format(len(set(crawled)), len(shots)))
+            sys.exit(1)
+        print('OK: every shot crawled exactly once')
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,29 +4,23 @@ Very primitive script replaced by more elaborate scripts in this folder but
 still good for quick plots
 """
 from __future__ import print_function
+import sys
 
 import numpy as np
 import pandas as pd
 from matplotlib.pyplot import *
 
-df = pd.read_csv('../data/csv/db28.csv')
-grouped = df.groupby(['Shot', 'CELMA start', 'quantity'])
+sys.path.insert(0, '../modules')
+from featuredb import FeatureDatabase, coordinateLabels
 
-def calcRow(row):
-    try:
-        return float(row[feat].split('|')[0])
-    except AttributeError:
-        return np.nan
+db = FeatureDatabase.open('../data/csv/db28.csv')
+df = db.frame.reset_index()
 
+# Time differences of the feature between neighbouring probes
 feat = 'detachEnd'
-for key, group in grouped:
-    group = group.set_index('probe').transpose()
-    times = group.apply(calcRow)
-    diffs = times.as_matrix()[:-1] - times.as_matrix()[1:]
-    diffs = np.append(diffs, np.nan)
-    df.loc[((df["Shot"] == key[0]) &
-            (df["CELMA start"] == key[1]) &
-            (df["quantity"] == key[2])), feat] = diffs
+times = df[coordinateLabels(feat)[0]]
+df[feat] = times - times.groupby([df['Shot'], df['CELMA start'],
+                                  df['quantity']]).shift(-1)
 
 grouped = df.groupby('probe')
 for name, group in grouped:
@@ -1,7 +1,8 @@
 """
 Assess similarity of time traces based on dynamic time warping (directly from
 raw data) or on the distances between features (read from database).
-Produce a CSV report that can be evaluated with superimpose.py.
+Produce a CSV report that can be evaluated with superimpose.py. In query
+mode only the phases nearest to a reference phase by DTW are reported.
 """
 
 #from sklearn.metrics.pairwise import euclidean_distances
@@ -13,6 +14,12 @@ import os
 import logging
 import argparse
 import datetime
+import heapq
+
+sys.path.insert(0, '../modules')
+from featuredb import FeatureDatabase, coordinateLabels
+import dtw
+from pairwise import computePairs, unorderedPairs, CheckpointMismatch
 
 argparser = argparse.ArgumentParser()
 argparser.add_argument('-x', '--axis', default='x', choices=('x', 'y', 'xy'),
@@ -24,8 +31,10 @@ argparser.add_argument('-m', '--method', default='quadratic_mean',
                        choices=('euclidean', 'DTW', 'quadratic_mean'),
                        help='Method with which to calculate the total ' + 
                        'distance')
-argparser.add_argument('mode', default='csv', choices=('csv', 'dumps'),
-                       help='Compare by features or whole timetrace')
+argparser.add_argument('mode', default='csv',
+                       choices=('csv', 'dumps', 'query'),
+                       help='Compare by features or whole timetrace, or ' +
+                       'find the phases nearest to a reference by DTW')
 argparser.add_argument('-l', '--loglevel', default='info', dest='loglevel',
                        help='Logging level')
 argparser.add_argument('-q', '--quantity', default='jsat', dest='quant',
@@ -41,7 +50,8 @@ argparser.add_argument('-n', '--norm', default='minmax', dest='norm',
 argparser.add_argument('-p', '--probe', default='first', dest='probe',
                        help='Probe signal to compare')
 argparser.add_argument('-d', '--database', dest='database',
-                       help='CSV database to get features from')
+                       help='Feature database (or CSV file) to get features ' +
+                       'from')
 argparser.add_argument('-o', '--output', dest='output',
                        help='Path to output csv file')
 argparser.add_argument('-f', '--folder', dest='folder',
@@ -50,13 +60,26 @@ argparser.add_argument('-e', '--features', dest='features', nargs='+',
                        default=['bump', 'detachStart', 'detachMax',
                                 'detachEnd', 'HRpeak', 'HRend'],
                        help='Features to be compared when reading from db')
-argparser.add_argument('--tmax', dest='tmax', type=float, default=12,
+argparser.add_argument('--tmax', dest='tmax', type=float, default=12.,
                        help='Maximum x value for dumpfiles to be considered')
 argparser.add_argument('--sortby', default='method', dest='sortby',
                        help='Column to sort resulting csv file by')
 argparser.add_argument('--selfcheck', dest='selfcheck', action='store_true',
                        help='Whether or not to check phases of the same ' +
                        'shot against each other')
+argparser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None,
+                       help='Number of processes comparing pairs. ' +
+                       'Default: number of CPUs')
+argparser.add_argument('-c', '--checkpoint', dest='checkpoint',
+                       help='File recording the compared pairs, so an ' +
+                       'interrupted run with the same parameters resumes ' +
+                       'where it stopped')
+argparser.add_argument('-r', '--reference', dest='reference', nargs=3,
+                       metavar=('SHOT', 'START', 'END'),
+                       help='Phase to find the nearest phases of in query ' +
+                       'mode')
+argparser.add_argument('-k', dest='k', type=int, default=10,
+                       help='Number of nearest phases to find in query mode')
 args = argparser.parse_args()
 method = args.method
 directory = args.folder
@@ -72,6 +95,9 @@ quant = args.quant
 mode = args.mode
 features = args.features
 max_t = args.tmax / 1000
+processes = args.jobs
+checkpoint = args.checkpoint
+k = args.k
 
 try:
     loglevel = getattr(logging, args.loglevel.upper())
@@ -107,6 +133,44 @@ def get_file_data(f, probe, max_t):
         result = None
     return result
 
+def list_archives(directory, quantity):
+    """ Numpy dumpfiles of <quantity> in <directory> """
+    files = [os.path.join(directory, f) for f in os.listdir(directory)]
+    if not len(files):
+        logger.critical("No files found!")
+    archives = [f for f in files if (os.path.isfile(f) and
+                                     f.endswith('.npz') and
+                                     quantity in f)]
+    if not len(archives):
+        logger.critical("No archives found!")
+    return archives
+
+def load_curves(files, probe, max_t):
+    """
+    Regression curves of <probe> of all files, see get_file_data, by file.
+    Each file is read once.
+    """
+    return dict((f, get_file_data(f, probe, max_t)) for f in files)
+
+# Result columns of compare_parameters
+PARAMETER_COLUMNS = ['Delta Tdiv', 'Delta Ptot', 'Delta nbar',
+                     'Signal 1 Ptot', 'Signal 2 Ptot', 'Signal 1 Tdiv',
+                     'Signal 2 Tdiv', 'Signal 1 nbar', 'Signal 2 nbar',
+                     'Signal 1 N', 'Signal 2 N', 'Signal 1 Ne', 'Signal 2 Ne',
+                     'Signal 1 D', 'Signal 2 D']
+
+def get_phase_parameters(data):
+    """
+    Rows <data> of a phase and the parameters of the phase, taken from the
+    first row. Missing parameters are NaN.
+    """
+    get_value = (lambda x: data[x].iloc[0]
+                 if not missing(data[x]) else np.nan)
+    params = {'scenario': get_value('scenario')}
+    for label in ('Tdiv', 'Ptot', 'nbar', 'Ne_tot', 'N_tot', 'D_tot'):
+        params[label] = float(get_value(label))
+    return data, params
+
 def parse_file_name(f):
     """
     Extract shot phase (shot number, start, and end time) from a filename. The
@@ -131,22 +195,8 @@ def fmt_phase(phase):
     """
     return "{} ({:.2f}-{:.2f})".format(*phase)
 
-def already_assessed(df, sig1, sig2, method=None):
-    """
-    Check if the combination of the two given signals has alread be assessed
-    and saved in df. If <method> is given, this happens with respect to the
-    given method.
-    """
-    if 'Signal 1' not in df.columns:
-        logger.debug('Result df columns not initialized yet')
-        return
-    sig1 = fmt_phase(sig1)
-    sig2 = fmt_phase(sig2)
-    rows = df[(df['Signal 1'] == sig1) & (df['Signal 2'] == sig2)]
-    rows = rows.append(df[(df['Signal 1'] == sig2) & (df['Signal 2'] == sig1)])
-    if method:
-        rows = rows[rows[method] != np.nan]
-    return not rows.empty
+# Half width of the Sakoe-Chiba band of DTW in dumps and query mode
+DTW_WINDOW = 4
 
 class Measures():
     """
@@ -163,35 +213,8 @@ class Measures():
         return np.sqrt(np.mean(np.square(x)))
 
     @staticmethod
-    def DTW(A, B, window = sys.maxint, d = lambda x,y: abs(x-y)):
-        # create the cost matrix
-        A, B = np.array(A), np.array(B)
-        M, N = len(A), len(B)
-        cost = sys.maxint * np.ones((M, N))
-
-        # initialize the first row and column
-        cost[0, 0] = d(A[0], B[0])
-        for i in range(1, M):
-            cost[i, 0] = cost[i-1, 0] + d(A[i], B[0])
-
-        for j in range(1, N):
-            cost[0, j] = cost[0, j-1] + d(A[0], B[j])
-        # fill in the rest of the matrix
-        for i in range(1, M):
-            for j in range(max(1, i - window), min(N, i + window + 1)):
-                choices = cost[i - 1, j - 1], cost[i, j-1], cost[i-1, j]
-                cost[i, j] = min(choices) + d(A[i], B[j])
-
-        # find the optimal path
-        n, m = N - 1, M - 1
-        path = []
-
-        while (m, n) != (0, 0):
-            path.append((m, n))
-            m, n = min((m - 1, n), (m, n - 1), (m - 1, n - 1), key = lambda x: cost[x[0], x[1]])
-        
-        path.append((0,0))
-        return cost[-1, -1], path
+    def DTW(A, B, window=sys.maxint, d=dtw.distance, path=True):
+        return dtw.dtw(A, B, window, d, path)
 
 def missing(x):
     logger.debug("Checking if missing: {}".format(x))
@@ -209,22 +232,141 @@ def missing(x):
     logger.debug("empty: {}, isnan: {}".format(empty, isnan))
     return empty or isnan
 
+def get_coordinates(data, feature):
+    """
+    Coordinates [x, y] of <feature> in the first row of <data>, None if the
+    feature is missing.
+    """
+    x_label, y_label = coordinateLabels(feature)
+    if data.empty or x_label not in data.columns:
+        return None
+    xy = [data[x_label].iloc[0], data[y_label].iloc[0]]
+    if np.isnan(xy).all():
+        return None
+    return xy
+
+def feature_columns(df, features):
+    """ Coordinate columns of <features> that exist in <df> """
+    return [label for feature in features
+            for label in coordinateLabels(feature) if label in df.columns]
+
+def compare_parameters(phase, data, params, ophase, odata, oparams):
+    """
+    Result columns comparing the parameters of two phases, see
+    get_phase_parameters. Missing parameters are logged.
+    """
+    logData = False
+    for label, name in (('Tdiv', 'tdiv'), ('Ptot', 'ptot'), ('nbar', 'nbar')):
+        if np.isnan([params[label], oparams[label]]).any():
+            logger.info("delta {} unavailable: at least one value nan"
+                        .format(name))
+            logData = True
+    if logData:
+        logger.info("data {}:\n{}"
+                    .format(phase, data[['Ptot', 'Tdiv', 'nbar']]))
+        logger.info("odata {}:\n{}"
+                    .format(ophase, odata[['Ptot', 'Tdiv', 'nbar']]))
+    row = {}
+    for label in ('Tdiv', 'Ptot', 'nbar'):
+        row['Delta ' + label] = np.abs(params[label] - oparams[label])
+    for label, name in (('Ptot', 'Ptot'), ('Tdiv', 'Tdiv'), ('nbar', 'nbar'),
+                        ('N_tot', 'N'), ('Ne_tot', 'Ne'), ('D_tot', 'D')):
+        row['Signal 1 ' + name] = params[label]
+        row['Signal 2 ' + name] = oparams[label]
+    return row
+
+def log_progress():
+    """ Progress callback of computePairs logging every tenth of the pairs """
+    state = {'step': -1}
+    def log(done, total):
+        step = 10 * done // total if total else 10
+        if step > state['step']:
+            state['step'] = step
+            logger.info("{} of {} pairs done".format(done, total))
+    return log
+
+def compare_features(context, i, j):
+    """
+    Result row of the feature distance of the phases i and j of context, see
+    from_csv. None if the phases are not alike.
+    """
+    phase, data, params = context['phases'][i]
+    ophase, odata, oparams = context['phases'][j]
+    axis = context['axis']
+    penalty = context['penalty']
+
+    # Calculate distance for each feature
+    distances = []
+    for feature in context['features']:
+        logger.debug(feature)
+        xy1 = get_coordinates(data, feature)
+        xy2 = get_coordinates(odata, feature)
+        feature_axis = axis
+
+        # Handle missing features
+        if xy1 is None or xy2 is None:
+            if penalty == 'ignore':
+                continue
+            if penalty == 'likewise':
+                return None
+            if xy1 is None and xy2 is None:
+                # If both are missing, ignore the feature
+                continue
+            # relative not implemented. mean needed
+            xy1 = xy1 or [0., 0.]
+            xy2 = xy2 or [0., 0.]
+            feature_axis = 'y'
+
+        # Calculate distance of this feature
+        if feature_axis == 'x':
+            d = abs(xy1[0] - xy2[0])
+        elif feature_axis == 'y':
+            d = abs(xy1[1] - xy2[1])
+        elif feature_axis == 'xy':
+            d = sqrt(pow(xy1[0] - xy2[0], 2) + pow(xy1[1] - xy2[1], 2))
+        logger.debug("{}: {}".format(feature, d))
+        if np.isnan(d):
+            logger.error("{} - {}: {} distance is nan"
+                         .format(phase, ophase, feature))
+            logger.error("xy1: {}, xy2: {}"
+                         .format(xy1, xy2))
+        distances.append(d)
+
+    # Calculate overall distance
+    total_distance = context['distance'](distances)
+    logger.debug("total: {}".format(total_distance))
+    if np.isnan(total_distance):
+        logger.error("{} - {}: Total distance is nan. Distances: {}"
+                     .format(phase, ophase, distances))
+    row = compare_parameters(phase, data, params, ophase, odata, oparams)
+    row.update({'Quantity': context['quantity'],
+                'Signal 1': fmt_phase(phase),
+                'Scenario 1': params['scenario'],
+                'Signal 2': fmt_phase(ophase),
+                'Scenario 2': oparams['scenario'],
+                context['method']: total_distance})
+    return [row[column] for column in context['columns']]
+
 def from_csv(axis, probe, quantity, penalty, norm, sortby, selfcheck,
-             database, features=None, outfile=None):
+             database, features=None, outfile=None, processes=None,
+             checkpoint=None):
     """
     Determine distance by features with data from database
     """
-    df = pd.read_csv(database, delimiter=',')
+    df = FeatureDatabase.open(database).frame.reset_index()
+    df = df[df['Shot'].notnull()]
+    df['Shot'] = df['Shot'].astype(int)
     #with pd.option_context('mode.use_inf_as_null', True):
     #    df.dropna()
     #df = df[~df.isnull()]
-    result = pd.DataFrame()
     df_grouped = df.groupby(['Shot', 'CELMA start', 'CELMA end'])
     features = features or ['bump', 'detachStart', 'detachMax', 'detachEnd',
                             'HRpeak', 'HRend']
     quant = quantity
-    distance = getattr(Measures, method)
+    columns = feature_columns(df, features)
 
+    # Phases with data, each filtered once
+    phases = []
     for phase, df in df_grouped:
         shot, start, end = phase
         logger.debug("{} ({}-{}s)".format(shot, start, end))
@@ -235,144 +377,35 @@ def from_csv(axis, probe, quantity, penalty, norm, sortby, selfcheck,
             data = df[(df['quantity'] == quant) &
                       (df['probe'] == probe)]
         data = data.reset_index(drop=True)
-        if data[features].dropna(axis=0, how='all').empty:
+        if data[columns].dropna(axis=0, how='all').empty:
             logger.debug("{}, probe {}: no {} data"
                          .format(phase, probe, quant))
             continue
+        phases.append((phase,) + get_phase_parameters(data))
 
-        for ophase, odf in df_grouped:
-            oshot, ostart, oend = ophase
-            if ophase == phase:
-                continue
-            if not selfcheck and shot == oshot:
-                continue
-            if already_assessed(result, phase, ophase, method):
-                logger.debug("{} - {} already assessed".format(phase, method))
-                continue
-            logger.debug("{} ({}-{}s)".format(oshot, ostart, oend))
-            if probe == 'first':
-                odata = odf[(odf['quantity'] == quant) &
-                            (odf['probe'] == odf['sepProbe'])]
-            else:
-                odata = odf[(odf['quantity'] == quant) &
-                            (odf['probe'] == probe)]
-            odata = odata.reset_index(drop=True)
-
-            if odata[features].dropna(axis=0, how='all').empty:
-                logger.debug("{}, probe {}: no {} data"
-                              .format(ophase, probe, quant))
-                continue
-
-            # Calculate distance for each feature
-            alike = True
-            distances = []
-            for feature in features:
-                logger.debug(feature)
-                featdata = data[feature]
-                ofeatdata = odata[feature]
-
-                # Handle missing features
-                if missing(featdata) or missing(ofeatdata):
-                    if penalty == 'ignore':
-                        continue
-                    if penalty == 'likewise':
-                        alike = False
-                        break
-                elif missing(featdata) and not missing(ofeatdata):
-                    # relative not implemented. mean needed
-                    if penalty in ('absolute', 'relative'):
-                        featdata = pd.Series([0 | 0])
-                        axis = 'y'
-                elif not missing(featdata) and missing(ofeatdata):
-                    if penalty in ('absolute', 'relative'):
-                        ofeatdata = pd.Series([0 | 0])
-                        axis = 'y'
-                elif missing(featdata) and missing(ofeatdata):
-                    # If both are missing, ignore the feature
-                    continue
-                xy1 = [float(el) for el in featdata.iloc[0].split('|')]
-                xy2 = [float(el) for el in ofeatdata.iloc[0].split('|')]
-
-                # Calculate distance of this feature
-                if axis == 'x':
-                    d = abs(xy1[0] - xy2[0])
-                elif axis == 'y':
-                    d = abs(xy1[1] - xy2[1])
-                elif axis == 'xy':
-                    d = sqrt(pow(xy1[0] - xy2[0], 2) + pow(xy1[1] - xy2[1], 2))
-                logger.debug("{}: {}".format(feature, d))
-                if np.isnan(d):
-                    logger.error("{} - {}: {} distance is nan"
-                                 .format(phase, ophase, feature))
-                    logger.error("xy1: {}, xy2: {}"
-                                 .format(xy1, xy2))
-                distances.append(d)
-
-            if not alike:
-                continue
-
-            # Calculate overall distance
-            total_distance = distance(distances)
-            logger.debug("total: {}".format(total_distance))
-            get_value_one = (lambda x: data[x].iloc[0]
-                             if not missing(data[x]) else np.nan)
-            get_value_two = (lambda x: odata[x].iloc[0]
-                             if not missing(odata[x]) else np.nan)
-            scen1 = get_value_one('scenario')
-            scen2 = get_value_two('scenario')
-            tdiv1 = float(get_value_one('Tdiv'))
-            tdiv2 = float(get_value_two('Tdiv'))
-            ptot1 = float(get_value_one('Ptot'))
-            ptot2 = float(get_value_two('Ptot'))
-            nbar1 = float(get_value_one('nbar'))
-            nbar2 = float(get_value_two('nbar'))
-            netot1 = float(get_value_one('Ne_tot'))
-            netot2 = float(get_value_two('Ne_tot'))
-            ntot1 = float(get_value_one('N_tot'))
-            ntot2 = float(get_value_two('N_tot'))
-            dtot1 = float(get_value_one('D_tot'))
-            dtot2 = float(get_value_two('D_tot'))
-            logData = False
-            if np.isnan(total_distance):
-                logger.error("{} - {}: Total distance is nan. Distances: {}"
-                             .format(phase, ophase, distances))
-            if np.isnan([tdiv1, tdiv2]).any():
-                logger.info("delta tdiv unavailable: at least one value nan")
-                logData = True
-            if np.isnan([ptot1, ptot2]).any():
-                logger.info("delta ptot unavailable: at least one value nan")
-                logData = True
-            if np.isnan([nbar1, nbar2]).any():
-                logger.info("delta nbar unavailable: at least one value nan")
-                logData = True
-            if logData:
-                logger.info("data {}:\n{}"
-                            .format(phase, data[['Ptot', 'Tdiv', 'nbar']]))
-                logger.info("odata {}:\n{}"
-                            .format(ophase, odata[['Ptot', 'Tdiv', 'nbar']]))
-                logData = False
-            row = {'Quantity': quant,
-                   'Signal 1': fmt_phase(phase),
-                   'Scenario 1': scen1,
-                   'Signal 2': fmt_phase(ophase),
-                   'Scenario 2': scen2,
-                   'Delta Tdiv': np.abs(tdiv1 - tdiv2),
-                   'Delta Ptot': np.abs(ptot1 - ptot2),
-                   'Delta nbar': np.abs(nbar1 - nbar2),
-                   'Signal 1 Ptot': ptot1,
-                   'Signal 2 Ptot': ptot2,
-                   'Signal 1 Tdiv': tdiv1,
-                   'Signal 2 Tdiv': tdiv2,
-                   'Signal 1 nbar': nbar1,
-                   'Signal 2 nbar': nbar2,
-                   'Signal 1 N': ntot1,
-                   'Signal 2 N': ntot2,
-                   'Signal 1 Ne': netot1,
-                   'Signal 2 Ne': netot2,
-                   'Signal 1 D': dtot1,
-                   'Signal 2 D': dtot2,
-                   method: total_distance}
-            result = result.append(row, ignore_index=True)
+    pairs = [(i, j) for i, j in unorderedPairs(len(phases))
+             if selfcheck or phases[i][0][0] != phases[j][0][0]]
+    context = {'phases': phases, 'features': features, 'axis': axis,
+               'penalty': penalty, 'quantity': quant, 'method': method,
+               'distance': getattr(Measures, method),
+               'columns': sorted(PARAMETER_COLUMNS +
+                                 ['Quantity', 'Signal 1', 'Scenario 1',
+                                  'Signal 2', 'Scenario 2', method])}
+    logger.info("Comparing {} phases, {} pairs".format(len(phases),
+                                                       len(pairs)))
+    # Everything the rows depend on, a checkpoint of others is not resumed
+    parameters = {'mode': 'csv', 'method': method, 'axis': axis,
+                  'penalty': penalty, 'quantity': quant, 'probe': probe,
+                  'features': features, 'database': database}
+    try:
+        result = computePairs(compare_features, context, pairs,
+                              context['columns'],
+                              [fmt_phase(phase) for phase, _, _ in phases],
+                              processes, checkpoint=checkpoint,
+                              parameters=parameters, callback=log_progress())
+    except CheckpointMismatch, e:
+        logger.critical(e)
+        sys.exit()
     res = result[method].astype(float)
     # Fails with "cannot convert series to type float"
     #if norm == 'minmax':
@@ -383,128 +416,98 @@ def from_csv(axis, probe, quantity, penalty, norm, sortby, selfcheck,
     #    value = (round(100 - (res - res.mean()) /
     #             (res.max() - res.min()) * 100, 2))
     #    result['meannorm'] = value
+    for col in result.columns:
+        result[col] = pd.to_numeric(result[col], errors='ignore')
     if sortby == 'method':
         result = result.sort_values(method)
     else:
         result = result.sort_values(sortby)
-    for col in result.columns:
-        result[col] = pd.to_numeric(result[col], errors='ignore')
     if not outfile:
         outfile = 'similarity_features.csv'
     result.to_csv(outfile)
 
+def compare_dumps(context, i, j):
+    """
+    Result row of the distance of the curves of archives i and j of context,
+    see from_dump
+    """
+    A, sig1, data, params = context['archives'][i]
+    B, sig2, odata, oparams = context['archives'][j]
+    logger.debug('{} vs. {}:'.format(sig1, sig2))
+    try:
+        cost = context['distance'](A, B, window=DTW_WINDOW, path=False)
+    except:
+        cost = 'FAILED'
+    logger.debug('\tTotal Distance is {}'.format(cost))
+    row = compare_parameters(sig1[:-1], data, params, sig2[:-1], odata,
+                             oparams)
+    row.update({'Quantity': context['quantity'],
+                'Signal 1': fmt_phase(sig1),
+                'Signal 2': fmt_phase(sig2),
+                context['method']: cost})
+    return [row[column] for column in context['columns']]
+
 def from_dump(probe, quantity, method, sortby, selfcheck, directory, max_t,
-              outfile, database):
+              outfile, database, processes=None, checkpoint=None):
     """
     DTW with raw data
     """
     def parse_file_name(fname):
         parts = fname.split('/')[-1].split('_')
         return [parts[0], float(parts[4]), float(parts[5]), parts[2]]
-    df = pd.DataFrame(columns=['Quantity', 'Signal 1', 'Signal 2', 'DTW'])
     quant = quantity
-    distance = getattr(Measures, method)
-    files = [os.path.join(directory, f) for f in os.listdir(directory)]
-    if not len(files):
-        logger.critical("No files found!")
-    archives = [f for f in files if (os.path.isfile(f) and
-                                     f.endswith('.npz') and
-                                     quant in f)]
-    
-    param_df = pd.read_csv(database)
-    if not len(archives):
-        logger.critical("No archives found!")
+    archives = list_archives(directory, quant)
+
+    # Every archive is read and every phase looked up once
+    curves = load_curves(archives, probe, max_t)
+    db = FeatureDatabase.open(database)
+    phases = {}
+    items = []
     for f in archives:
-        logger.debug(f)
-        otherfiles = [_f for _f in archives if _f != f]
-        phase = parse_file_name(f)[:-1]
-        A = get_file_data(f, probe, max_t)
-        sig1 = parse_file_name(f)
-        this_shot = param_df['Shot'].astype(str) == str(phase[0])
-        this_start = param_df['CELMA start'].astype(str) == str(phase[1])
-        this_end = param_df['CELMA end'].astype(str) == str(phase[2])
-        data = param_df[this_shot & this_start & this_end]
-        for of in otherfiles:
-            logger.debug('\t{}'.format(of))
-            ophase = parse_file_name(of)[:-1]
-            this_shot = param_df['Shot'].astype(str) == str(ophase[0])
-            this_start = param_df['CELMA start'].astype(str) == str(ophase[1])
-            this_end = param_df['CELMA end'].astype(str) == str(ophase[2])
-            odata = param_df[this_shot & this_start & this_end]
-            B = get_file_data(of, probe, max_t)
-            if A is None or B is None:
-                logger.debug('Could not retreive {} data'.format(probe))
-                continue
-            else:
-                sig2 = parse_file_name(of)
-                logger.debug('{} vs. {}:'.format(sig1, sig2))
-
-                if not selfcheck and sig1[0] == sig2[0]:
-                    continue
-                if already_assessed(df, sig1, sig2, method):
-                    logger.debug("{} - {} already assessed"
-                                 .format(sig1, sig2))
-                    continue
-                try:
-                    cost, path = distance(A, B, window = 4)
-                except:
-                    cost = 'FAILED'
-                logger.debug('\tTotal Distance is {}'.format(cost))
-
-            get_value_one = (lambda x: data[x].iloc[0]
-                             if not missing(data[x]) else np.nan)
-            get_value_two = (lambda x: odata[x].iloc[0]
-                             if not missing(odata[x]) else np.nan)
-            scen1 = get_value_one('scenario')
-            scen2 = get_value_two('scenario')
-            tdiv1 = float(get_value_one('Tdiv'))
-            tdiv2 = float(get_value_two('Tdiv'))
-            ptot1 = float(get_value_one('Ptot'))
-            ptot2 = float(get_value_two('Ptot'))
-            nbar1 = float(get_value_one('nbar'))
-            nbar2 = float(get_value_two('nbar'))
-            netot1 = float(get_value_one('Ne_tot'))
-            netot2 = float(get_value_two('Ne_tot'))
-            ntot1 = float(get_value_one('N_tot'))
-            ntot2 = float(get_value_two('N_tot'))
-            dtot1 = float(get_value_one('D_tot'))
-            dtot2 = float(get_value_two('D_tot'))
-            logData = False
-            if np.isnan([tdiv1, tdiv2]).any():
-                logger.info("delta tdiv unavailable: at least one value nan")
-                logData = True
-            if np.isnan([ptot1, ptot2]).any():
-                logger.info("delta ptot unavailable: at least one value nan")
-                logData = True
-            if np.isnan([nbar1, nbar2]).any():
-                logger.info("delta nbar unavailable: at least one value nan")
-                logData = True
-            if logData:
-                logger.info("data {}:\n{}"
-                            .format(phase, data[['Ptot', 'Tdiv', 'nbar']]))
-                logger.info("odata {}:\n{}"
-                            .format(ophase, odata[['Ptot', 'Tdiv', 'nbar']]))
-                logData = False
-            row = {'Quantity': quant,
-                   'Signal 1': fmt_phase(sig1),
-                   'Signal 2': fmt_phase(sig2),
-                   'Delta Tdiv': np.abs(tdiv1 - tdiv2),
-                   'Delta Ptot': np.abs(ptot1 - ptot2),
-                   'Delta nbar': np.abs(nbar1 - nbar2),
-                   'Signal 1 Ptot': ptot1,
-                   'Signal 2 Ptot': ptot2,
-                   'Signal 1 Tdiv': tdiv1,
-                   'Signal 2 Tdiv': tdiv2,
-                   'Signal 1 nbar': nbar1,
-                   'Signal 2 nbar': nbar2,
-                   'Signal 1 N': ntot1,
-                   'Signal 2 N': ntot2,
-                   'Signal 1 Ne': netot1,
-                   'Signal 2 Ne': netot2,
-                   'Signal 1 D': dtot1,
-                   'Signal 2 D': dtot2,
-                   method: cost}
-            df = df.append(row, ignore_index=True)
+        sig = parse_file_name(f)
+        phase = tuple(sig[:-1])
+        if phase not in phases:
+            phases[phase] = get_phase_parameters(db.rows(*phase))
+        items.append((curves[f], sig) + phases[phase])
+
+    # Every pair of phases is compared once, in the order of the archives
+    pairs = []
+    assessed = set()
+    for i, j in unorderedPairs(len(items)):
+        (A, sig1), (B, sig2) = items[i][:2], items[j][:2]
+        if A is None or B is None:
+            logger.debug('Could not retreive {} data'.format(probe))
+            continue
+        if not selfcheck and sig1[0] == sig2[0]:
+            continue
+        key = tuple(sorted([fmt_phase(sig1), fmt_phase(sig2)]))
+        if key in assessed:
+            logger.debug("{} - {} already assessed".format(sig1, sig2))
+            continue
+        assessed.add(key)
+        pairs.append((i, j))
+
+    base = ['Quantity', 'Signal 1', 'Signal 2', 'DTW']
+    context = {'archives': items, 'quantity': quant, 'method': method,
+               'distance': getattr(Measures, method),
+               'columns': base + sorted(set(PARAMETER_COLUMNS + [method]) -
+                                        set(base))}
+    logger.info("Comparing {} archives, {} pairs".format(len(items),
+                                                         len(pairs)))
+    # Everything the rows depend on, a checkpoint of others is not resumed
+    parameters = {'mode': 'dumps', 'method': method, 'probe': probe,
+                  'quantity': quant, 'tmax': max_t, 'directory': directory,
+                  'database': database}
+    try:
+        df = computePairs(compare_dumps, context, pairs, context['columns'],
+                          [os.path.basename(f) for f in archives], processes,
+                          checkpoint=checkpoint, parameters=parameters,
+                          callback=log_progress())
+    except CheckpointMismatch, e:
+        logger.critical(e)
+        sys.exit()
+    for col in df.columns:
+        df[col] = pd.to_numeric(df[col], errors='ignore')
     df = df.sort_values(method)
     logger.debug("Result:")
     logger.debug(df)
@@ -522,6 +525,66 @@ def from_dump(probe, quantity, method, sortby, selfcheck, directory, max_t,
     #    plt.plot([x1, x2], [A[x1], B[x2] + offset])
     #plt.show()
 
+def query_dump(reference, k, probe, quantity, selfcheck, directory, max_t,
+               outfile, database):
+    """
+    The <k> phases nearest to the <reference> phase (shot, start, end) by
+    DTW of the raw data. Candidates are visited by increasing lower bound
+    of their distance (see dtw.dtwLowerBound) and DTW is skipped for all
+    candidates whose bound exceeds the distance of the k-th nearest phase
+    found so far.
+    """
+    quant = quantity
+    archives = list_archives(directory, quant)
+    curves = load_curves(archives, probe, max_t)
+    label = fmt_phase(reference)
+    signals = dict((fmt_phase(parse_file_name(f)), f) for f in archives
+                   if curves[f] is not None)
+    if label not in signals:
+        logger.critical("No {} data of {} found".format(probe, label))
+        sys.exit()
+    A = curves[signals.pop(label)]
+    candidates = [(name, curves[f]) for name, f in sorted(signals.items())
+                  if selfcheck or parse_file_name(f)[0] != reference[0]]
+
+    bounds = [dtw.dtwLowerBound(A, B, DTW_WINDOW) for _, B in candidates]
+    nearest = []
+    computed = 0
+    for bound, (name, B) in sorted(zip(bounds, candidates)):
+        if len(nearest) == k and bound > -nearest[0][0]:
+            break
+        cost = dtw.dtw(A, B, DTW_WINDOW, path=False)
+        computed += 1
+        logger.debug("{}: bound {}, distance {}".format(name, bound, cost))
+        if np.isnan(cost):
+            logger.warning("{} - {}: distance is nan".format(label, name))
+            continue
+        if len(nearest) < k:
+            heapq.heappush(nearest, (-cost, name))
+        elif cost < -nearest[0][0]:
+            heapq.heapreplace(nearest, (-cost, name))
+    logger.info("{} candidates, {} pruned by lower bound, {} DTW computed"
+                .format(len(candidates), len(candidates) - computed,
+                        computed))
+
+    db = FeatureDatabase.open(database)
+    data, params = get_phase_parameters(db.rows(*reference))
+    rows = []
+    for cost, name in sorted(nearest, reverse=True):
+        phase = parse_file_name(signals[name])
+        row = compare_parameters(reference, data, params, phase,
+                                 *get_phase_parameters(db.rows(*phase)))
+        row.update({'Quantity': quant, 'Signal 1': label, 'Signal 2': name,
+                    'DTW': -cost})
+        rows.append(row)
+    base = ['Quantity', 'Signal 1', 'Signal 2', 'DTW']
+    df = pd.DataFrame(rows, columns=base + sorted(PARAMETER_COLUMNS))
+    logger.info("Nearest phases:\n{}".format(df[base[2:]]))
+    if not outfile:
+        outfile = 'similarity_DTW_{}_{}_{:.2f}_{:.2f}.csv'.format(probe,
+                                                                 *reference)
+    df.to_csv(outfile)
+
 if __name__ == '__main__':
     if mode == 'csv':
         if not database:
@@ -529,11 +592,19 @@ if __name__ == '__main__':
                             "features from")
             sys.exit()
         from_csv(axis, probe, quant, penalty, norm, sortby, selfcheck,
-                 database, features, outfile)
+                 database, features, outfile, processes, checkpoint)
     elif mode == 'dumps':
         if not directory:
             logger.critical("You have to specify the directory to search " +
                             "for dumpfiles")
             sys.exit()
         from_dump(probe, quant, method, sortby, selfcheck, directory, max_t,
-                  outfile, database)
+                  outfile, database, processes, checkpoint)
+    elif mode == 'query':
+        if not directory or not args.reference:
+            logger.critical("You have to specify the directory to search " +
+                            "for dumpfiles and the reference phase")
+            sys.exit()
+        shot, start, end = args.reference
+        query_dump((shot, float(start), float(end)), k, probe, quant,
+                   selfcheck, directory, max_t, outfile, database)
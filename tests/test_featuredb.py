@@ -0,0 +1,98 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, '..', 'modules'))
+
+import numpy as np
+import pandas as pd
+
+from featuredb import FeatureDatabase, KEY, NUMBER, formatValue
+
+CSV = os.path.join(here, '..', 'data', 'csv', 'db30.csv')
+
+
+def formatted(table):
+    """ Rows of table as sorted tuples of formatted cells """
+    labels = sorted(table.columns)
+    return sorted(tuple(formatValue(cell) for cell in row)
+                  for row in table[labels].itertuples(index=False))
+
+
+class FeatureDatabaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'features.fdb')
+        self.table = FeatureDatabase.fromCsv(CSV).table()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def assertSameRows(self, a, b):
+        self.assertEqual(sorted(a.columns), sorted(b.columns))
+        self.assertEqual(formatted(a), formatted(b))
+
+    def test_journalOnly(self):
+        self.assertFalse(FeatureDatabase.exists(self.path))
+        db = FeatureDatabase(self.path)
+        self.assertEqual(db.upsert(self.table), len(self.table))
+        self.assertFalse(os.path.isfile(self.path))
+        self.assertTrue(FeatureDatabase.exists(self.path))
+        self.assertSameRows(FeatureDatabase.open(self.path).table(),
+                            self.table)
+
+    def test_saveReload(self):
+        db = FeatureDatabase(self.path)
+        db.upsert(self.table)
+        db.save()
+        self.assertTrue(os.path.isfile(self.path))
+        reloaded = FeatureDatabase.open(self.path)
+        self.assertSameRows(reloaded.table(), self.table)
+        self.assertEqual(reloaded.kinds, db.kinds)
+
+    def test_duplicateKeys(self):
+        keys = self.table[KEY].apply(tuple, axis=1)
+        self.assertTrue(keys.duplicated().any())
+        db = FeatureDatabase(self.path)
+        db.upsert(self.table)
+        db.save()
+        self.assertEqual(len(FeatureDatabase(self.path).table()),
+                         len(self.table))
+
+    def test_repeatedUpsert(self):
+        db = FeatureDatabase(self.path)
+        db.upsert(self.table)
+        self.assertEqual(db.upsert(self.table), 0)
+        self.assertEqual(len(db.table()), len(self.table))
+
+    def test_update(self):
+        db = FeatureDatabase(self.path)
+        db.upsert(self.table)
+        db.save()
+        label = [label for label in db.labels if db.kinds[label] == NUMBER][0]
+        row = self.table.iloc[[5]].copy()
+        row[label] = 12345.5
+        self.assertEqual(db.upsert(row), 1)
+
+        reloaded = FeatureDatabase(self.path)
+        table = reloaded.table()
+        self.assertEqual(len(table), len(self.table))
+        self.assertEqual(reloaded.kinds[label], NUMBER)
+        self.assertEqual((table[label] == 12345.5).sum(), 1)
+
+    def test_newColumn(self):
+        db = FeatureDatabase(self.path)
+        db.upsert(self.table)
+        row = self.table.iloc[[0]][KEY].copy()
+        row['comment'] = u'checked'
+        db.upsert(row)
+        table = FeatureDatabase(self.path).table()
+        self.assertEqual(list(table['comment'].dropna()), [u'checked'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import sys
+import shutil
+import pickle
+import tempfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, '..', 'modules'))
+
+import numpy as np
+from matplotlib import cm
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from shotdata import ShotLoader
+from mining import Miner
+
+SHOT = 33000
+# Configured color of ua2 as the GUI reads it, (0,102,153,255)/255
+PROBECOLORS = {'ua2': np.array([0., 0.4, 0.6, 1.])}
+
+
+def shotData():
+    """ Probe data of the plot quantities and ELM data of a shot """
+    time = np.arange(0.9, 1.6, 1e-4)
+    data = {}
+    for quantity, probes in (('te', ('ua1', 'ua2', 'ua3')),
+                             ('ne', ('ua1', 'ua2', 'ua3', 'ua4')),
+                             ('jsat', ('ua1', 'ua2', 'ua3'))):
+        data[quantity] = dict((probe, {'time': time,
+                                       'data': np.sin(time*1000 + i)})
+                              for i, probe in enumerate(probes))
+    onsets = np.arange(1.1, 1.4, 0.02)
+    data['elms'] = {'onsets': onsets, 'ends': onsets + 0.002,
+                    'maxima': onsets + 0.001,
+                    'ELMtoELM': np.append(np.diff(onsets), 0)}
+    return data
+
+
+def guiInfo(artists, data):
+    """
+    .info data of the temporal CELMA of artists as the GUI's 'Save raw'
+    writes it, the probes colored as by attributeColorsToProbes
+    """
+    probeNames = []
+    for quantity in ('te', 'ne', 'jsat'):
+        probeNames.extend([p for p in data[quantity] if p not in probeNames])
+    probeNames = list(set(probeNames))
+    colors = dict(zip(probeNames, cm.get_cmap('gist_rainbow')(
+                np.linspace(0, 1, len(probeNames)))))
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    axes = fig.add_subplot(111)
+    for probe in data['jsat']:
+        color = PROBECOLORS.get(probe, tuple(colors[probe])[:-1])
+        labels = sorted((label for label in artists
+                         if label.startswith(probe + ' ELM ')),
+                        key=lambda label: int(label.split()[2]))
+        for label in labels:
+            axes.scatter(artists[label][:, 0], artists[label][:, 1],
+                         color=color, alpha=0.4, linewidth=0, label=label)
+        axes.axvspan(artists['ELM duration'][0, 0], 0, color='grey',
+                     alpha=.3, label='ELM duration')
+        label = 'Linear regression {}'.format(probe)
+        axes.plot(artists[label][:, 0], artists[label][:, 1], color=color,
+                  lw=3, label=label)
+
+    plotTypes = {}
+    for line in axes.lines:
+        plotTypes[line.get_label()] = ('line', line.get_color())
+    for coll in axes.collections:
+        plotTypes[coll.get_label()] = ('collection', coll.get_facecolor())
+    for patch in axes.patches:
+        plotTypes[patch.get_label()] = ('patch', patch.get_facecolor())
+    return plotTypes
+
+
+class MinerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.data = shotData()
+        loader = ShotLoader(self.dir, useCache=True)
+        loader.shotnr = SHOT
+        # Data is read from the cache, without shotfiles
+        loader.cache[SHOT] = self.data
+        self.miner = Miner(loader, self.dir, quantities=('jsat',),
+                           probeColors=PROBECOLORS)
+        self.miner.shot = str(SHOT)
+        self.miner.elms = self.data['elms']
+        self.miner.data = {'jsat': self.data['jsat']}
+        self.miner.ignore = [1.12]
+        self.miner.colors = self.miner.attributeColors()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_probeColors(self):
+        colors = self.miner.colors
+        self.assertEqual(sorted(colors), ['ua1', 'ua2', 'ua3', 'ua4'])
+        self.assertTrue(colors['ua2'] is PROBECOLORS['ua2'])
+        self.assertEqual(len(colors['ua1']), 3)
+
+    def test_temporalInfo(self):
+        artists, info = self.miner.temporalArtists('jsat', 1.1, 1.3)
+        path = self.miner.save(
+                self.miner.fileName('temporal', 'jsat', 1.1, 1.3),
+                artists, info)
+        with open(os.path.splitext(path)[0] + '.info', 'rb') as f:
+            dump = f.read()
+        expected = pickle.dumps(guiInfo(artists, self.data),
+                                protocol=pickle.HIGHEST_PROTOCOL)
+        self.assertEqual(dump, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, '..', 'modules'))
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib import image
+
+from rendering import panelScene, buildFigure, artistSpec, renderFrames, \
+                      restoreFigure
+
+
+def pixels(fig):
+    """ RGBA array of fig drawn with Agg """
+    canvas = fig.canvas
+    canvas.draw()
+    width, height = canvas.get_width_height()
+    return np.frombuffer(canvas.buffer_rgba(),
+                         dtype=np.uint8).reshape(height, width, 4).copy()
+
+
+def temporalFigure():
+    """ Figure like a temporal CELMA plot, with its ELM duration span """
+    fig = Figure(figsize=(4, 3), dpi=50)
+    FigureCanvasAgg(fig)
+    axes = fig.add_subplot(111)
+    x = np.linspace(-0.002, 0.008, 50)
+    axes.plot(x, np.sin(x * 1000), color='r', label='Linear regression ua1')
+    axes.axvspan(0.002, 0, color='grey', alpha=.3, label='ELM duration')
+    axes.axvline(0.004, color='k', ls='--')
+    axes.text(0.05, 0.9, 'ua1', transform=axes.transAxes)
+    axes.set_xlabel('Time (s)')
+    axes.legend()
+    return fig
+
+
+class RenderingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_patchSpec(self):
+        fig = temporalFigure()
+        axes = fig.axes[0]
+        span, = axes.patches
+        method, args, kwargs = artistSpec(axes, span)
+        self.assertEqual(method, 'patch')
+        self.assertEqual(kwargs['coordinates'], 'xaxis')
+        self.assertEqual(kwargs['label'], 'ELM duration')
+
+    def test_sceneMatchesFigure(self):
+        fig = temporalFigure()
+        expected = pixels(fig)
+        scene = panelScene(fig, 'te_T_CELMA')
+        self.assertTrue(np.array_equal(pixels(buildFigure(scene)), expected))
+
+    def test_snapshotScene(self):
+        fig = temporalFigure()
+        expected = pixels(fig)
+        restored = restoreFigure(('scene', panelScene(fig, None)))
+        self.assertTrue(np.array_equal(pixels(restored), expected))
+
+    def test_renderFrames(self):
+        fig = temporalFigure()
+        axes = fig.axes[0]
+        scene = panelScene(fig, 'te_T_CELMA')
+        scatter = axes.scatter([0.001, 0.003], [0.5, -0.5], color='b')
+        frame = {'te_T_CELMA': [artistSpec(axes, scatter)]}
+        expected = os.path.join(self.dir, 'expected.png')
+        fig.savefig(expected, dpi=fig.dpi)
+        self.assertEqual(renderFrames([scene], [frame], self.dir, 1), 1)
+        rendered = os.path.join(self.dir, 'te_T_CELMA1.png')
+        self.assertTrue(np.array_equal(image.imread(rendered),
+                                       image.imread(expected)))
+
+
+if __name__ == '__main__':
+    unittest.main()